@@ -0,0 +1,296 @@
+"""
+PAD list 歷史索引：每張解析過的工作表都記進本機 SQLite，跨專案查詢不必再找舊檔重新解析
+- workbooks：內容雜湊 → 上傳檔名、第一次 / 最近一次看到的時間
+- sheets：(雜湊, 工作表) → project_code、chip size、extras（PadWindow / CUP）、有效 / 無效 pin 數
+- pins：有效 pin（pin_no、pin_name、x、y）；invalid_pins：無效列原文
+- 索引：project_code、(pin_no, pin_name)、(pin_name, pin_no)（大寫正規化後的欄位，查詢不分大小寫）
+- 查詢支援完全比對與字首比對（結尾加 *，例如 VDD*），一律分頁（page / page_size）
+- 寫入來源：網頁端每次存解析結果（main._save_sheet_result）、batch.py --archive 補建歷史檔
+- 同一份內容同一張表再次寫入時整筆取代（以最後一次解析為準）
+"""
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+from shared_state import file_lock
+
+
+ARCHIVE_ENABLED = os.getenv("ARCHIVE", "1") == "1"
+ARCHIVE_DB = os.getenv("ARCHIVE_DB", "")            # 空白 = uploads/padlist_archive.db
+PAGE_SIZE_DEFAULT = 50
+PAGE_SIZE_MAX = 500
+
+
+def default_db_path() -> str:
+    if ARCHIVE_DB:
+        return ARCHIVE_DB
+    upload_dir = os.getenv("UPLOAD_DIR") or os.path.join(os.path.dirname(os.path.abspath(__file__)), "uploads")
+    return os.path.join(upload_dir, "padlist_archive.db")
+
+
+def _key(text: Optional[str]) -> str:
+    """查詢用的正規化：去頭尾空白、轉大寫（pin_name 存進來時已去掉空白）。"""
+    return (text or "").strip().upper()
+
+
+def _match(column: str, pattern: str) -> Tuple[str, List[str]]:
+    """完全比對，或結尾 * 的字首比對（改寫成範圍條件，才吃得到索引）。"""
+    p = _key(pattern)
+    if p.endswith("*"):
+        prefix = p.rstrip("*")
+        if not prefix:
+            return "", []
+        upper = prefix[:-1] + chr(ord(prefix[-1]) + 1)
+        return f"{column} >= ? AND {column} < ?", [prefix, upper]
+    return f"{column} = ?", [p]
+
+
+def _page_args(page: int, page_size: int) -> Tuple[int, int]:
+    page = max(1, int(page or 1))
+    page_size = min(PAGE_SIZE_MAX, max(1, int(page_size or PAGE_SIZE_DEFAULT)))
+    return page, page_size
+
+
+class PadArchive:
+    def __init__(self, db_path: str):
+        self.db_path = db_path
+        self._local = threading.local()
+        os.makedirs(os.path.dirname(os.path.abspath(db_path)), exist_ok=True)
+        self._init_schema()
+
+    def _conn(self) -> sqlite3.Connection:
+        """每個執行緒各自一條連線（同 SharedState）。"""
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute("PRAGMA foreign_keys=ON")
+            conn.row_factory = sqlite3.Row
+            self._local.conn = conn
+        return conn
+
+    def _init_schema(self):
+        with file_lock(self.db_path + ".lock"):
+            self._conn().executescript("""
+                CREATE TABLE IF NOT EXISTS workbooks (
+                    digest     TEXT PRIMARY KEY,
+                    filename   TEXT,
+                    first_seen REAL NOT NULL,
+                    last_seen  REAL NOT NULL
+                );
+                CREATE TABLE IF NOT EXISTS sheets (
+                    id           INTEGER PRIMARY KEY,
+                    digest       TEXT NOT NULL,
+                    sheet        TEXT NOT NULL,
+                    project_code TEXT,
+                    project_key  TEXT,
+                    chip_w       REAL,
+                    chip_h       REAL,
+                    extras       TEXT,
+                    n_valid      INTEGER,
+                    n_invalid    INTEGER,
+                    updated      REAL NOT NULL,
+                    UNIQUE (digest, sheet)
+                );
+                CREATE INDEX IF NOT EXISTS sheets_project ON sheets (project_key);
+                CREATE TABLE IF NOT EXISTS pins (
+                    sheet_id INTEGER NOT NULL REFERENCES sheets (id) ON DELETE CASCADE,
+                    seq      INTEGER NOT NULL,
+                    pin_no   TEXT NOT NULL,
+                    pin_key  TEXT NOT NULL,
+                    pin_name TEXT,
+                    name_key TEXT,
+                    x        REAL,
+                    y        REAL
+                );
+                CREATE INDEX IF NOT EXISTS pins_sheet ON pins (sheet_id, seq);
+                CREATE INDEX IF NOT EXISTS pins_no_name ON pins (pin_key, name_key);
+                CREATE INDEX IF NOT EXISTS pins_name_no ON pins (name_key, pin_key);
+                CREATE TABLE IF NOT EXISTS invalid_pins (
+                    sheet_id INTEGER NOT NULL REFERENCES sheets (id) ON DELETE CASCADE,
+                    seq      INTEGER NOT NULL,
+                    text     TEXT
+                );
+                CREATE INDEX IF NOT EXISTS invalid_pins_sheet ON invalid_pins (sheet_id, seq);
+            """)
+
+    # --- 寫入 ---
+    def record_workbook(self, digest: str, filename: Optional[str] = None):
+        now = time.time()
+        self._conn().execute(
+            "INSERT INTO workbooks (digest, filename, first_seen, last_seen) VALUES (?, ?, ?, ?) "
+            "ON CONFLICT(digest) DO UPDATE SET last_seen = excluded.last_seen, "
+            "filename = COALESCE(excluded.filename, workbooks.filename)",
+            (digest, filename or None, now, now))
+
+    def _sheet_id(self, conn: sqlite3.Connection, digest: str, sheet: str) -> int:
+        conn.execute("INSERT INTO sheets (digest, sheet, updated) VALUES (?, ?, ?) "
+                     "ON CONFLICT(digest, sheet) DO UPDATE SET updated = excluded.updated",
+                     (digest, sheet, time.time()))
+        return conn.execute("SELECT id FROM sheets WHERE digest = ? AND sheet = ?", (digest, sheet)).fetchone()[0]
+
+    def save_info(self, digest: str, sheet: str, info: Dict[str, Any]):
+        """sheet_info 的結果：project_code、chip_size、extras。"""
+        chip = info.get("chip_size") or {}
+        conn = self._conn()
+        with conn:
+            conn.execute("BEGIN IMMEDIATE")
+            sid = self._sheet_id(conn, digest, sheet)
+            conn.execute("UPDATE sheets SET project_code = ?, project_key = ?, chip_w = ?, chip_h = ?, extras = ? "
+                         "WHERE id = ?",
+                         (info.get("project_code"), _key(info.get("project_code")) or None,
+                          chip.get("width"), chip.get("height"),
+                          json.dumps(info.get("extras") or {}, ensure_ascii=False), sid))
+
+    def save_pins(self, digest: str, sheet: str, valid_pins: List[Dict[str, Any]], invalid_pins: List[str]):
+        """parse_pins 的結果：整張表的 pin 先刪後寫（同一個 transaction）。"""
+        conn = self._conn()
+        with conn:
+            conn.execute("BEGIN IMMEDIATE")
+            sid = self._sheet_id(conn, digest, sheet)
+            conn.execute("DELETE FROM pins WHERE sheet_id = ?", (sid,))
+            conn.execute("DELETE FROM invalid_pins WHERE sheet_id = ?", (sid,))
+            conn.executemany(
+                "INSERT INTO pins (sheet_id, seq, pin_no, pin_key, pin_name, name_key, x, y) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                [(sid, i, str(p.get("pin_no")), _key(str(p.get("pin_no"))), p.get("pin_name"),
+                  _key(p.get("pin_name")), p.get("x"), p.get("y")) for i, p in enumerate(valid_pins)])
+            conn.executemany("INSERT INTO invalid_pins (sheet_id, seq, text) VALUES (?, ?, ?)",
+                             [(sid, i, t) for i, t in enumerate(invalid_pins)])
+            conn.execute("UPDATE sheets SET n_valid = ?, n_invalid = ? WHERE id = ?",
+                         (len(valid_pins), len(invalid_pins), sid))
+
+    def save_sheet(self, digest: str, sheet: str, info: Optional[Dict[str, Any]],
+                   pins: Optional[Tuple[List[Dict[str, Any]], List[str]]]):
+        if info is not None:
+            self.save_info(digest, sheet, info)
+        if pins is not None:
+            self.save_pins(digest, sheet, *pins)
+
+    # --- 查詢 ---
+    @staticmethod
+    def _sheet_row(r: sqlite3.Row) -> Dict[str, Any]:
+        return {
+            "sheet_id": r["id"],
+            "digest": r["digest"],
+            "filename": r["filename"],
+            "sheet": r["sheet"],
+            "project_code": r["project_code"],
+            "chip_size": {"width": r["chip_w"], "height": r["chip_h"]},
+            "extras": json.loads(r["extras"]) if r["extras"] else {},
+            "valid_count": r["n_valid"],
+            "invalid_count": r["n_invalid"],
+            "updated": r["updated"],
+            "last_seen": r["last_seen"],
+        }
+
+    def _paged(self, select: str, count_sql: str, where: List[str], params: List[Any],
+               order: str, page: int, page_size: int) -> Dict[str, Any]:
+        page, page_size = _page_args(page, page_size)
+        clause = (" WHERE " + " AND ".join(where)) if where else ""
+        conn = self._conn()
+        total = conn.execute(count_sql + clause, params).fetchone()[0]
+        rows = conn.execute(f"{select}{clause} ORDER BY {order} LIMIT ? OFFSET ?",
+                            params + [page_size, (page - 1) * page_size]).fetchall()
+        return {"total": total, "page": page, "page_size": page_size, "rows": rows}
+
+    def search_pins(self, pin_no: str = "", pin_name: str = "", project: str = "",
+                    page: int = 1, page_size: int = PAGE_SIZE_DEFAULT) -> Dict[str, Any]:
+        """例如「哪些專案把 VDDPST 放在 pin 92」：pin_no=92&pin_name=VDDPST。
+
+        條件只落在 pins 自己的欄位（project 轉成 sheet_id IN 子查詢），先在 pins 上用索引
+        分頁取 rowid，再 JOIN 這一頁；新寫入的在前。否則幾十萬筆命中時要先 JOIN 完再排序。
+        """
+        where, params = [], []
+        for column, value in (("pin_key", pin_no), ("name_key", pin_name)):
+            if value and value.strip():
+                cond, args = _match(column, value)
+                if cond:
+                    where.append(cond)
+                    params.extend(args)
+        if project and project.strip():
+            cond, args = _match("project_key", project)
+            if cond:
+                where.append(f"sheet_id IN (SELECT id FROM sheets WHERE {cond})")
+                params.extend(args)
+        if not where:
+            raise ValueError("至少需要 pin_no、pin_name 或 project 其中一個條件")
+        page, page_size = _page_args(page, page_size)
+        clause = " WHERE " + " AND ".join(where)
+        conn = self._conn()
+        total = conn.execute("SELECT COUNT(*) FROM pins" + clause, params).fetchone()[0]
+        rows = conn.execute(
+            "SELECT p.pin_no, p.pin_name, p.x, p.y, s.*, w.filename, w.last_seen "
+            "FROM pins p JOIN sheets s ON s.id = p.sheet_id LEFT JOIN workbooks w ON w.digest = s.digest "
+            f"WHERE p.rowid IN (SELECT rowid FROM pins{clause} ORDER BY rowid DESC LIMIT ? OFFSET ?) "
+            "ORDER BY p.rowid DESC",
+            params + [page_size, (page - 1) * page_size]).fetchall()
+        items = [{"pin_no": r["pin_no"], "pin_name": r["pin_name"], "x": r["x"], "y": r["y"],
+                  **self._sheet_row(r)} for r in rows]
+        return {"total": total, "page": page, "page_size": page_size, "items": items}
+
+    def search_sheets(self, project: str = "", filename: str = "",
+                      page: int = 1, page_size: int = PAGE_SIZE_DEFAULT) -> Dict[str, Any]:
+        """例如「專案 X 過去所有的 PAD list」：project=X（不給條件 = 全部，最近的在前）。"""
+        where, params = [], []
+        if project and project.strip():
+            cond, args = _match("s.project_key", project)
+            if cond:
+                where.append(cond)
+                params.extend(args)
+        if filename and filename.strip():
+            where.append("w.filename LIKE ?")
+            params.append(f"%{filename.strip()}%")
+        base = "FROM sheets s LEFT JOIN workbooks w ON w.digest = s.digest"
+        res = self._paged("SELECT s.*, w.filename, w.last_seen " + base, "SELECT COUNT(*) " + base,
+                          where, params, "s.updated DESC", page, page_size)
+        res["items"] = [self._sheet_row(r) for r in res.pop("rows")]
+        return res
+
+    def sheet_detail(self, sheet_id: int) -> Optional[Dict[str, Any]]:
+        """一張歷史工作表的完整內容（與 /parse_pins 同形的 valid_pins / invalid_pins）。"""
+        conn = self._conn()
+        r = conn.execute("SELECT s.*, w.filename, w.last_seen FROM sheets s "
+                         "LEFT JOIN workbooks w ON w.digest = s.digest WHERE s.id = ?", (sheet_id,)).fetchone()
+        if r is None:
+            return None
+        out = self._sheet_row(r)
+        out["valid_pins"] = [{"pin_no": p["pin_no"], "pin_name": p["pin_name"], "x": p["x"], "y": p["y"]}
+                             for p in conn.execute("SELECT pin_no, pin_name, x, y FROM pins "
+                                                   "WHERE sheet_id = ? ORDER BY seq", (sheet_id,))]
+        out["invalid_pins"] = [row[0] for row in conn.execute(
+            "SELECT text FROM invalid_pins WHERE sheet_id = ? ORDER BY seq", (sheet_id,))]
+        return out
+
+    def projects(self, prefix: str = "", page: int = 1, page_size: int = PAGE_SIZE_DEFAULT) -> Dict[str, Any]:
+        """專案代號清單（字首篩選），附工作表數與最近更新時間。"""
+        page, page_size = _page_args(page, page_size)
+        where, params = ["project_key IS NOT NULL"], []
+        if prefix and prefix.strip():
+            cond, args = _match("project_key", prefix.strip().rstrip("*") + "*")
+            if cond:
+                where.append(cond)
+                params.extend(args)
+        clause = " WHERE " + " AND ".join(where)
+        conn = self._conn()
+        total = conn.execute(f"SELECT COUNT(DISTINCT project_key) FROM sheets{clause}", params).fetchone()[0]
+        rows = conn.execute(
+            f"SELECT MAX(project_code) AS project_code, COUNT(*) AS sheets, MAX(updated) AS updated "
+            f"FROM sheets{clause} GROUP BY project_key ORDER BY project_key LIMIT ? OFFSET ?",
+            params + [page_size, (page - 1) * page_size]).fetchall()
+        return {"total": total, "page": page, "page_size": page_size,
+                "items": [dict(r) for r in rows]}
+
+    def stats(self) -> Dict[str, int]:
+        conn = self._conn()
+        return {name: conn.execute(f"SELECT COUNT(*) FROM {name}").fetchone()[0]
+                for name in ("workbooks", "sheets", "pins")}
+
+
+def open_archive(db_path: Optional[str] = None) -> PadArchive:
+    return PadArchive(db_path or default_db_path())
+
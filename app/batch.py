@@ -0,0 +1,322 @@
+"""
+批次（headless）檢查：一次處理整個資料夾的 PAD list workbook，不必逐一在瀏覽器點
+- 偵測邏輯與網頁端完全相同（padlist_core / rule_engine）
+- 多個 workbook 分散到 process pool 平行處理
+- 每個 workbook 輸出一份 JSON（完整結果）與 CSV（每個 pin 一列）報告
+- 可中斷後續跑：報告記錄來源檔的 size/mtime，沒變動且上次成功的就跳過
+- 進度列顯示吞吐量（workbook/s、pin/s）與預估剩餘時間
+- --archive：結果一併寫進 PAD list 歷史索引（與網頁端同一個 SQLite，可用來補建舊檔）
+- --engine：pin 解析引擎，預設 stream（read-only 串流，每個 workbook 只多開一份）；classic 與網頁端 classic 相同
+
+用法（在 app/ 目錄下）：
+  python batch.py /data/padlists -o /data/reports
+  python batch.py a.xlsx b.xlsx -o out --workers 4 --format json --images
+  python batch.py /data/padlists -o /data/reports --archive --no-resume   # 補建歷史索引
+"""
+import argparse
+import csv
+import hashlib
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from typing import Any, Dict, List, Optional
+
+from openpyxl import load_workbook
+
+from padlist_core import (
+    SheetTextIndex, index_sheet_images, build_sheet_image_map, safe_name,
+    detect_sheet_info, parse_pins_from_index, classic_pin_rows, parse_pins_readonly,
+)
+from rule_engine import RuleEngine
+from archive import PadArchive, default_db_path
+
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_RULES_FILE = os.path.join(BASE_DIR, "validation_rules.json")
+REPORT_VERSION = 1
+CSV_FIELDS = ["sheet", "status", "pin_no", "pin_name", "x", "y", "verdict", "color", "rule_id"]
+
+_RULES: Dict[str, RuleEngine] = {}  # 每個 worker 行程各自快取一份編譯好的規則
+_ARCHIVES: Dict[str, PadArchive] = {}  # 每個 worker 行程各自一份歷史索引連線
+
+
+# === 找檔 / 報告路徑 ===
+def find_workbooks(inputs: List[str]) -> List[str]:
+    """展開輸入（檔案或資料夾，資料夾會遞迴），略過 Excel 的 ~$ 鎖定檔。"""
+    found = []
+    for item in inputs:
+        if os.path.isdir(item):
+            for root, dirs, files in os.walk(item):
+                dirs.sort()
+                for fn in sorted(files):
+                    if fn.lower().endswith(".xlsx") and not fn.startswith("~$"):
+                        found.append(os.path.join(root, fn))
+        elif os.path.isfile(item):
+            found.append(item)
+    # 去重但保留順序
+    seen = set()
+    return [p for p in (os.path.abspath(f) for f in found) if not (p in seen or seen.add(p))]
+
+
+def report_stem(xlsx_path: str) -> str:
+    """報告檔名：檔名 + 完整路徑的短雜湊（不同資料夾的同名檔不會互蓋）。"""
+    stem = safe_name(os.path.splitext(os.path.basename(xlsx_path))[0])
+    return f"{stem}-{hashlib.sha1(xlsx_path.encode('utf-8')).hexdigest()[:8]}"
+
+
+def _source_stamp(xlsx_path: str) -> Dict[str, Any]:
+    st = os.stat(xlsx_path)
+    return {"path": xlsx_path, "size": st.st_size, "mtime_ns": st.st_mtime_ns}
+
+
+def is_done(xlsx_path: str, out_dir: str) -> bool:
+    """上次已成功產出報告、且來源檔沒變 → 可跳過。"""
+    path = os.path.join(out_dir, report_stem(xlsx_path) + ".json")
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            rep = json.load(f)
+    except Exception:
+        return False
+    return (rep.get("version") == REPORT_VERSION and rep.get("ok") is True
+            and rep.get("source") == _source_stamp(xlsx_path))
+
+
+def _write_atomic(path: str, write):
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, "w", encoding="utf-8", newline="") as f:
+        write(f)
+    os.replace(tmp, path)
+
+
+# === 單一 workbook（在 worker 行程執行） ===
+def _rules(rules_file: Optional[str]):
+    if not rules_file:
+        return None
+    eng = _RULES.get(rules_file)
+    if eng is None:
+        eng = _RULES[rules_file] = RuleEngine(rules_file)
+    return eng.get()
+
+
+def _file_sha256(path: str) -> str:
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def _archive_report(archive_db: str, xlsx_path: str, report: Dict[str, Any]):
+    """把成功解析的表寫進歷史索引（鍵與網頁端 store 相同：檔案內容 sha256）。"""
+    arch = _ARCHIVES.get(archive_db)
+    if arch is None:
+        arch = _ARCHIVES[archive_db] = PadArchive(archive_db)
+    digest = _file_sha256(xlsx_path)
+    arch.record_workbook(digest, os.path.basename(xlsx_path))
+    for entry in report["sheets"]:
+        if entry.get("error"):
+            continue
+        arch.save_sheet(digest, entry["sheet"],
+                        {k: entry.get(k) for k in ("project_code", "chip_size", "extras")},
+                        (entry.get("valid_pins") or [], entry.get("invalid_pins") or []))
+
+
+def process_workbook(xlsx_path: str, out_dir: str, rules_file: Optional[str] = None,
+                     formats=("json", "csv"), images: bool = False, all_sheets: bool = False,
+                     archive_db: Optional[str] = None, engine: str = "stream") -> Dict[str, Any]:
+    """偵測一個 workbook 並寫出報告；回傳摘要（給主行程統計用）。"""
+    t0 = time.perf_counter()
+    stem = report_stem(xlsx_path)
+    report: Dict[str, Any] = {
+        "version": REPORT_VERSION,
+        "source": _source_stamp(xlsx_path),
+        "ok": False,
+        "sheets": [],
+    }
+    n_valid = n_invalid = n_fail = 0
+    try:
+        rules = _rules(rules_file)
+        if rules is not None:
+            report["rules_version"] = rules.version
+
+        if images:
+            img_dir = os.path.join(out_dir, stem + "_images")
+            os.makedirs(img_dir, exist_ok=True)
+            ordered, name_to_file = build_sheet_image_map(xlsx_path, img_dir)
+        else:
+            ordered, name_to_media = index_sheet_images(xlsx_path)
+            name_to_file = {}
+
+        wb = load_workbook(xlsx_path, data_only=True)
+        ro_wb = load_workbook(xlsx_path, read_only=True, data_only=True) if engine == "stream" else None
+        try:
+            targets = list(wb.sheetnames) if all_sheets else ordered
+            report["all_sheets"] = list(wb.sheetnames)
+            for sheet_name in targets:
+                entry: Dict[str, Any] = {"sheet": sheet_name, "has_image": sheet_name in ordered}
+                if sheet_name in name_to_file:
+                    entry["image"] = os.path.relpath(name_to_file[sheet_name], out_dir)
+                try:
+                    ws = wb[sheet_name]
+                    idx = SheetTextIndex(ws)
+                    entry.update(detect_sheet_info(ws, idx))
+                    if not ws.max_row:
+                        valid, invalid = [], []
+                    elif ro_wb is not None:
+                        valid, invalid = parse_pins_readonly(ro_wb[sheet_name])
+                    else:
+                        valid, invalid = parse_pins_from_index(idx, classic_pin_rows)
+                    entry["valid_pins"] = valid
+                    entry["invalid_pins"] = invalid
+                    if rules is not None:
+                        entry["verdicts"] = rules.verdicts(valid)
+                        n_fail += sum(1 for v in entry["verdicts"] if v["verdict"] in ("fail", "forbidden"))
+                    n_valid += len(valid)
+                    n_invalid += len(invalid)
+                except Exception as e:
+                    entry["error"] = f"{type(e).__name__}: {e}"
+                report["sheets"].append(entry)
+        finally:
+            wb.close()
+            if ro_wb is not None:
+                ro_wb.close()
+        report["ok"] = True
+        if archive_db:
+            _archive_report(archive_db, xlsx_path, report)
+    except Exception as e:
+        report["error"] = f"{type(e).__name__}: {e}"
+
+    report["seconds"] = round(time.perf_counter() - t0, 4)
+    if "json" in formats:
+        _write_atomic(os.path.join(out_dir, stem + ".json"),
+                      lambda f: json.dump(report, f, ensure_ascii=False, indent=2))
+    if "csv" in formats and report["ok"]:
+        _write_atomic(os.path.join(out_dir, stem + ".csv"), lambda f: _write_csv(f, report))
+
+    return {
+        "path": xlsx_path,
+        "ok": report["ok"],
+        "error": report.get("error"),
+        "sheets": len(report["sheets"]),
+        "valid_pins": n_valid,
+        "invalid_pins": n_invalid,
+        "rule_failures": n_fail,
+        "seconds": report["seconds"],
+    }
+
+
+def _write_csv(f, report: Dict[str, Any]):
+    w = csv.DictWriter(f, fieldnames=CSV_FIELDS)
+    w.writeheader()
+    for sh in report["sheets"]:
+        verdicts = sh.get("verdicts") or [{}] * len(sh.get("valid_pins") or [])
+        for p, v in zip(sh.get("valid_pins") or [], verdicts):
+            w.writerow({"sheet": sh["sheet"], "status": "valid", "pin_no": p["pin_no"], "pin_name": p["pin_name"],
+                        "x": p["x"], "y": p["y"], "verdict": v.get("verdict") or "",
+                        "color": v.get("color") or "", "rule_id": v.get("rule_id") or ""})
+        for text in sh.get("invalid_pins") or []:
+            w.writerow({"sheet": sh["sheet"], "status": "invalid", "pin_name": text})
+        if sh.get("error"):
+            w.writerow({"sheet": sh["sheet"], "status": "error", "pin_name": sh["error"]})
+
+
+# === 主流程 ===
+def _progress(done: int, total: int, t0: float, pins: int, stream=sys.stderr):
+    el = max(time.perf_counter() - t0, 1e-9)
+    rate = done / el
+    eta = (total - done) / rate if rate > 0 else 0
+    stream.write(f"\r[{done}/{total}] {rate:.2f} wb/s, {pins / el:.0f} pins/s, "
+                 f"elapsed {el:.1f}s, eta {eta:.1f}s ")
+    stream.flush()
+
+
+def run(inputs: List[str], out_dir: str, workers: int = 0, rules_file: Optional[str] = DEFAULT_RULES_FILE,
+        formats=("json", "csv"), images: bool = False, all_sheets: bool = False,
+        resume: bool = True, quiet: bool = False, archive_db: Optional[str] = None,
+        engine: str = "stream") -> Dict[str, Any]:
+    os.makedirs(out_dir, exist_ok=True)
+    books = find_workbooks(inputs)
+    todo = [b for b in books if not (resume and is_done(b, out_dir))]
+    skipped = len(books) - len(todo)
+    if not quiet:
+        print(f"{len(books)} workbook(s), {skipped} already done, {len(todo)} to process", file=sys.stderr)
+
+    t0 = time.perf_counter()
+    results, pins = [], 0
+    workers = workers or (os.cpu_count() or 1)
+    args = (out_dir, rules_file, tuple(formats), images, all_sheets, archive_db, engine)
+    if workers == 1:
+        for b in todo:
+            results.append(process_workbook(b, *args))
+            pins += results[-1]["valid_pins"] + results[-1]["invalid_pins"]
+            if not quiet:
+                _progress(len(results), len(todo), t0, pins)
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            futs = {pool.submit(process_workbook, b, *args): b for b in todo}
+            for fut in as_completed(futs):
+                try:
+                    r = fut.result()
+                except Exception as e:  # worker 行程掛掉等意外
+                    r = {"path": futs[fut], "ok": False, "error": f"{type(e).__name__}: {e}",
+                         "sheets": 0, "valid_pins": 0, "invalid_pins": 0, "rule_failures": 0, "seconds": 0}
+                results.append(r)
+                pins += r["valid_pins"] + r["invalid_pins"]
+                if not quiet:
+                    _progress(len(results), len(todo), t0, pins)
+
+    elapsed = time.perf_counter() - t0
+    failed = [r for r in results if not r["ok"]]
+    summary = {
+        "workbooks": len(books),
+        "processed": len(results),
+        "skipped": skipped,
+        "failed": len(failed),
+        "sheets": sum(r["sheets"] for r in results),
+        "valid_pins": sum(r["valid_pins"] for r in results),
+        "invalid_pins": sum(r["invalid_pins"] for r in results),
+        "rule_failures": sum(r["rule_failures"] for r in results),
+        "elapsed_seconds": round(elapsed, 3),
+        "workbooks_per_second": round(len(results) / elapsed, 3) if elapsed > 0 else None,
+        "pins_per_second": round(pins / elapsed, 1) if elapsed > 0 else None,
+        "workers": workers,
+        "errors": [{"path": r["path"], "error": r["error"]} for r in failed],
+    }
+    _write_atomic(os.path.join(out_dir, "_summary.json"),
+                  lambda f: json.dump(summary, f, ensure_ascii=False, indent=2))
+    if not quiet:
+        print(file=sys.stderr)
+        print(f"done: {summary['processed']} processed ({summary['failed']} failed), "
+              f"{summary['skipped']} skipped, {summary['workbooks_per_second']} wb/s, "
+              f"{summary['pins_per_second']} pins/s", file=sys.stderr)
+    return summary
+
+
+def main(argv=None) -> int:
+    ap = argparse.ArgumentParser(description="批次檢查 PAD list workbook，輸出 JSON/CSV 報告")
+    ap.add_argument("inputs", nargs="+", help="xlsx 檔或資料夾（遞迴）")
+    ap.add_argument("-o", "--out", required=True, help="報告輸出資料夾")
+    ap.add_argument("-w", "--workers", type=int, default=0, help="process 數（預設 = CPU 數；1 = 不開 pool）")
+    ap.add_argument("--rules", default=DEFAULT_RULES_FILE, help="validation_rules.json 路徑（給空字串則不判定）")
+    ap.add_argument("--format", default="json,csv", help="json、csv 或 json,csv")
+    ap.add_argument("--images", action="store_true", help="一併解出每張表的最大圖片")
+    ap.add_argument("--all-sheets", action="store_true", help="連沒有圖的工作表也檢查")
+    ap.add_argument("--no-resume", action="store_true", help="忽略既有報告，全部重跑")
+    ap.add_argument("--archive", nargs="?", const=default_db_path(), default=None, metavar="DB",
+                    help="一併寫進歷史索引（預設與網頁端相同：ARCHIVE_DB 或 uploads/padlist_archive.db）")
+    ap.add_argument("--engine", choices=("stream", "classic"), default="stream",
+                    help="pin 解析引擎（預設 stream；classic 與網頁端 classic 相同，用來比對）")
+    ap.add_argument("-q", "--quiet", action="store_true")
+    a = ap.parse_args(argv)
+
+    formats = tuple(x.strip() for x in a.format.split(",") if x.strip())
+    summary = run(a.inputs, a.out, workers=a.workers, rules_file=a.rules or None, formats=formats,
+                  images=a.images, all_sheets=a.all_sheets, resume=not a.no_resume, quiet=a.quiet,
+                  archive_db=a.archive, engine=a.engine)
+    return 1 if summary["failed"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
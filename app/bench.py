@@ -0,0 +1,351 @@
+"""
+效能基準（benchmark）：用 padgen.py 產生的合成 workbook，經 FastAPI TestClient 量測主要流程
+- 案例：
+  - build_sheet_image_map：直接呼叫 padlist_core（抽圖索引 + 解出每表最大圖，不經 HTTP）
+  - upload：/upload（每輪上傳內容不同的 workbook，都是冷路徑，不吃 store 去重）
+  - sheet_info_first / sheet_info：上傳後第一張表 / 其餘表
+  - parse_pins / parse_pins_repeat：第一次解析 / 同一張表再解析（走結果快取）
+  - paste_snapshot / paste_snapshot_render：上傳兩張圖貼入 / 伺服器端繪圖後貼入
+- 每個案例記錄 wall time（min / median / mean / p95）與吞吐量（MB/s、sheets/s、pins/s、exports/s）
+- 記憶體：另跑一輪開 tracemalloc，記每個案例的峰值配置量；cpu 池（子行程）裡的配置不在內，
+  要全算進來請用 CPU_WORKERS=0 跑。另記整個行程的 max RSS
+- 結果存 JSON；--baseline 比對時，中位數變慢超過 --threshold、或峰值配置超過 --mem-threshold
+  就標記為回歸，exit code 1（可接 CI）
+- 預設關掉背景預解析（PREPARSE=0）與暖機（WARMUP=0），避免它們跟量測搶資源；也關掉歷史索引（ARCHIVE=0），
+  合成的 pin 不會寫進正式的 padlist_archive.db
+- uploads 預設放在暫存目錄（UPLOAD_DIR），結束時整個刪掉；有指定 UPLOAD_DIR 時改成把跑出來的 session 標成過期
+
+用法（在 app/ 目錄下）：
+  python bench.py -o bench_base.json                              # 建 baseline
+  python bench.py -o bench_new.json --baseline bench_base.json    # 跑一次並比對
+  python bench.py --sheets 10 --pins 2000 --image 4000x3000 --repeat 5
+  python bench.py --compare bench_base.json bench_new.json         # 只比對兩份既有結果
+"""
+import argparse
+import io
+import json
+import os
+import platform
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime
+from typing import Any, Callable, Dict, List, Optional
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+os.environ.setdefault("PREPARSE", "0")
+os.environ.setdefault("WARMUP", "0")
+os.environ.setdefault("ARCHIVE", "0")
+
+from PIL import Image
+
+import padgen
+from padlist_core import build_sheet_image_map
+
+
+RESULT_VERSION = 1
+# 案例 → 吞吐量單位（依序輸出）
+CASES = {
+    "build_sheet_image_map": "MB/s",
+    "upload": "MB/s",
+    "sheet_info_first": "sheets/s",
+    "sheet_info": "sheets/s",
+    "parse_pins": "pins/s",
+    "parse_pins_repeat": "pins/s",
+    "paste_snapshot": "exports/s",
+    "paste_snapshot_render": "exports/s",
+}
+
+
+class Recorder:
+    """收集每個案例的耗時、工作量；memory 模式只記峰值配置量。"""
+
+    def __init__(self):
+        self.times: Dict[str, List[float]] = {}
+        self.units: Dict[str, float] = {}
+        self.peak_alloc: Dict[str, int] = {}
+        self.memory = False
+
+    def run(self, case: str, fn: Callable, units: Callable[[Any], float] = lambda r: 1):
+        if self.memory:
+            tracemalloc.reset_peak()
+            base = tracemalloc.get_traced_memory()[0]
+            result = fn()
+            peak = tracemalloc.get_traced_memory()[1] - base
+            self.peak_alloc[case] = max(self.peak_alloc.get(case, 0), peak)
+            return result
+        t0 = time.perf_counter()
+        result = fn()
+        dt = time.perf_counter() - t0
+        self.times.setdefault(case, []).append(dt)
+        self.units[case] = self.units.get(case, 0.0) + units(result)
+        return result
+
+    def summary(self) -> Dict[str, Dict[str, Any]]:
+        out = {}
+        for case, unit in CASES.items():
+            ts = sorted(self.times.get(case, []))
+            if not ts:
+                continue
+            total = sum(ts)
+            out[case] = {
+                "n": len(ts),
+                "min_s": round(ts[0], 6),
+                "median_s": round(statistics.median(ts), 6),
+                "mean_s": round(total / len(ts), 6),
+                "p95_s": round(ts[min(len(ts) - 1, int(round(0.95 * (len(ts) - 1))))], 6),
+                "total_s": round(total, 6),
+                "throughput": round(self.units[case] / total, 3) if total > 0 else None,
+                "unit": unit,
+                "peak_alloc_mb": round(self.peak_alloc[case] / 1e6, 3) if case in self.peak_alloc else None,
+            }
+        return out
+
+
+def _ok(resp, what: str):
+    if resp.status_code != 200:
+        raise RuntimeError(f"{what}: HTTP {resp.status_code} {resp.text[:200]}")
+    return resp
+
+
+def _pin_count(resp_json) -> int:
+    return len(resp_json.get("valid_pins") or [])
+
+
+def _png_bytes(size=(1560, 2040)) -> bytes:
+    buf = io.BytesIO()
+    Image.new("RGB", size, (250, 250, 250)).save(buf, "PNG")
+    return buf.getvalue()
+
+
+def run_iteration(client, rec: Recorder, xlsx_path: str, sessions: List[str], snap_png: bytes):
+    """一輪：抽圖索引 → 上傳 → 每張表 sheet_info / parse_pins → 第一張表匯出 Excel。"""
+    mb = os.path.getsize(xlsx_path) / 1e6
+
+    out_dir = tempfile.mkdtemp(prefix="bench_images_")
+    try:
+        rec.run("build_sheet_image_map", lambda: build_sheet_image_map(xlsx_path, out_dir), lambda r: mb)
+    finally:
+        shutil.rmtree(out_dir, ignore_errors=True)
+
+    with open(xlsx_path, "rb") as f:
+        body = f.read()
+    up = rec.run("upload", lambda: _ok(client.post(
+        "/upload", files={"file": (os.path.basename(xlsx_path), body)}), "upload").json(), lambda r: mb)
+    sid = up["session_id"]
+    sessions.append(sid)
+
+    infos = {}
+    for i, sheet in enumerate(up["sheets"]):
+        form = {"session_id": sid, "sheet_name": sheet}
+        infos[sheet] = rec.run("sheet_info_first" if i == 0 else "sheet_info",
+                               lambda: _ok(client.post("/sheet_info", data=form), "sheet_info").json())
+        rec.run("parse_pins", lambda: _ok(client.post("/parse_pins", data=form), "parse_pins").json(), _pin_count)
+        rec.run("parse_pins_repeat", lambda: _ok(client.post("/parse_pins", data=form), "parse_pins").json(),
+                _pin_count)
+
+    sheet = up["sheets"][0]
+    chip = infos[sheet].get("chip_size") or {}
+    form = {"session_id": sid, "sheet_name": sheet,
+            "chip_w": chip.get("width") or "", "chip_h": chip.get("height") or ""}
+    rec.run("paste_snapshot", lambda: _ok(client.post(
+        "/excel/paste_snapshot", data=form,
+        files={"img_left": ("l.png", snap_png), "img_right": ("r.png", snap_png)}), "paste_snapshot"))
+    rec.run("paste_snapshot_render", lambda: _ok(client.post(
+        "/excel/paste_snapshot", data=form), "paste_snapshot_render"))
+
+
+def _git_rev() -> Optional[str]:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__)), timeout=5).stdout.strip() or None
+    except Exception:
+        return None
+
+
+def _max_rss_mb() -> Optional[float]:
+    if resource is None:
+        return None
+    kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss      # Linux：KB；macOS：bytes
+    return round(kb / (1e6 if sys.platform == "darwin" else 1e3), 1)
+
+
+def run_bench(args) -> Dict[str, Any]:
+    # main 在 import 時讀 UPLOAD_DIR：沒指定就用暫存目錄（store、_state.db、session 都不留在 app/uploads）
+    tmp_uploads = None
+    if not os.getenv("UPLOAD_DIR"):
+        tmp_uploads = tempfile.mkdtemp(prefix="bench_uploads_")
+        os.environ["UPLOAD_DIR"] = tmp_uploads
+    from fastapi.testclient import TestClient
+    import executor
+    import main
+
+    params = {"sheets": args.sheets, "pins": args.pins, "header": args.header, "image": args.image,
+              "image_format": args.image_format, "repeat": args.repeat, "warmup": args.warmup, "seed": args.seed}
+    work_dir = tempfile.mkdtemp(prefix="bench_")
+    rec = Recorder()
+    sessions: List[str] = []
+    snap_png = _png_bytes()
+    try:
+        # 每輪一份內容不同的 workbook（seed 遞增）：warmup + repeat + 記憶體那一輪
+        total = args.warmup + args.repeat + (0 if args.no_memory else 1)
+        books = []
+        for i in range(total):
+            path = os.path.join(work_dir, f"bench_{i}.xlsx")
+            padgen.make_workbook(path, sheets=args.sheets, pins=args.pins, header=args.header,
+                                 image=padgen.parse_size(args.image), image_format=args.image_format,
+                                 seed=args.seed + i)
+            books.append(path)
+
+        with TestClient(main.app) as client:
+            for i, path in enumerate(books):
+                phase = "warmup" if i < args.warmup else ("memory" if i >= args.warmup + args.repeat else "timed")
+                if not args.quiet:
+                    print(f"[{i + 1}/{total}] {phase}", file=sys.stderr)
+                if phase == "warmup":
+                    run_iteration(client, Recorder(), path, sessions, snap_png)
+                elif phase == "memory":
+                    rec.memory = True
+                    tracemalloc.start()
+                    try:
+                        run_iteration(client, rec, path, sessions, snap_png)
+                    finally:
+                        tracemalloc.stop()
+                else:
+                    run_iteration(client, rec, path, sessions, snap_png)
+
+            for sid in sessions:
+                sess_dir = os.path.join(main.UPLOAD_DIR, sid)
+                if os.path.isdir(sess_dir) and not main.SESSIONS.is_expired(sess_dir):
+                    main.SESSIONS.expire(sess_dir)
+
+        return {
+            "version": RESULT_VERSION,
+            "created": datetime.now().isoformat(timespec="seconds"),
+            "params": params,
+            "env": {
+                "python": platform.python_version(),
+                "platform": platform.platform(),
+                "cpu_count": os.cpu_count(),
+                "io_workers": executor.IO_WORKERS,
+                "cpu_workers": executor.CPU_WORKERS,
+                "parse_pins_engine": main.PARSE_PINS_ENGINE,
+                "export_engine": main.EXPORT_ENGINE,
+                "git": _git_rev(),
+            },
+            "workbook_mb": round(os.path.getsize(books[-1]) / 1e6, 3),
+            "max_rss_mb": _max_rss_mb(),
+            "cases": rec.summary(),
+        }
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+        if tmp_uploads:
+            shutil.rmtree(tmp_uploads, ignore_errors=True)
+
+
+# === 比對 ===
+def compare(base: Dict[str, Any], new: Dict[str, Any], threshold: float = 0.15,
+            mem_threshold: float = 0.25, min_delta_ms: float = 2.0):
+    """回傳 (每個案例的比對列, 回歸案例清單)。差距小於 min_delta_ms 的不算（避免毫秒級案例的雜訊）。"""
+    rows, regressions = [], []
+    for case in CASES:
+        b, n = base.get("cases", {}).get(case), new.get("cases", {}).get(case)
+        if not b or not n:
+            continue
+        ratio = n["median_s"] / b["median_s"] if b["median_s"] else None
+        flags = []
+        if ratio is not None and ratio > 1 + threshold and (n["median_s"] - b["median_s"]) * 1000 >= min_delta_ms:
+            flags.append("SLOWER")
+        bm, nm = b.get("peak_alloc_mb"), n.get("peak_alloc_mb")
+        if bm and nm and nm > bm * (1 + mem_threshold) and nm - bm >= 1.0:
+            flags.append("MORE_MEMORY")
+        rows.append({"case": case, "base_median_s": b["median_s"], "new_median_s": n["median_s"],
+                     "ratio": round(ratio, 3) if ratio is not None else None,
+                     "base_peak_alloc_mb": bm, "new_peak_alloc_mb": nm, "flags": flags})
+        if flags:
+            regressions.append(case)
+    return rows, regressions
+
+
+def print_report(result: Dict[str, Any], stream=sys.stdout):
+    print(f"{'case':<24}{'n':>4}{'median ms':>12}{'p95 ms':>10}{'throughput':>16}{'peak MB':>10}", file=stream)
+    for case, c in result["cases"].items():
+        tp = f"{c['throughput']:g} {c['unit']}" if c["throughput"] is not None else "-"
+        mem = f"{c['peak_alloc_mb']:.1f}" if c.get("peak_alloc_mb") is not None else "-"
+        print(f"{case:<24}{c['n']:>4}{c['median_s'] * 1000:>12.1f}{c['p95_s'] * 1000:>10.1f}{tp:>16}{mem:>10}",
+              file=stream)
+    if result.get("max_rss_mb") is not None:
+        print(f"max RSS: {result['max_rss_mb']} MB", file=stream)
+
+
+def print_compare(rows, base: Dict[str, Any], new: Dict[str, Any], stream=sys.stdout):
+    if base.get("params") != new.get("params"):
+        print("warning: 兩份結果的參數不同，比對僅供參考", file=stream)
+        print(f"  base: {base.get('params')}\n  new:  {new.get('params')}", file=stream)
+    print(f"{'case':<24}{'base ms':>10}{'new ms':>10}{'ratio':>8}{'base MB':>10}{'new MB':>10}  flags", file=stream)
+    for r in rows:
+        ratio = f"{r['ratio']:.2f}" if r["ratio"] is not None else "-"
+        bm = f"{r['base_peak_alloc_mb']:.1f}" if r["base_peak_alloc_mb"] is not None else "-"
+        nm = f"{r['new_peak_alloc_mb']:.1f}" if r["new_peak_alloc_mb"] is not None else "-"
+        print(f"{r['case']:<24}{r['base_median_s'] * 1000:>10.1f}{r['new_median_s'] * 1000:>10.1f}{ratio:>8}"
+              f"{bm:>10}{nm:>10}  {','.join(r['flags'])}", file=stream)
+
+
+def _load(path: str) -> Dict[str, Any]:
+    with open(path, "r", encoding="utf-8") as f:
+        data = json.load(f)
+    if data.get("version") != RESULT_VERSION:
+        raise SystemExit(f"{path}: 結果格式版本 {data.get('version')} 不符（需要 {RESULT_VERSION}）")
+    return data
+
+
+def main(argv=None) -> int:
+    ap = argparse.ArgumentParser(description="PAD list webapp 效能基準（合成 workbook + TestClient）")
+    ap.add_argument("-o", "--out", help="結果 JSON 輸出路徑")
+    ap.add_argument("--baseline", help="跑完後與這份結果比對")
+    ap.add_argument("--compare", nargs=2, metavar=("BASE", "NEW"), help="只比對兩份既有結果，不跑")
+    ap.add_argument("--sheets", type=int, default=4, help="每份 workbook 的工作表數")
+    ap.add_argument("--pins", type=int, default=400, help="每張表的 pin 數")
+    ap.add_argument("--header", default="mixed", choices=("mixed",) + padgen.HEADER_LAYOUTS)
+    ap.add_argument("--image", default="1600x1200", help="晶片圖尺寸 WxH（0 = 不放圖）")
+    ap.add_argument("--image-format", default="png", choices=("png", "jpeg"))
+    ap.add_argument("--repeat", type=int, default=3, help="計時輪數")
+    ap.add_argument("--warmup", type=int, default=1, help="不計時的暖機輪數")
+    ap.add_argument("--seed", type=int, default=1)
+    ap.add_argument("--no-memory", action="store_true", help="不跑 tracemalloc 那一輪")
+    ap.add_argument("--threshold", type=float, default=0.15, help="中位數變慢超過這個比例算回歸")
+    ap.add_argument("--mem-threshold", type=float, default=0.25, help="峰值配置增加超過這個比例算回歸")
+    ap.add_argument("--min-delta-ms", type=float, default=2.0, help="差距小於此毫秒數不算回歸")
+    ap.add_argument("-q", "--quiet", action="store_true")
+    args = ap.parse_args(argv)
+
+    if args.compare:
+        base, new = _load(args.compare[0]), _load(args.compare[1])
+    else:
+        new = run_bench(args)
+        print_report(new)
+        if args.out:
+            with open(args.out, "w", encoding="utf-8") as f:
+                json.dump(new, f, ensure_ascii=False, indent=2)
+        if not args.baseline:
+            return 0
+        base = _load(args.baseline)
+
+    rows, regressions = compare(base, new, args.threshold, args.mem_threshold, args.min_delta_ms)
+    print_compare(rows, base, new)
+    if regressions:
+        print(f"regression: {', '.join(regressions)}", file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
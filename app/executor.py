@@ -0,0 +1,123 @@
+"""
+阻塞工作的執行層：把 openpyxl / zipfile / XML / Pillow 這類同步工作移出 asyncio event loop
+- io 池（thread pool）：讀寫檔、load_workbook、wb.save…（需要共用行程內快取的也放這裡）
+- cpu 池（process pool）：XML 解析、抽圖、影像解碼這類吃 CPU、又能獨立序列化的工作
+- 每個池有「同時執行數」上限；整體另有「排隊深度」上限，爆量時直接回 503，而不是把 loop 卡住
+- io 池的工作帶著呼叫端的 contextvars 執行（請求的 Server-Timing / profile 紀錄才收得到）
+- cpu 池的子行程用 forkserver（沒有就 spawn）起：建池時 io 池的執行緒、sqlite 連線、檔案鎖都已經在了，
+  fork 會把別的執行緒正握著的鎖一起複製過去，子行程可能永遠卡住；丟進 cpu 池的函式要放在可 import 的模組裡，
+  直接執行的腳本（bench、TestClient 測試）要有 if __name__ == "__main__" 保護
+"""
+import asyncio
+import contextvars
+import functools
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Any, Callable, Optional
+
+from metrics import stage, run_with_profile
+
+
+# === 參數（可用環境變數覆寫） ===
+IO_WORKERS = int(os.getenv("IO_WORKERS", "4"))
+# 0 = 不開 process pool，CPU 工作也丟 thread pool（除錯、或機器只有 1 核時使用）
+CPU_WORKERS = int(os.getenv("CPU_WORKERS", str(min(2, os.cpu_count() or 1))))
+# 同時「執行中 + 排隊中」的工作上限；超過就拒絕
+MAX_PENDING_JOBS = int(os.getenv("MAX_PENDING_JOBS", "32"))
+# cpu 池子行程的啟動方式（不要用 fork，見模組說明）
+CPU_START_METHOD = os.getenv("CPU_START_METHOD") or (
+    "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn")
+
+
+class ServerBusy(Exception):
+    """排隊深度已滿。"""
+
+
+class StageExecutor:
+    def __init__(self, io_workers: int, cpu_workers: int, max_pending: int):
+        self.io_workers = max(1, io_workers)
+        self.cpu_workers = max(0, cpu_workers)
+        self.max_pending = max(1, max_pending)
+        self._io_pool: Optional[ThreadPoolExecutor] = None
+        self._cpu_pool: Optional[ProcessPoolExecutor] = None
+        self._io_sem: Optional[asyncio.Semaphore] = None
+        self._cpu_sem: Optional[asyncio.Semaphore] = None
+        self._pending = 0
+        self._lock = threading.Lock()
+
+    # --- pool 延遲建立（第一次用到才開） ---
+    def _io(self) -> ThreadPoolExecutor:
+        if self._io_pool is None:
+            self._io_pool = ThreadPoolExecutor(max_workers=self.io_workers, thread_name_prefix="io")
+            self._io_sem = asyncio.Semaphore(self.io_workers)
+        return self._io_pool
+
+    def _cpu(self):
+        if self.cpu_workers == 0:
+            return self._io()
+        if self._cpu_pool is None:
+            self._cpu_pool = ProcessPoolExecutor(max_workers=self.cpu_workers,
+                                                 mp_context=multiprocessing.get_context(CPU_START_METHOD))
+            self._cpu_sem = asyncio.Semaphore(self.cpu_workers)
+        return self._cpu_pool
+
+    def _acquire_slot(self):
+        with self._lock:
+            if self._pending >= self.max_pending:
+                raise ServerBusy()
+            self._pending += 1
+
+    def _release_slot(self):
+        with self._lock:
+            self._pending -= 1
+
+    async def _run(self, pool, sem: asyncio.Semaphore, fn: Callable, *args, **kwargs) -> Any:
+        self._acquire_slot()
+        try:
+            async with sem:
+                loop = asyncio.get_running_loop()
+                if isinstance(pool, ThreadPoolExecutor):
+                    # 同一行程：沿用呼叫端的 context（stage 計時、抽樣 profile）
+                    call = functools.partial(contextvars.copy_context().run, run_with_profile, fn, *args, **kwargs)
+                else:
+                    call = functools.partial(fn, *args, **kwargs)
+                return await loop.run_in_executor(pool, call)
+        finally:
+            self._release_slot()
+
+    async def run_io(self, fn: Callable, *args, **kwargs) -> Any:
+        pool = self._io()
+        return await self._run(pool, self._io_sem, fn, *args, **kwargs)
+
+    async def run_cpu(self, fn: Callable, *args, stage_name: Optional[str] = None, **kwargs) -> Any:
+        """
+        fn 與參數/回傳值必須可 pickle（模組層級函式）。
+        stage_name：子行程裡量不到，改在這裡量「含排隊與傳輸」的整段時間。
+        """
+        pool = self._cpu()
+        sem = self._cpu_sem if pool is self._cpu_pool else self._io_sem
+        if stage_name is None:
+            return await self._run(pool, sem, fn, *args, **kwargs)
+        with stage(stage_name):
+            return await self._run(pool, sem, fn, *args, **kwargs)
+
+    def stats(self):
+        return {
+            "pending": self._pending,
+            "max_pending": self.max_pending,
+            "io_workers": self.io_workers,
+            "cpu_workers": self.cpu_workers,
+        }
+
+    def shutdown(self):
+        if self._io_pool is not None:
+            self._io_pool.shutdown(wait=False, cancel_futures=True)
+            self._io_pool = None
+        if self._cpu_pool is not None:
+            self._cpu_pool.shutdown(wait=False, cancel_futures=True)
+            self._cpu_pool = None
+
+
+EXECUTOR = StageExecutor(IO_WORKERS, CPU_WORKERS, MAX_PENDING_JOBS)
@@ -0,0 +1,511 @@
+"""
+Pad 幾何引擎（伺服器端）：側邊分類、內/外圈 rails、連線交叉偵測
+- 判定規則與前端 getGeometricSide / computeRingRails / hasTwoRings / decideRing / segIntersect 一致
+- 交叉偵測不再兩兩比對（O(n²)）：連線依錨點所在的邊分組，組內依邊排序後，交叉的線就是
+  兩端上下順序顛倒的逆序對（merge sort 列出，O(n log n + k)）；組間用同一個順序二分搜尋，帶外的短尾段才做外框篩選。
+  候選對再用與前端 segIntersect 完全相同的精確判定確認，所以結果跟暴力法一模一樣
+- 有 NumPy 就向量化（側邊分類、候選對的 orient 判定整批算），沒有就用純 Python；NumPy 第一次要算時才 import
+
+隨機資料（含整數格點的退化情況）與暴力法的比對見 test_geometry.py。
+"""
+import math
+from bisect import bisect_left, bisect_right
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+np = None            # _numpy() 第一次呼叫時才載入（web 行程冷啟動不必等 NumPy）
+_NP_CHECKED = False
+
+
+def _numpy():
+    """回傳 numpy 模組；NumPy 不在時回 None（退回純 Python）。"""
+    global np, _NP_CHECKED
+    if not _NP_CHECKED:
+        try:
+            import numpy
+            np = numpy
+        except ImportError:
+            np = None
+        _NP_CHECKED = True
+    return np
+
+
+# === 與前端相同的常數 ===
+EPS = 0.0001          # 線段判定容差（app.js: EPS）
+GEO_EPS = 0.5         # 側邊分類容差（app.js: GEO_EPS）
+RING_Q_OUTER = 0.0
+RING_Q_INNER = 1.0
+SIDES = ("left", "right", "top", "bottom")
+
+Segment = Tuple[float, float, float, float]  # (x1, y1, x2, y2)
+
+
+# === 座標轉換 ===
+def chip_to_stage(x_um: float, y_um: float, chip_w: float, chip_h: float,
+                  min_point: Dict[str, float], max_point: Dict[str, float]) -> Dict[str, float]:
+    """chip 座標（um，左下為原點）→ 舞台座標（y 往下）；對應前端 chipToStage。"""
+    sel_w = abs(max_point["x"] - min_point["x"])
+    sel_h = abs(min_point["y"] - max_point["y"])
+    scale_x = sel_w / float(chip_w)
+    scale_y = sel_h / float(chip_h)
+    return {"x": min_point["x"] + x_um * scale_x, "y": min_point["y"] - y_um * scale_y}
+
+
+# === 側邊分類 ===
+def global_bounds(points: Sequence[Dict[str, float]]) -> Dict[str, float]:
+    return {
+        "minX": min(p["x"] for p in points), "maxX": max(p["x"] for p in points),
+        "minY": min(p["y"] for p in points), "maxY": max(p["y"] for p in points),
+    }
+
+
+def geometric_side(pt: Dict[str, float], bounds: Dict[str, float]) -> Optional[str]:
+    """距離最近的邊（平手時依 left → right → top → bottom 的順序）。"""
+    d = (abs(pt["x"] - bounds["minX"]), abs(bounds["maxX"] - pt["x"]),
+         abs(pt["y"] - bounds["minY"]), abs(bounds["maxY"] - pt["y"]))
+    min_d = min(d)
+    for side, dist in zip(SIDES, d):
+        if dist <= min_d + GEO_EPS:
+            return side
+    return None
+
+
+def geometric_sides(points: Sequence[Dict[str, float]], bounds: Dict[str, float]) -> List[Optional[str]]:
+    """一次分類所有點（有 NumPy 時向量化）。"""
+    if not points or _numpy() is None:
+        return [geometric_side(p, bounds) for p in points]
+    xs = np.fromiter((p["x"] for p in points), dtype=float, count=len(points))
+    ys = np.fromiter((p["y"] for p in points), dtype=float, count=len(points))
+    d = np.stack([np.abs(xs - bounds["minX"]), np.abs(bounds["maxX"] - xs),
+                  np.abs(ys - bounds["minY"]), np.abs(bounds["maxY"] - ys)])
+    ok = d <= d.min(axis=0) + GEO_EPS
+    first = ok.argmax(axis=0)       # 第一個符合的邊
+    has = ok.any(axis=0)
+    return [SIDES[k] if h else None for k, h in zip(first.tolist(), has.tolist())]
+
+
+# === 內/外圈 rails ===
+def _quantile(sorted_vals: List[float], q: float) -> Optional[float]:
+    if not sorted_vals:
+        return None
+    i = max(0, min(len(sorted_vals) - 1, math.floor((len(sorted_vals) - 1) * q + 0.5)))  # JS Math.round
+    return sorted_vals[i]
+
+
+def ring_rails(points: Sequence[Dict[str, float]], sides: Sequence[Optional[str]]) -> Optional[Dict[str, Dict[str, float]]]:
+    """四邊 rails：left/right 用 x，top/bottom 用 y；任一邊缺資料回 None（同前端 computeRingRails）。"""
+    acc = {s: [] for s in SIDES}
+    for pt, side in zip(points, sides):
+        if side:
+            acc[side].append(pt["x"] if side in ("left", "right") else pt["y"])
+    L, R, T, B = (sorted(acc[s]) for s in SIDES)
+    rails = {
+        "left": {"outer": _quantile(L, RING_Q_OUTER), "inner": _quantile(L, RING_Q_INNER)},
+        "right": {"outer": _quantile(R, 1 - RING_Q_OUTER), "inner": _quantile(R, RING_Q_OUTER)},
+        "top": {"outer": _quantile(T, RING_Q_OUTER), "inner": _quantile(T, RING_Q_INNER)},
+        "bottom": {"outer": _quantile(B, 1 - RING_Q_OUTER), "inner": _quantile(B, RING_Q_OUTER)},
+    }
+    # 前端是 !v.outer || !v.inner：0 也算缺資料
+    if any(not v["outer"] or not v["inner"] for v in rails.values()):
+        return None
+    return rails
+
+
+def has_two_rings(rails: Optional[Dict[str, Dict[str, float]]], line_width: float) -> bool:
+    if not rails:
+        return False
+    th = max(2.0, line_width)
+    strong = 0
+    for s in SIDES:
+        r = rails.get(s)
+        if not r or not math.isfinite(r["inner"]) or not math.isfinite(r["outer"]):
+            return False
+        if abs(r["inner"] - r["outer"]) >= th:
+            strong += 1
+    return strong >= 2
+
+
+def decide_ring(side: str, value: float, rails: Optional[Dict[str, Dict[str, float]]], line_width: float) -> str:
+    if not rails or side not in rails:
+        return "unknown"
+    r = rails[side]
+    th = max(2.0, line_width)
+    if not math.isfinite(r["inner"]) or not math.isfinite(r["outer"]) or abs(r["inner"] - r["outer"]) < th:
+        return "unknown"
+    mid = (r["inner"] + r["outer"]) / 2
+    if side in ("left", "top"):
+        return "inner" if value >= mid else "outer"
+    return "inner" if value <= mid else "outer"
+
+
+# === 線段交叉：精確判定（與 segIntersect 相同） ===
+def _orient(ax, ay, bx, by, cx, cy):
+    return (bx - ax) * (cy - ay) - (by - ay) * (cx - ax)
+
+
+def _on_seg(ax, ay, bx, by, cx, cy):
+    return (min(ax, bx) - EPS <= cx <= max(ax, bx) + EPS and
+            min(ay, by) - EPS <= cy <= max(ay, by) + EPS and
+            abs(_orient(ax, ay, bx, by, cx, cy)) <= EPS)
+
+
+def _pt_eq(ax, ay, bx, by):
+    return abs(ax - bx) <= EPS and abs(ay - by) <= EPS
+
+
+def seg_intersect(a: Segment, b: Segment) -> bool:
+    ax1, ay1, ax2, ay2 = a
+    bx1, by1, bx2, by2 = b
+    # 共用端點不算交叉
+    if (_pt_eq(ax1, ay1, bx1, by1) or _pt_eq(ax1, ay1, bx2, by2) or
+            _pt_eq(ax2, ay2, bx1, by1) or _pt_eq(ax2, ay2, bx2, by2)):
+        return False
+    o1 = _orient(ax1, ay1, ax2, ay2, bx1, by1)
+    o2 = _orient(ax1, ay1, ax2, ay2, bx2, by2)
+    o3 = _orient(bx1, by1, bx2, by2, ax1, ay1)
+    o4 = _orient(bx1, by1, bx2, by2, ax2, ay2)
+    if (((o1 > EPS and o2 < -EPS) or (o1 < -EPS and o2 > EPS)) and
+            ((o3 > EPS and o4 < -EPS) or (o3 < -EPS and o4 > EPS))):
+        return True
+    # 共線重疊也算交叉
+    if abs(o1) <= EPS and (_on_seg(ax1, ay1, ax2, ay2, bx1, by1) or _on_seg(ax1, ay1, ax2, ay2, bx2, by2)):
+        return True
+    if abs(o3) <= EPS and (_on_seg(bx1, by1, bx2, by2, ax1, ay1) or _on_seg(bx1, by1, bx2, by2, ax2, ay2)):
+        return True
+    return False
+
+
+def _seg_intersect_np(A, B):
+    """seg_intersect 的向量化版本：A、B 是 (m, 4) 陣列，逐列判定。"""
+    ax1, ay1, ax2, ay2 = A.T
+    bx1, by1, bx2, by2 = B.T
+
+    def orient(ax, ay, bx, by, cx, cy):
+        return (bx - ax) * (cy - ay) - (by - ay) * (cx - ax)
+
+    def pt_eq(ax, ay, bx, by):
+        return (np.abs(ax - bx) <= EPS) & (np.abs(ay - by) <= EPS)
+
+    def on_seg(ax, ay, bx, by, cx, cy, o):
+        return ((np.minimum(ax, bx) - EPS <= cx) & (cx <= np.maximum(ax, bx) + EPS) &
+                (np.minimum(ay, by) - EPS <= cy) & (cy <= np.maximum(ay, by) + EPS) &
+                (np.abs(o) <= EPS))
+
+    shared = (pt_eq(ax1, ay1, bx1, by1) | pt_eq(ax1, ay1, bx2, by2) |
+              pt_eq(ax2, ay2, bx1, by1) | pt_eq(ax2, ay2, bx2, by2))
+    o1 = orient(ax1, ay1, ax2, ay2, bx1, by1)
+    o2 = orient(ax1, ay1, ax2, ay2, bx2, by2)
+    o3 = orient(bx1, by1, bx2, by2, ax1, ay1)
+    o4 = orient(bx1, by1, bx2, by2, ax2, ay2)
+    general = ((((o1 > EPS) & (o2 < -EPS)) | ((o1 < -EPS) & (o2 > EPS))) &
+               (((o3 > EPS) & (o4 < -EPS)) | ((o3 < -EPS) & (o4 > EPS))))
+    col_a = (np.abs(o1) <= EPS) & (on_seg(ax1, ay1, ax2, ay2, bx1, by1, o1) |
+                                   on_seg(ax1, ay1, ax2, ay2, bx2, by2, o2))
+    col_b = (np.abs(o3) <= EPS) & (on_seg(bx1, by1, bx2, by2, ax1, ay1, o3) |
+                                   on_seg(bx1, by1, bx2, by2, ax2, ay2, o4))
+    return ~shared & (general | col_a | col_b)
+
+
+# === 線段交叉：候選對 ===
+# 標籤連線是「扇形」：同一邊的錨點排在同一條線上、pin 在另一側也依序排列，
+# 外框篩選（sweep-and-prune）對這種線幾乎全部重疊，仍是 O(n²)。改成：
+# - 依錨點所在的邊分組（fan_keys）；組內找出所有線都完整跨過的帶狀區間 [a, b]（左右邊沿 x、上下邊沿 y），
+#   帶內的線是單調函數，兩條線在帶內交叉 ⇔ 在 a、b 兩端的上下順序顛倒 → merge sort 列出逆序對，O(n log n + k)
+# - 帶外只剩兩端很短的尾段（錨點一端、pin 一端），尾段再做外框篩選
+# - 不同組之間（角落附近左邊與上邊的線）：帶內沒有逆序的線在帶內任何位置上下順序都相同，
+#   另一組的線截到帶內後在兩端各二分搜尋一次，夾在中間的才是候選；尾段與逆序的線仍做外框篩選
+# 候選對一律再用 seg_intersect 確認；容差都往寬處放，候選集合必定包含所有交叉對，結果與暴力法相同。
+FAN_MIN = 8           # 一組少於這個數量就直接做外框篩選
+
+
+def fan_keys(segs: Sequence[Segment]) -> List[Optional[str]]:
+    """依錨點（每條線的第二個端點）落在哪一邊分組；分組只影響速度，不影響結果。"""
+    if not segs:
+        return []
+    anchors = [{"x": s[2], "y": s[3]} for s in segs]
+    return geometric_sides(anchors, global_bounds(anchors))
+
+
+def _box(s: Segment) -> Tuple[float, float, float, float]:
+    return (min(s[0], s[2]), max(s[0], s[2]), min(s[1], s[3]), max(s[1], s[3]))
+
+
+def _box_pairs(items: Sequence[Tuple[int, Tuple[float, float, float, float]]], margin: float,
+               axis: int = 0) -> List[Tuple[int, int]]:
+    """items：[(id, (x0, x1, y0, y1))]；沿 axis（0 = x、1 = y）排序後掃描，回傳外框（含 margin）重疊的 id 對。"""
+    lo, hi, olo, ohi = (0, 1, 2, 3) if axis == 0 else (2, 3, 0, 1)
+    items = sorted(items, key=lambda t: t[1][lo])
+    starts = [b[lo] for _, b in items]
+    out = []
+    for p, (i, b) in enumerate(items):
+        for q in range(p + 1, bisect_right(starts, b[hi] + margin, lo=p + 1)):
+            j, c = items[q]
+            if c[olo] <= b[ohi] + margin and c[ohi] >= b[olo] - margin:
+                out.append((i, j) if i < j else (j, i))
+    return out
+
+
+def _box_pairs_between(A, B, margin: float, axis: int) -> List[Tuple[int, int]]:
+    """_box_pairs 的雙邊版：只列 A × B 的重疊對（不列組內的對）。"""
+    lo, hi, olo, ohi = (0, 1, 2, 3) if axis == 0 else (2, 3, 0, 1)
+    out = []
+    for X, Y, first in ((A, B, True), (B, A, False)):
+        Ys = sorted(Y, key=lambda t: t[1][lo])
+        starts = [b[lo] for _, b in Ys]
+        for i, b in X:
+            # 起點相同的對只在第一輪列出
+            start = bisect_left(starts, b[lo]) if first else bisect_right(starts, b[lo])
+            for q in range(start, bisect_right(starts, b[hi] + margin)):
+                j, c = Ys[q]
+                if c[olo] <= b[ohi] + margin and c[ohi] >= b[olo] - margin:
+                    out.append((i, j) if i < j else (j, i))
+    return out
+
+
+def _inversion_pairs(order: List[int], key: Dict[int, float], out: List[Tuple[int, int]]) -> List[int]:
+    """merge sort（依 key 排序 order）並把所有逆序對 (先, 後) 加進 out；回傳排好的 order。"""
+    if len(order) <= 1:
+        return order
+    mid = len(order) // 2
+    L = _inversion_pairs(order[:mid], key, out)
+    R = _inversion_pairs(order[mid:], key, out)
+    merged, i, j = [], 0, 0
+    while i < len(L) and j < len(R):
+        if key[R[j]] < key[L[i]]:
+            out.extend((t, R[j]) for t in L[i:])
+            merged.append(R[j]); j += 1
+        else:
+            merged.append(L[i]); i += 1
+    merged.extend(L[i:]); merged.extend(R[j:])
+    return merged
+
+
+def _near_pairs(ids: Sequence[int], key: Dict[int, float], tol: float) -> List[Tuple[int, int]]:
+    """key 值相差不超過 tol 的對（排序後雙指標）。"""
+    srt = sorted(ids, key=key.__getitem__)
+    out = []
+    for p, i in enumerate(srt):
+        q = p + 1
+        while q < len(srt) and key[srt[q]] - key[i] <= tol:
+            out.append((i, srt[q]))
+            q += 1
+    return out
+
+
+def _strip(segs: Sequence[Segment], ids: Sequence[int], axis: int):
+    """組內所有線都完整跨過的區間 [a, b]（沿 axis），與整組的範圍長度。"""
+    u = [(segs[i][axis], segs[i][axis + 2]) for i in ids]
+    a = max(min(p) for p in u)
+    b = min(max(p) for p in u)
+    extent = max(max(p) for p in u) - min(min(p) for p in u)
+    return a, b, extent
+
+
+def _at(s: Segment, axis: int, t: float) -> float:
+    """線段在 axis 座標 = t 處的另一個座標（呼叫端保證線段沿 axis 不是零長度）。"""
+    u1, v1, u2, v2 = (s[0], s[1], s[2], s[3]) if axis == 0 else (s[1], s[0], s[3], s[2])
+    return v1 + (v2 - v1) * (t - u1) / (u2 - u1)
+
+
+def _fan(segs: Sequence[Segment], ids: List[int]) -> Dict[str, Any]:
+    """
+    一組（同一邊的扇形連線）的索引：
+    - pairs：組內候選對 = 帶內逆序對 + 兩端點接近的對 + 尾段外框重疊的對
+    - clean：沒有參與逆序的線，依帶內上下順序排好（帶內任何位置順序都相同，給組間二分搜尋用）
+    - edge：尾段與參與逆序的線的外框（組間改用外框篩選）
+    找不到共同跨過的帶狀區間時 axis 為 None，組內與組間都退回外框篩選。
+    """
+    fan: Dict[str, Any] = {"ids": ids, "boxes": [(i, _box(segs[i])) for i in ids], "axis": None}
+    best = None
+    if len(ids) >= FAN_MIN:
+        for axis in (0, 1):
+            a, b, extent = _strip(segs, ids, axis)
+            if b - a > 4 * EPS and (best is None or (b - a) / extent > best[3]):
+                best = (axis, a, b, (b - a) / extent)
+    if best is None:
+        fan["pairs"] = _box_pairs(fan["boxes"], 2 * EPS)
+        return fan
+    axis, a, b, ratio = best
+    w = b - a
+    # 容差：EPS 的面積容差換成距離最多是 EPS / w；再加上浮點誤差
+    tol = 4 * EPS * (1 + 1 / w) + 1e-9 * (abs(a) + abs(b) + w / ratio)
+
+    va = {i: _at(segs[i], axis, a) for i in ids}
+    vb = {i: _at(segs[i], axis, b) for i in ids}
+    inv: List[Tuple[int, int]] = []
+    _inversion_pairs(sorted(ids, key=lambda i: (va[i], vb[i])), vb, inv)
+    pairs = inv + _near_pairs(ids, va, tol) + _near_pairs(ids, vb, tol)
+
+    # 帶外的尾段：[該線起點, a + tol] 與 [b - tol, 該線終點]
+    tails = []
+    for lo_t, hi_t in ((None, a + tol), (b - tol, None)):
+        part = []
+        for i in ids:
+            s = segs[i]
+            u0, u1 = sorted((s[axis], s[axis + 2]))
+            t0 = u0 if lo_t is None else max(u0, lo_t)
+            t1 = u1 if hi_t is None else min(u1, hi_t)
+            v0, v1 = _at(s, axis, t0), _at(s, axis, t1)
+            box = (t0, t1, min(v0, v1), max(v0, v1))
+            part.append((i, box if axis == 0 else box[2:] + box[:2]))
+        pairs += _box_pairs(part, tol, axis)
+        tails += part
+
+    irregular = {i for p in inv for i in p}
+    fan.update(axis=axis, a=a, b=b, tol=tol, ratio=ratio, pairs=pairs,
+               clean=[i for i in sorted(ids, key=lambda i: (va[i], vb[i])) if i not in irregular],
+               edge=tails + [(i, _box(segs[i])) for i in sorted(irregular)])
+    return fan
+
+
+def _cross_pairs(segs: Sequence[Segment], A: Dict[str, Any], B: Dict[str, Any]) -> List[Tuple[int, int]]:
+    """
+    A、B 兩組之間的候選對（A 必須有帶狀區間）：
+    B 的每條線截到 A 的帶內，在 A.clean 的兩端各二分搜尋一次，夾在中間（含容差）的才是候選，O(log n + 輸出)；
+    A 的尾段與參與逆序的線則和 B 做外框篩選。
+    """
+    axis, a, b, tol, clean = A["axis"], A["a"], A["b"], A["tol"], A["clean"]
+
+    def rank(x, v, side):
+        return side(clean, v, key=lambda i: _at(segs[i], axis, x))
+
+    out = []
+    for j in B["ids"]:
+        s = segs[j]
+        u1, v1, u2, v2 = (s[0], s[1], s[2], s[3]) if axis == 0 else (s[1], s[0], s[3], s[2])
+        if u1 > u2:
+            u1, v1, u2, v2 = u2, v2, u1, v1
+        x0, x1 = max(u1, a), min(u2, b)
+        if x0 > x1:
+            continue
+        if u1 == u2:
+            lo = rank(x0, min(v1, v2) - tol, bisect_left)
+            hi = rank(x0, max(v1, v2) + tol, bisect_right)
+        else:
+            w0 = v1 if x0 == u1 else _at(s, axis, x0)
+            w1 = v2 if x1 == u2 else _at(s, axis, x1)
+            lo = min(rank(x0, w0 - tol, bisect_left), rank(x1, w1 - tol, bisect_left))
+            hi = max(rank(x0, w0 + tol, bisect_right), rank(x1, w1 + tol, bisect_right))
+        out.extend((i, j) for i in clean[lo:hi])
+    if A["edge"]:
+        out += _box_pairs_between(A["edge"], B["boxes"], tol, _split_axis(A["edge"], B["boxes"]))
+    return out
+
+
+def _split_axis(A, B) -> int:
+    """兩組之間掃描的方向：兩組範圍重疊較少的那一軸。"""
+    def overlap(k):
+        a0 = min(b[k] for _, b in A); a1 = max(b[k + 1] for _, b in A)
+        b0 = min(b[k] for _, b in B); b1 = max(b[k + 1] for _, b in B)
+        span = max(a1 - a0, b1 - b0, EPS)
+        return max(0.0, min(a1, b1) - max(a0, b0)) / span
+    return 0 if overlap(0) <= overlap(2) else 1
+
+
+def _crossing_candidates(segs: Sequence[Segment], fans: Optional[Sequence[Any]] = None) -> List[Tuple[int, int]]:
+    """可能交叉的線段對 (i, j)，i < j；一定包含所有 seg_intersect 為真的對。"""
+    keys = fan_keys(segs) if fans is None else fans
+    groups: Dict[Any, List[int]] = {}
+    for i, k in enumerate(keys):
+        groups.setdefault(k, []).append(i)
+    index = [_fan(segs, ids) for ids in groups.values()]
+    found = [p for f in index for p in f["pairs"]]
+    for g in range(len(index)):
+        for h in range(g + 1, len(index)):
+            A, B = index[g], index[h]
+            if B["axis"] is not None and (A["axis"] is None or B["ratio"] > A["ratio"]):
+                A, B = B, A
+            if A["axis"] is not None:
+                found += _cross_pairs(segs, A, B)
+            else:
+                found += _box_pairs_between(A["boxes"], B["boxes"], 2 * EPS, _split_axis(A["boxes"], B["boxes"]))
+    return sorted({p if p[0] < p[1] else (p[1], p[0]) for p in found})
+
+
+def crossing_pairs(segs: Sequence[Segment], use_numpy: Optional[bool] = None,
+                   fans: Optional[Sequence[Any]] = None) -> List[Tuple[int, int]]:
+    """
+    回傳交叉的線段索引對 (i, j)，i < j、已排序；結果與兩兩暴力比對相同。
+    segs 的第二個端點視為錨點（標籤端）；fans 可指定分組（預設依錨點所在的邊）。
+    """
+    if len(segs) < 2:
+        return []
+    cands = _crossing_candidates(segs, fans)
+    if not cands:
+        return []
+    if use_numpy is None:
+        use_numpy = _numpy() is not None
+    if use_numpy and _numpy() is not None:
+        S = np.asarray(segs, dtype=float).reshape(-1, 4)
+        C = np.asarray(cands)
+        hit = _seg_intersect_np(S[C[:, 0]], S[C[:, 1]])
+        return [tuple(p) for p in C[hit].tolist()]
+    return [p for p in cands if seg_intersect(segs[p[0]], segs[p[1]])]
+
+
+def crossing_pairs_bruteforce(segs: Sequence[Segment]) -> List[Tuple[int, int]]:
+    """對照組：前端原本的兩兩比對。"""
+    return [(i, j) for i in range(len(segs)) for j in range(i + 1, len(segs))
+            if seg_intersect(segs[i], segs[j])]
+
+
+# === 整體分析（/geometry 端點） ===
+def analyze(pins: Sequence[Dict[str, Any]], chip_w: float, chip_h: float,
+            min_point: Optional[Dict[str, float]] = None, max_point: Optional[Dict[str, float]] = None,
+            anchors: Optional[Dict[str, Dict[str, float]]] = None,
+            line_width: float = 1.0, scope: str = "all") -> Dict[str, Any]:
+    """
+    pins：[{pin_no, x, y}]（chip 座標 um）；min_point/max_point：MIN(左下)/MAX(右上) 的舞台座標，
+    未給時以 1 um = 1 單位、左上為原點。anchors：{pin_no: {x, y}} 標籤內側錨點（舞台座標），
+    有給才會畫線並檢查交叉；分圈與交叉分組規則同 drawPinsAndLines / checkLineIntersections。
+    """
+    chip_w = float(chip_w); chip_h = float(chip_h)
+    if min_point is None or max_point is None:
+        min_point, max_point = {"x": 0.0, "y": chip_h}, {"x": chip_w, "y": 0.0}
+
+    points = [chip_to_stage(float(p["x"]), float(p["y"]), chip_w, chip_h, min_point, max_point) for p in pins]
+    bounds = global_bounds(points) if points else None
+    sides = geometric_sides(points, bounds) if bounds else [None] * len(points)
+    rails = ring_rails(points, sides) if points else None
+    two_rings = has_two_rings(rails, line_width)
+    if not two_rings:
+        scope = "all"  # 單圈時前端會鎖定「全部」
+
+    out_pins, segs, seg_rings, seg_pins = [], [], [], []
+    for p, pt, side in zip(pins, points, sides):
+        ring = "unknown"
+        if rails and side and two_rings:
+            ring = decide_ring(side, pt["x"] if side in ("left", "right") else pt["y"], rails, line_width)
+        out_pins.append({"pin_no": p.get("pin_no"), "x": pt["x"], "y": pt["y"], "side": side, "ring": ring})
+        anchor = (anchors or {}).get(str(p.get("pin_no")))
+        if anchor is not None and (scope == "all" or ring == scope):
+            segs.append((pt["x"], pt["y"], float(anchor["x"]), float(anchor["y"])))
+            seg_rings.append(ring)
+            seg_pins.append(p.get("pin_no"))
+
+    # 有 inner/outer 線 → 各圈分開檢查（unknown 不互檢）；否則全部一起檢查
+    if any(r in ("inner", "outer") for r in seg_rings):
+        groups = [[k for k, r in enumerate(seg_rings) if r == ring] for ring in ("inner", "outer")]
+    else:
+        groups = [list(range(len(segs)))]
+    crossings = []
+    for g in groups:
+        for i, j in crossing_pairs([segs[k] for k in g]):
+            crossings.append([seg_pins[g[i]], seg_pins[g[j]]])
+
+    conflict = []
+    seen = set()
+    for a, b in crossings:
+        for pn in (a, b):
+            if pn not in seen:
+                seen.add(pn)
+                conflict.append(pn)
+
+    return {
+        "pins": out_pins,
+        "bounds": bounds,
+        "rails": rails,
+        "two_rings": two_rings,
+        "scope": scope,
+        "crossings": crossings,
+        "conflict_pins": conflict,
+    }
@@ -0,0 +1,198 @@
+"""
+HTTP 快取與壓縮
+- file_response()：檔案回應帶 ETag（If-None-Match 命中回 304）；內容寫了就不會變的檔案（store 裡的工作表圖片）標 immutable
+- VersionedStaticFiles：/static 的檔案
+    · index.html 用 static_url() 產生「帶內容雜湊」的網址（?v=xxxx），這種網址一年 immutable；沒帶版本的網址每次重新驗證
+    · 文字類資源（js/css/svg…）依 Accept-Encoding 回 br / gzip；同一版本只壓一次，之後直接用記憶體裡壓好的
+- gzip_json_response()：較大的 JSON 回應壓縮後再送（給 middleware 用）；一律帶 Vary: Accept-Encoding，
+  壓縮後的 ETag 加上編碼後綴（與未壓縮版本不同，快取不會把 gzip 內容或 304 給錯用戶端）
+brotli 模組可選：有裝就優先回 br，沒裝就只有 gzip。
+"""
+import gzip
+import hashlib
+import os
+import threading
+from typing import Dict, Optional, Tuple
+from urllib.parse import parse_qs
+
+from starlette.datastructures import Headers
+from starlette.responses import FileResponse, Response
+from starlette.staticfiles import StaticFiles
+
+from json_cache import etag_matches
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+
+IMMUTABLE = "public, max-age=31536000, immutable"
+PRIVATE_IMMUTABLE = "private, max-age=31536000, immutable"
+REVALIDATE = "no-cache"
+COMPRESSIBLE_EXT = {".js", ".css", ".html", ".svg", ".json", ".txt", ".map", ".ico"}
+MIN_COMPRESS_BYTES = 1024
+
+
+def encoding_etag(etag: str, encoding: str) -> str:
+    """壓縮後的 ETag：'"abc"' → '"abc-gzip"'（保留 W/ 前綴）。"""
+    weak = etag.startswith("W/")
+    tag = etag[2:] if weak else etag
+    return ("W/" if weak else "") + tag.rstrip('"') + f'-{encoding}"'
+
+
+def add_vary(response: Response, field: str = "Accept-Encoding"):
+    vary = response.headers.get("vary", "")
+    if field.lower() not in [v.strip().lower() for v in vary.split(",")]:
+        response.headers["Vary"] = f"{vary}, {field}" if vary else field
+
+
+def file_etag(st: os.stat_result) -> str:
+    """與 Starlette FileResponse 相同的 ETag（mtime + size）。"""
+    return '"' + hashlib.md5(f"{st.st_mtime}-{st.st_size}".encode(), usedforsecurity=False).hexdigest() + '"'
+
+
+def file_response(request_headers: Headers, path: str, cache_control: str, **kwargs) -> Response:
+    """帶 ETag / Cache-Control 的檔案回應；If-None-Match 命中回 304（不讀檔）。"""
+    st = os.stat(path)
+    etag = file_etag(st)
+    headers = {"ETag": etag, "Cache-Control": cache_control}
+    if etag_matches(request_headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers=headers)
+    return FileResponse(path, headers=headers, stat_result=st, **kwargs)
+
+
+def _accepted_encodings(accept_encoding: Optional[str]) -> set:
+    """Accept-Encoding 裡接受的編碼（不處理 q 值細節，q=0 視為不接受）。"""
+    accepted = set()
+    for part in (accept_encoding or "").split(","):
+        name, _, params = part.strip().partition(";")
+        if params.replace(" ", "") in ("q=0", "q=0.0"):
+            continue
+        accepted.add(name.strip().lower())
+    return accepted
+
+
+def accepts_gzip(accept_encoding: Optional[str]) -> bool:
+    accepted = _accepted_encodings(accept_encoding)
+    return "gzip" in accepted or "*" in accepted
+
+
+def pick_encoding(accept_encoding: Optional[str]) -> Optional[str]:
+    """依 Accept-Encoding 選 br（有裝 brotli 時）或 gzip；都不接受回 None。"""
+    if brotli is not None and "br" in _accepted_encodings(accept_encoding):
+        return "br"
+    return "gzip" if accepts_gzip(accept_encoding) else None
+
+
+def compress(data: bytes, encoding: str) -> bytes:
+    if encoding == "br":
+        return brotli.compress(data, quality=11)
+    return gzip.compress(data, compresslevel=9, mtime=0)
+
+
+class VersionedStaticFiles(StaticFiles):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._lock = threading.Lock()
+        self._versions: Dict[str, Tuple[Tuple[int, int], str]] = {}           # path → (stamp, 雜湊)
+        self._compressed: Dict[Tuple[str, str], Tuple[Tuple[int, int], bytes]] = {}  # (path, 編碼) → (stamp, 內容)
+
+    def _stamp(self, full_path: str):
+        st = os.stat(full_path)
+        return (st.st_mtime_ns, st.st_size)
+
+    def version(self, path: str) -> str:
+        """檔案內容雜湊（前 10 碼）；檔案改了（開發時熱更新）會自動重算。"""
+        full_path = os.path.join(self.directory, path)
+        stamp = self._stamp(full_path)
+        with self._lock:
+            hit = self._versions.get(path)
+            if hit and hit[0] == stamp:
+                return hit[1]
+        with open(full_path, "rb") as f:
+            digest = hashlib.sha256(f.read()).hexdigest()[:10]
+        with self._lock:
+            self._versions[path] = (stamp, digest)
+        return digest
+
+    def url(self, path: str) -> str:
+        """給 Jinja 用：static_url('js/app.js') → /static/js/app.js?v=<內容雜湊>"""
+        try:
+            return f"/static/{path}?v={self.version(path)}"
+        except OSError:
+            return f"/static/{path}"
+
+    def _compressed_body(self, full_path: str, path: str, encoding: str, stamp) -> bytes:
+        key = (path, encoding)
+        with self._lock:
+            hit = self._compressed.get(key)
+            if hit and hit[0] == stamp:
+                return hit[1]
+        with open(full_path, "rb") as f:
+            body = compress(f.read(), encoding)
+        with self._lock:
+            self._compressed[key] = (stamp, body)
+        return body
+
+    def _versioned(self, path: str, scope) -> bool:
+        """網址帶的 ?v= 等於目前內容雜湊才算版本化網址（舊雜湊、?v=1 之類一律重新驗證）。"""
+        query = parse_qs(scope.get("query_string", b"").decode("latin-1"))
+        v = query.get("v")
+        if not v:
+            return False
+        try:
+            return v[-1] == self.version(path)
+        except OSError:
+            return False
+
+    async def get_response(self, path: str, scope) -> Response:
+        response = await super().get_response(path, scope)
+        if response.status_code not in (200, 304):
+            return response
+        cache_control = IMMUTABLE if self._versioned(path, scope) else REVALIDATE
+        response.headers["Cache-Control"] = cache_control
+        if response.status_code != 200 or not isinstance(response, FileResponse):
+            return response
+
+        full_path = response.path
+        stat = response.stat_result or os.stat(full_path)
+        if os.path.splitext(full_path)[1].lower() not in COMPRESSIBLE_EXT or stat.st_size < MIN_COMPRESS_BYTES:
+            return response
+        req_headers = Headers(scope=scope)
+        encoding = pick_encoding(req_headers.get("accept-encoding"))
+        if encoding is None:
+            response.headers["Vary"] = "Accept-Encoding"
+            return response
+
+        etag = encoding_etag(response.headers.get("etag", '""'), encoding)
+        headers = {
+            "ETag": etag,
+            "Cache-Control": cache_control,
+            "Content-Encoding": encoding,
+            "Vary": "Accept-Encoding",
+        }
+        if "last-modified" in response.headers:
+            headers["Last-Modified"] = response.headers["last-modified"]
+        if etag_matches(req_headers.get("if-none-match"), etag):
+            return Response(status_code=304, headers=headers)
+        body = self._compressed_body(full_path, path, encoding, (stat.st_mtime_ns, stat.st_size))
+        return Response(body, media_type=response.media_type, headers=headers)
+
+
+def gzip_json_response(response: Response, body: bytes, min_bytes: int) -> Response:
+    """把已讀出的 JSON 本體重新包成回應；夠大就 gzip 並把 ETag 換成 gzip 版本（其他 header 都保留）。"""
+    out = Response(content=body, status_code=response.status_code)
+    compress_it = len(body) >= min_bytes
+    raw = [(k, v) for k, v in response.raw_headers
+           if k not in (b"content-length", b"content-encoding") and not (compress_it and k == b"etag")]
+    if compress_it:
+        body = gzip.compress(body, compresslevel=5)
+        out.body = body
+        raw.append((b"content-encoding", b"gzip"))
+        if "etag" in response.headers:
+            raw.append((b"etag", encoding_etag(response.headers["etag"], "gzip").encode("latin-1")))
+    raw.append((b"content-length", str(len(body)).encode()))
+    out.raw_headers = raw
+    add_vary(out)
+    return out
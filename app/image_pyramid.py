@@ -0,0 +1,142 @@
+"""
+晶片圖的多解析度版本（影像金字塔）：抽出原圖後產生
+- preview：很小的預覽（先顯示，首次繪製不必等原圖）
+- screen：螢幕解析度（一般檢視、截圖都夠用）
+- tiles（選用）：原解析度切成固定大小的方塊，給需要深度放大的用戶端
+全部與原圖放在同一個目錄，檔名為「原圖檔名.<level>.<ext>」，另有「原圖檔名.pyramid.json」描述各層尺寸與 URL 檔名。
+原圖不大於某一層時，那一層就不產生（直接用原圖）。
+"""
+import json
+import os
+import re
+import uuid
+from typing import TYPE_CHECKING, Any, Dict, Optional
+
+if TYPE_CHECKING:
+    from PIL import Image   # Pillow 在實際產生金字塔時才 import（網頁冷啟動不必載入）
+
+
+# === 參數（可用環境變數覆寫） ===
+IMAGE_PYRAMID = os.getenv("IMAGE_PYRAMID", "1") == "1"
+IMAGE_FORMAT = os.getenv("IMAGE_FORMAT", "webp").lower()     # webp / jpeg
+IMAGE_QUALITY = int(os.getenv("IMAGE_QUALITY", "82"))
+IMAGE_PREVIEW_PX = int(os.getenv("IMAGE_PREVIEW_PX", "256"))  # 長邊像素
+IMAGE_SCREEN_PX = int(os.getenv("IMAGE_SCREEN_PX", "2048"))
+IMAGE_TILES = os.getenv("IMAGE_TILES", "0") == "1"
+IMAGE_TILE_PX = int(os.getenv("IMAGE_TILE_PX", "512"))
+
+MANIFEST_SUFFIX = ".pyramid.json"
+# 原圖檔名.preview.webp / 原圖檔名.screen.jpg / 原圖檔名.t3_1.webp
+_DERIVED_RE = re.compile(r"^(?P<base>.+)\.(?:preview|screen|t\d+_\d+)\.(?:webp|jpg)$")
+
+
+def _format():
+    """(Pillow 格式名, 副檔名)；環境不支援 WebP 時退回 JPEG。"""
+    from PIL import features
+    if IMAGE_FORMAT == "webp" and features.check("webp"):
+        return "WEBP", "webp"
+    return "JPEG", "jpg"
+
+
+def manifest_name(base_fname: str) -> str:
+    return base_fname + MANIFEST_SUFFIX
+
+
+def derived_base(fname: str) -> Optional[str]:
+    """金字塔衍生檔 → 原圖檔名；不是衍生檔回 None。"""
+    m = _DERIVED_RE.match(fname)
+    return m.group("base") if m else None
+
+
+def _save(im: "Image.Image", path: str, fmt: str):
+    from PIL import Image
+    if fmt == "JPEG" and im.mode not in ("RGB", "L"):
+        # JPEG 沒有透明：跟快照一樣鋪白底
+        bg = Image.new("RGB", im.size, (255, 255, 255))
+        rgba = im.convert("RGBA")
+        bg.paste(rgba, mask=rgba.split()[-1])
+        im = bg
+    elif fmt == "WEBP" and im.mode not in ("RGB", "RGBA"):
+        im = im.convert("RGBA" if "A" in im.getbands() or "transparency" in im.info else "RGB")
+    tmp_path = f"{path}.{uuid.uuid4().hex[:6]}.tmp"
+    if fmt == "WEBP":
+        im.save(tmp_path, fmt, quality=IMAGE_QUALITY, method=4)
+    else:
+        im.save(tmp_path, fmt, quality=IMAGE_QUALITY, optimize=True, progressive=True)
+    os.replace(tmp_path, path)
+
+
+def _scaled(im: "Image.Image", long_side: int) -> "Image.Image":
+    from PIL import Image
+    w, h = im.size
+    s = long_side / max(w, h)
+    return im.resize((max(1, round(w * s)), max(1, round(h * s))), Image.LANCZOS)
+
+
+def build_pyramid(src_path: str) -> Dict[str, Any]:
+    """
+    為 src_path 產生各層並寫出 manifest；回傳 manifest。
+    manifest：{"width", "height", "levels": [{"name", "file", "width", "height"}, ...（由小到大，最後是原圖）],
+              "tiles": {"size", "cols", "rows", "pattern"} 或 None}
+    """
+    from PIL import Image
+    out_dir, base = os.path.split(src_path)
+    fmt, ext = _format()
+    levels = []
+    with Image.open(src_path) as im:
+        im.load()
+        width, height = im.size
+        # 調色盤 / 1-bit 圖只能用 NEAREST 縮，先轉成全彩
+        if im.mode not in ("RGB", "RGBA", "L"):
+            im = im.convert("RGBA" if "A" in im.getbands() or "transparency" in im.info else "RGB")
+        # 由大到小縮，每層都從上一層縮（比每次都從原圖縮快很多）
+        cur = im
+        for name, px in (("screen", IMAGE_SCREEN_PX), ("preview", IMAGE_PREVIEW_PX)):
+            if max(cur.size) <= px:
+                continue
+            cur = _scaled(cur, px)
+            fname = f"{base}.{name}.{ext}"
+            _save(cur, os.path.join(out_dir, fname), fmt)
+            levels.append({"name": name, "file": fname, "width": cur.size[0], "height": cur.size[1]})
+        levels.reverse()
+        levels.append({"name": "full", "file": base, "width": width, "height": height})
+
+        tiles = None
+        if IMAGE_TILES and max(width, height) > IMAGE_SCREEN_PX:
+            size = IMAGE_TILE_PX
+            cols, rows = -(-width // size), -(-height // size)
+            for ty in range(rows):
+                for tx in range(cols):
+                    box = (tx * size, ty * size, min(width, (tx + 1) * size), min(height, (ty + 1) * size))
+                    _save(im.crop(box), os.path.join(out_dir, f"{base}.t{tx}_{ty}.{ext}"), fmt)
+            tiles = {"size": size, "cols": cols, "rows": rows, "pattern": f"{base}.t{{x}}_{{y}}.{ext}"}
+
+    manifest = {"width": width, "height": height, "levels": levels, "tiles": tiles}
+    path = os.path.join(out_dir, manifest_name(base))
+    tmp_path = f"{path}.{uuid.uuid4().hex[:6]}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, ensure_ascii=False)
+    os.replace(tmp_path, path)
+    return manifest
+
+
+def load_manifest(out_dir: str, base_fname: str) -> Optional[Dict[str, Any]]:
+    try:
+        with open(os.path.join(out_dir, manifest_name(base_fname)), "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def ensure_pyramid(src_path: str) -> Optional[Dict[str, Any]]:
+    """已有 manifest 就直接用，否則產生；停用或失敗回 None（前端退回只用原圖）。"""
+    if not IMAGE_PYRAMID:
+        return None
+    out_dir, base = os.path.split(src_path)
+    manifest = load_manifest(out_dir, base)
+    if manifest is not None:
+        return manifest
+    try:
+        return build_pyramid(src_path)
+    except Exception:
+        return None
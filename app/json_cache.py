@@ -0,0 +1,110 @@
+"""
+小型 JSON 檔（notices.json、validation_rules.json）的記憶體快取
+- 檔案 mtime/size 沒變就直接用記憶體裡的內容與序列化好的回應本體，不再開檔、不再 json.load
+- 每個版本都有強 ETag（回應本體的雜湊），前端帶 If-None-Match 就回 304
+- 寫入走 update()：檔案鎖內「讀 → 改 → 暫存檔 + fsync + os.replace」，寫完立即換上新版本（內容與 ETag 一起換）
+  多個 worker 同時儲存也不會互相蓋掉；其他 worker 靠 mtime/size 變動自動重讀
+"""
+import hashlib
+import json
+import os
+import threading
+import uuid
+from typing import Any, Callable, Optional
+
+from shared_state import file_lock
+
+
+class JsonSnapshot:
+    """某一版檔案內容（不可變）：raw 為檔案原始內容（不存在為 None），data 為實際回應的內容。"""
+    __slots__ = ("raw", "data", "body", "etag", "version")
+
+    def __init__(self, raw: Any, data: Any, file_bytes: Optional[bytes]):
+        self.raw = raw
+        self.data = data
+        # 與 JSONResponse 相同的序列化方式
+        self.body = json.dumps(data, ensure_ascii=False, allow_nan=False, indent=None,
+                               separators=(",", ":")).encode("utf-8")
+        self.etag = '"' + hashlib.sha1(self.body).hexdigest() + '"'
+        self.version = hashlib.sha1(file_bytes).hexdigest()[:16] if file_bytes is not None else ""
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """If-None-Match 是否命中（支援 *、多個值、W/ 前綴）。"""
+    if not if_none_match:
+        return False
+    for tag in if_none_match.split(","):
+        tag = tag.strip()
+        if tag == "*" or tag == etag or (tag.startswith("W/") and tag[2:] == etag):
+            return True
+    return False
+
+
+class JsonFileCache:
+    def __init__(self, path: str, transform: Optional[Callable[[Any], Any]] = None, indent: int = 2):
+        """transform(raw) → 回應內容；raw 在檔案不存在時為 None。"""
+        self.path = path
+        self.transform = transform or (lambda raw: raw)
+        self.indent = indent
+        self._stamp = None
+        self._snap: Optional[JsonSnapshot] = None
+        self._lock = threading.Lock()
+
+    def _current_stamp(self):
+        try:
+            st = os.stat(self.path)
+        except FileNotFoundError:
+            return None
+        return (st.st_mtime_ns, st.st_size)
+
+    def _read(self):
+        """回傳 (raw, 檔案 bytes)；檔案不存在為 (None, None)，JSON 壞掉丟例外。"""
+        try:
+            with open(self.path, "rb") as f:
+                file_bytes = f.read()
+        except FileNotFoundError:
+            return None, None
+        return json.loads(file_bytes.decode("utf-8")), file_bytes
+
+    def get(self) -> JsonSnapshot:
+        """最新版本；檔案壞掉（JSON 錯誤）時丟出例外，由呼叫端決定怎麼回應。"""
+        stamp = self._current_stamp()
+        with self._lock:
+            if self._snap is not None and stamp == self._stamp:
+                return self._snap
+            raw, file_bytes = self._read()
+            self._snap = JsonSnapshot(raw, self.transform(raw), file_bytes)
+            self._stamp = stamp
+            return self._snap
+
+    def update(self, mutate: Callable[[Any], Any]) -> JsonSnapshot:
+        """
+        以 mutate(目前檔案內容) 的回傳值覆寫檔案（檔案不存在或壞掉時傳入 None）。
+        原子寫入：唯一暫存檔名 → fsync → os.replace；同時有人讀也只會看到舊版或新版。
+        """
+        with self._lock, file_lock(self.path + ".lock"):
+            try:
+                raw, _ = self._read()
+            except ValueError:
+                raw = None
+            new_raw = mutate(raw)
+            file_bytes = json.dumps(new_raw, ensure_ascii=False, indent=self.indent).encode("utf-8")
+            tmp_path = f"{self.path}.{uuid.uuid4().hex[:8]}.tmp"
+            try:
+                with open(tmp_path, "wb") as f:
+                    f.write(file_bytes)
+                    f.flush()
+                    os.fsync(f.fileno())
+                os.replace(tmp_path, self.path)
+            except BaseException:
+                if os.path.exists(tmp_path):
+                    os.remove(tmp_path)
+                raise
+            self._snap = JsonSnapshot(new_raw, self.transform(new_raw), file_bytes)
+            self._stamp = self._current_stamp()
+            return self._snap
+
+    def invalidate(self):
+        with self._lock:
+            self._snap = None
+            self._stamp = None
@@ -0,0 +1,448 @@
+"""
+多人同時使用的壓測工具：N 個虛擬使用者照前端的操作順序打一個本機啟動的 app，統計各端點延遲
+- 每個虛擬使用者一條 keep-alive 連線（像瀏覽器），反覆跑一輪「開頁 → 上傳 → 看幾張表 → 匯出 Excel」：
+  - 開頁：GET /me、/notices、/api/rules（帶 If-None-Match，跟瀏覽器一樣可能拿到 304）
+  - 上傳：POST /upload（workbook 依 --mix 權重抽選）
+  - 看表（--flow frontend，預設，與目前 app.js 相同）：POST /sheet_load → GET 圖片 preview 層 → 升級到下一層
+    看表（--flow classic）：POST /sheet_info → GET 圖片 → POST /parse_pins
+  - 匯出：POST /excel/paste_snapshot（伺服器端繪圖）
+  - 每個動作之間停 --think 秒（±50% 隨機）
+- workbook 組合：padgen 的 small / medium / large 預設（每種產生 --variants 份不同內容），或用 --workbook 指定實際檔案
+- 報告：每個端點的 p50 / p95 / p99 / max、錯誤率（依狀態碼分類），整輪流程的耗時（不含思考時間）、req/s，
+  以及伺服器 event loop 延遲（壓測前後各抓一次 /metrics 的 padlist_event_loop_lag_seconds 相減）
+- --launch 會自己起一個 uvicorn（可指定 --workers），壓完關掉；否則打 --url 指定的既有服務
+  自己起的服務 uploads 放在暫存目錄（UPLOAD_DIR）、關掉歷史索引（ARCHIVE=0），壓完整個刪掉，不會動到正式資料
+- 多 worker 時 /metrics 只會抓到其中一個 worker，event loop 延遲是那個 worker 的數字
+
+用法（在 app/ 目錄下）：
+  python loadtest.py --launch --workers 4 --users 25 --duration 120 --think 2
+  python loadtest.py --url http://127.0.0.1:8000 --users 10 --mix small=3,large=1 -o load.json
+  python loadtest.py --url http://127.0.0.1:8000 --workbook real_a.xlsx=2 --workbook real_b.xlsx
+"""
+import argparse
+import gzip
+import http.client
+import json
+import math
+import os
+import random
+import re
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from typing import Any, Dict, List, Optional, Tuple
+from urllib.parse import quote, urlsplit
+
+import padgen
+
+
+# padgen 參數的預設組合（約略對應小型測試片 / 一般產品 / 大型 SoC）
+PROFILES = {
+    "small": {"sheets": 2, "pins": 150, "image": (1200, 900)},
+    "medium": {"sheets": 4, "pins": 600, "image": (2000, 1500)},
+    "large": {"sheets": 10, "pins": 2000, "image": (4000, 3000)},
+}
+LAG_METRIC = "padlist_event_loop_lag_seconds"
+
+
+# === HTTP（標準函式庫，不額外依賴） ===
+def _multipart(fields: Dict[str, Any], files: Dict[str, Tuple[str, bytes]]) -> Tuple[bytes, str]:
+    boundary = uuid.uuid4().hex
+    parts = []
+    for name, value in fields.items():
+        parts.append(f'--{boundary}\r\nContent-Disposition: form-data; name="{name}"\r\n\r\n{value}\r\n'.encode("utf-8"))
+    for name, (filename, data) in files.items():
+        parts.append(f'--{boundary}\r\nContent-Disposition: form-data; name="{name}"; filename="{filename}"\r\n'
+                     f'Content-Type: application/octet-stream\r\n\r\n'.encode("utf-8") + data + b"\r\n")
+    parts.append(f"--{boundary}--\r\n".encode("utf-8"))
+    return b"".join(parts), f"multipart/form-data; boundary={boundary}"
+
+
+class Client:
+    """一個虛擬使用者的連線；斷線自動重連。每個請求都記到 Stats。"""
+
+    def __init__(self, base_url: str, stats: "Stats", timeout: float):
+        u = urlsplit(base_url)
+        self.host, self.port = u.hostname, u.port or (443 if u.scheme == "https" else 80)
+        self.https = u.scheme == "https"
+        self.stats, self.timeout = stats, timeout
+        self.etags: Dict[str, str] = {}
+        self.conn: Optional[http.client.HTTPConnection] = None
+
+    def _connect(self):
+        cls = http.client.HTTPSConnection if self.https else http.client.HTTPConnection
+        self.conn = cls(self.host, self.port, timeout=self.timeout)
+
+    def close(self):
+        if self.conn:
+            self.conn.close()
+            self.conn = None
+
+    def request(self, label: str, method: str, path: str, fields=None, files=None,
+                revalidate: bool = False) -> Tuple[int, bytes]:
+        headers = {"Accept-Encoding": "gzip"}        # 跟瀏覽器一樣收壓縮過的 JSON（伺服器壓縮成本也算進來）
+        body = None
+        if fields is not None or files:
+            body, headers["Content-Type"] = _multipart(fields or {}, files or {})
+        if revalidate and path in self.etags:
+            headers["If-None-Match"] = self.etags[path]
+        t0 = time.perf_counter()
+        status, data = 0, b""
+        try:
+            if self.conn is None:
+                self._connect()
+            self.conn.request(method, path, body=body, headers=headers)
+            resp = self.conn.getresponse()
+            data = resp.read()
+            status = resp.status
+            if resp.getheader("Content-Encoding") == "gzip":
+                data = gzip.decompress(data)
+            if revalidate and resp.getheader("ETag"):
+                self.etags[path] = resp.getheader("ETag")
+        except (OSError, http.client.HTTPException):
+            self.close()
+        self.stats.record(label, status, time.perf_counter() - t0)
+        return status, data
+
+
+# === 統計 ===
+def _pct(sorted_vals: List[float], q: float) -> Optional[float]:
+    if not sorted_vals:
+        return None
+    return sorted_vals[min(len(sorted_vals) - 1, max(0, math.ceil(q * len(sorted_vals)) - 1))]   # nearest-rank
+
+
+class Stats:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.latency: Dict[str, List[float]] = {}
+        self.status: Dict[str, Dict[str, int]] = {}
+
+    def record(self, label: str, status, dt: float):
+        """status：HTTP 狀態碼；0 = 連線錯誤/逾時；字串直接當分類（例如整輪流程的 "failed"）。"""
+        key = status if isinstance(status, str) else (str(status) if status else "conn_error")
+        with self._lock:
+            self.latency.setdefault(label, []).append(dt)
+            counts = self.status.setdefault(label, {})
+            counts[key] = counts.get(key, 0) + 1
+
+    @staticmethod
+    def is_error(status_key: str) -> bool:
+        return not status_key.isdigit() or int(status_key) >= 400
+
+    def summary(self) -> Dict[str, Dict[str, Any]]:
+        out = {}
+        with self._lock:
+            items = sorted(self.latency.items())
+            status = {k: dict(v) for k, v in self.status.items()}
+        for label, vals in items:
+            vals = sorted(vals)
+            errors = sum(n for k, n in status[label].items() if self.is_error(k))
+            out[label] = {
+                "n": len(vals),
+                "errors": errors,
+                "error_rate": round(errors / len(vals), 4),
+                "status": status[label],
+                "p50_ms": round(_pct(vals, 0.50) * 1000, 1),
+                "p95_ms": round(_pct(vals, 0.95) * 1000, 1),
+                "p99_ms": round(_pct(vals, 0.99) * 1000, 1),
+                "max_ms": round(vals[-1] * 1000, 1),
+                "mean_ms": round(sum(vals) / len(vals) * 1000, 1),
+            }
+        return out
+
+
+# === 虛擬使用者 ===
+class VirtualUser(threading.Thread):
+    def __init__(self, uid: int, args, stats: Stats, books: List[Tuple[str, bytes]], weights: List[float],
+                 stop_at: float, start_delay: float):
+        super().__init__(name=f"vu-{uid}", daemon=True)
+        self.args, self.stats, self.books, self.weights = args, stats, books, weights
+        self.stop_at, self.start_delay = stop_at, start_delay
+        self.rnd = random.Random(args.seed * 1000 + uid)
+        self.client = Client(args.url, stats, args.timeout)
+
+    def think(self):
+        if self.args.think > 0:
+            time.sleep(self.args.think * self.rnd.uniform(0.5, 1.5))
+
+    def _json(self, label, method, path, **kw) -> Optional[Dict[str, Any]]:
+        status, data = self.client.request(label, method, path, **kw)
+        if status != 200:
+            return None
+        try:
+            return json.loads(data)
+        except ValueError:
+            return None
+
+    def _image(self, url: Optional[str]):
+        if url:
+            self.client.request("GET /uploads/{sid}/{fname}", "GET", quote(url, safe="/%?=&"))
+
+    def view_sheet(self, sid: str, sheet: str) -> Optional[Dict[str, Any]]:
+        form = {"session_id": sid, "sheet_name": sheet}
+        if self.args.flow == "frontend":
+            info = self._json("POST /sheet_load", "POST", "/sheet_load", fields=form)
+        else:
+            info = self._json("POST /sheet_info", "POST", "/sheet_info", fields=form)
+        if not info or info.get("error"):
+            return None
+        levels = (info.get("image_levels") or {}).get("levels") or []
+        if levels:
+            self._image(levels[0]["url"])                  # 先 preview
+            if len(levels) > 1:
+                self._image(levels[1]["url"])              # load 後升級一層
+        else:
+            self._image(info.get("image_url"))
+        if self.args.flow == "classic":
+            self.think()
+            self._json("POST /parse_pins", "POST", "/parse_pins", fields=form)
+        return info
+
+    def flow(self):
+        """一輪完整操作；回傳不含思考時間的耗時（秒），失敗回 None。"""
+        busy = 0.0
+
+        def timed(fn, *a, **kw):
+            nonlocal busy
+            t0 = time.perf_counter()
+            try:
+                return fn(*a, **kw)
+            finally:
+                busy += time.perf_counter() - t0
+
+        timed(self.client.request, "GET /me", "GET", "/me")
+        timed(self.client.request, "GET /notices", "GET", "/notices", revalidate=True)
+        timed(self.client.request, "GET /api/rules", "GET", "/api/rules", revalidate=True)
+        self.think()
+
+        name, body = self.rnd.choices(self.books, weights=self.weights)[0]
+        up = timed(self._json, "POST /upload", "POST", "/upload", files={"file": (name, body)})
+        if not up or not up.get("sheets"):
+            return None
+        sid = up["session_id"]
+        sheets = self.rnd.sample(up["sheets"], min(self.args.sheets_per_session, len(up["sheets"])))
+        info = None
+        for sheet in sheets:
+            self.think()
+            info = timed(self.view_sheet, sid, sheet) or info
+        if info is None:
+            return None
+
+        self.think()
+        chip = info.get("chip_size") or {}
+        status, _ = timed(self.client.request, "POST /excel/paste_snapshot", "POST", "/excel/paste_snapshot",
+                          fields={"session_id": sid, "sheet_name": sheets[-1],
+                                  "chip_w": chip.get("width") or "", "chip_h": chip.get("height") or ""})
+        return busy if status == 200 else None
+
+    def run(self):
+        time.sleep(self.start_delay)
+        try:
+            while time.time() < self.stop_at:
+                t0 = time.perf_counter()
+                busy = self.flow()
+                self.stats.record("(flow)", 200 if busy is not None else "failed",
+                                  busy if busy is not None else time.perf_counter() - t0)
+        finally:
+            self.client.close()
+
+
+# === /metrics 的 event loop 延遲 ===
+_BUCKET_RE = re.compile(LAG_METRIC + r'_bucket\{le="([^"]+)"\} (\S+)')
+
+
+def scrape_lag(base_url: str, timeout: float = 10) -> Optional[Dict[str, Any]]:
+    c = Client(base_url, Stats(), timeout)
+    try:
+        status, data = c.request("metrics", "GET", "/metrics")
+    finally:
+        c.close()
+    if status != 200:
+        return None
+    text = data.decode("utf-8", "replace")
+    buckets = [(float(le) if le != "+Inf" else float("inf"), float(v)) for le, v in _BUCKET_RE.findall(text)]
+    m_sum = re.search(LAG_METRIC + r"_sum (\S+)", text)
+    m_cnt = re.search(LAG_METRIC + r"_count (\S+)", text)
+    if not buckets or not m_cnt:
+        return None
+    return {"buckets": buckets, "sum": float(m_sum.group(1)), "count": float(m_cnt.group(1))}
+
+
+def lag_delta(before: Optional[Dict[str, Any]], after: Optional[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+    """兩次抓取相減 → 壓測期間的樣本數、平均，以及分位數（以 bucket 上界估計）。"""
+    if not after:
+        return None
+    b_buckets = dict(before["buckets"]) if before else {}
+    count = after["count"] - (before["count"] if before else 0)
+    if count <= 0:
+        return None
+    cum = [(le, v - b_buckets.get(le, 0)) for le, v in after["buckets"]]
+
+    def quantile(q):
+        for le, v in cum:
+            if v >= q * count:
+                return None if le == float("inf") else le * 1000
+        return None
+
+    return {
+        "samples": int(count),
+        "mean_ms": round((after["sum"] - (before["sum"] if before else 0)) / count * 1000, 2),
+        "p50_ms_le": quantile(0.50),
+        "p99_ms_le": quantile(0.99),
+        "over_100ms": int(count - next((v for le, v in cum if le >= 0.1), count)),
+    }
+
+
+# === workbook 組合 ===
+def parse_mix(text: str) -> Dict[str, float]:
+    mix = {}
+    for part in filter(None, (p.strip() for p in (text or "").split(","))):
+        name, _, w = part.partition("=")
+        if name not in PROFILES:
+            raise SystemExit(f"--mix: 未知的組合 {name}（可用：{', '.join(PROFILES)}）")
+        mix[name] = float(w or 1)
+    return mix
+
+
+def prepare_books(args, work_dir: str) -> Tuple[List[Tuple[str, bytes]], List[float]]:
+    books, weights = [], []
+    for spec in args.workbook or []:
+        path, _, w = spec.rpartition("=") if re.search(r"=\d+(\.\d+)?$", spec) else (spec, "", "1")
+        with open(path, "rb") as f:
+            books.append((os.path.basename(path), f.read()))
+        weights.append(float(w))
+    if not books:
+        for name, w in parse_mix(args.mix).items():
+            for v in range(args.variants):
+                path = os.path.join(work_dir, f"{name}_{v}.xlsx")
+                padgen.make_workbook(path, seed=args.seed + v, **PROFILES[name])
+                with open(path, "rb") as f:
+                    books.append((os.path.basename(path), f.read()))
+                weights.append(w / args.variants)
+    return books, weights
+
+
+# === 自己起 uvicorn ===
+def launch_server(args, upload_dir: str) -> subprocess.Popen:
+    cmd = [sys.executable, "-m", "uvicorn", "main:app", "--host", "127.0.0.1", "--port", str(args.port),
+           "--workers", str(args.workers), "--log-level", "warning"]
+    env = dict(os.environ, UPLOAD_DIR=upload_dir, ARCHIVE="0")
+    proc = subprocess.Popen(cmd, cwd=os.path.dirname(os.path.abspath(__file__)), env=env)
+    deadline = time.time() + 60
+    while time.time() < deadline:
+        if proc.poll() is not None:
+            raise SystemExit(f"uvicorn 啟動失敗（exit {proc.returncode}）")
+        c = Client(args.url, Stats(), 2)
+        status, _ = c.request("ready", "GET", "/me")
+        c.close()
+        if status == 200:
+            return proc
+        time.sleep(0.5)
+    proc.terminate()
+    raise SystemExit("uvicorn 60 秒內沒有就緒")
+
+
+def print_report(report: Dict[str, Any], stream=sys.stdout):
+    print(f"{'endpoint':<32}{'n':>7}{'err%':>7}{'p50':>9}{'p95':>9}{'p99':>9}{'max':>9}  (ms)", file=stream)
+    for label, e in report["endpoints"].items():
+        print(f"{label:<32}{e['n']:>7}{e['error_rate'] * 100:>7.1f}{e['p50_ms']:>9.0f}{e['p95_ms']:>9.0f}"
+              f"{e['p99_ms']:>9.0f}{e['max_ms']:>9.0f}", file=stream)
+    t = report["totals"]
+    print(f"requests: {t['requests']}  ({t['req_per_s']} req/s)  errors: {t['errors']} "
+          f"({t['error_rate'] * 100:.2f}%)  flows: {t['flows']}", file=stream)
+    lag = report.get("event_loop_lag")
+    if lag:
+        print(f"event loop lag: mean {lag['mean_ms']} ms, p50 ≤ {lag['p50_ms_le']} ms, p99 ≤ {lag['p99_ms_le']} ms, "
+              f"{lag['over_100ms']}/{lag['samples']} samples over 100 ms", file=stream)
+    else:
+        print("event loop lag: n/a（/metrics 沒有 padlist_event_loop_lag_seconds）", file=stream)
+
+
+def main(argv=None) -> int:
+    ap = argparse.ArgumentParser(description="多人同時操作的壓測（upload → sheet → pins → export）")
+    ap.add_argument("--url", default="", help="服務網址（預設 http://127.0.0.1:<port>）")
+    ap.add_argument("--launch", action="store_true", help="自己起一個 uvicorn，壓完關掉")
+    ap.add_argument("--workers", type=int, default=1, help="--launch 時的 uvicorn worker 數")
+    ap.add_argument("--port", type=int, default=8765, help="--launch 時的埠號")
+    ap.add_argument("-u", "--users", type=int, default=20, help="同時的虛擬使用者數")
+    ap.add_argument("-d", "--duration", type=float, default=60, help="壓測秒數（時間到後不再開始新一輪）")
+    ap.add_argument("--ramp", type=float, default=5, help="使用者在這幾秒內陸續加入")
+    ap.add_argument("--think", type=float, default=1.0, help="動作之間的平均思考時間（秒，0 = 不停）")
+    ap.add_argument("--flow", default="frontend", choices=("frontend", "classic"),
+                    help="frontend：/sheet_load（目前前端）；classic：/sheet_info + /parse_pins")
+    ap.add_argument("--sheets-per-session", type=int, default=2, help="每次上傳後看幾張表")
+    ap.add_argument("--mix", default="small=3,medium=2,large=1", help="padgen 預設組合與權重")
+    ap.add_argument("--variants", type=int, default=3, help="每種預設組合產生幾份不同內容")
+    ap.add_argument("--workbook", action="append", help="改用實際檔案 PATH[=權重]（可重複）")
+    ap.add_argument("--timeout", type=float, default=300, help="單一請求逾時（秒）")
+    ap.add_argument("--seed", type=int, default=1)
+    ap.add_argument("-o", "--out", help="報告 JSON 輸出路徑")
+    args = ap.parse_args(argv)
+    args.url = (args.url or f"http://127.0.0.1:{args.port}").rstrip("/")
+
+    work_dir = tempfile.mkdtemp(prefix="loadtest_")
+    proc = None
+    try:
+        print("preparing workbooks...", file=sys.stderr)
+        books, weights = prepare_books(args, work_dir)
+        if args.launch:
+            proc = launch_server(args, os.path.join(work_dir, "uploads"))
+
+        stats = Stats()
+        lag_before = scrape_lag(args.url)
+        t0 = time.time()
+        stop_at = t0 + args.duration
+        users = [VirtualUser(i, args, stats, books, weights, stop_at,
+                             args.ramp * i / max(1, args.users)) for i in range(args.users)]
+        print(f"{args.users} users, {args.duration:g}s, think {args.think:g}s, flow {args.flow} → {args.url}",
+              file=sys.stderr)
+        for u in users:
+            u.start()
+        for u in users:
+            u.join()
+        elapsed = time.time() - t0
+        lag_after = scrape_lag(args.url)
+
+        endpoints = stats.summary()
+        flows = endpoints.get("(flow)", {}).get("n", 0)
+        reqs = {k: v for k, v in endpoints.items() if k != "(flow)"}
+        n_req = sum(e["n"] for e in reqs.values())
+        n_err = sum(e["errors"] for e in reqs.values())
+        report = {
+            "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "params": {k: getattr(args, k) for k in ("url", "launch", "workers", "users", "duration", "ramp",
+                                                     "think", "flow", "sheets_per_session", "mix", "variants",
+                                                     "workbook", "seed")},
+            "elapsed_s": round(elapsed, 1),
+            "totals": {
+                "requests": n_req,
+                "errors": n_err,
+                "error_rate": round(n_err / n_req, 4) if n_req else 0.0,
+                "req_per_s": round(n_req / elapsed, 2) if elapsed else 0.0,
+                "flows": flows,
+            },
+            "endpoints": endpoints,
+            "event_loop_lag": lag_delta(lag_before, lag_after),
+        }
+        print_report(report)
+        if args.out:
+            with open(args.out, "w", encoding="utf-8") as f:
+                json.dump(report, f, ensure_ascii=False, indent=2)
+        return 0
+    finally:
+        if proc is not None:
+            proc.terminate()
+            try:
+                proc.wait(timeout=30)
+            except subprocess.TimeoutExpired:
+                proc.kill()
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
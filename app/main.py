@@ -1,43 +1,191 @@
 import os
-import io
+import asyncio
 import uuid
+import hashlib
 import zipfile
+import shutil
+import tempfile
+import threading
 import platform  # ★ 新增：取得本機 Hostname (2026/1/1修改)
+import math
+import re
 from typing import List, Optional, Dict, Any
+from collections import OrderedDict
+
+import startup  # 最先 import：之後各段 import / 初始化的耗時都記在 startup 報告裡
 
 from fastapi import FastAPI, Request, UploadFile, File, Form
-from fastapi.responses import HTMLResponse, JSONResponse, FileResponse, RedirectResponse
-from fastapi.staticfiles import StaticFiles
+from fastapi.responses import HTMLResponse, JSONResponse, FileResponse, RedirectResponse, StreamingResponse, Response
 from fastapi.templating import Jinja2Templates
-
-from openpyxl import load_workbook
-from openpyxl.utils.cell import coordinate_from_string
-from openpyxl.utils import get_column_letter
-from openpyxl.styles import Font  # ★ 新增：設定 A1 字體大小用
-from PIL import Image
+from starlette.background import BackgroundTask
 
 import json
-import posixpath as pp
-import xml.etree.ElementTree as ET
-import re
 
 from fastapi import HTTPException
-from openpyxl.drawing.image import Image as XLImage
 
 from datetime import datetime
 
+startup.mark("import_fastapi")
+
+# openpyxl / Pillow 在第一次用到的函式裡才 import（冷啟動不必等它們；暖機會在背景先載入）
+
+from workbook_cache import WorkbookCache, WB_CACHE_MAX_MB, WB_CACHE_MEM_FACTOR
+from executor import EXECUTOR, ServerBusy
+import metrics
+from metrics import stage
+from xlsx_patch import append_image_sheets, PatchUnsupported
+from padlist_core import (
+    SheetTextIndex, index_sheet_images, sheet_image_filename, extract_zip_entry,
+    detect_sheet_info, parse_pins_from_index, parse_pins_stream, classic_pin_rows,
+    sheet_fingerprints, diff_pins,
+)
+from rule_engine import RuleEngine
+from json_cache import JsonFileCache, etag_matches
+from shared_state import SharedState, file_lock
+from archive import ARCHIVE_ENABLED, PAGE_SIZE_DEFAULT, open_archive
+import image_pyramid
+import snapshot_render
+from http_cache import (VersionedStaticFiles, file_response, gzip_json_response, accepts_gzip,
+                        add_vary, encoding_etag, PRIVATE_IMMUTABLE, REVALIDATE)
+from preparse import PreparseManager, PREPARSE_ENABLED
+import geometry
+from session_manager import (SessionManager, SESSION_TTL_HOURS, SESSION_QUOTA_MB,
+                             SESSION_SWEEP_SECONDS, SESSION_TOMBSTONE_HOURS)
+
+startup.mark("import_app_modules")
+
 
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
-UPLOAD_DIR = os.path.join(BASE_DIR, "uploads")
+UPLOAD_DIR = os.getenv("UPLOAD_DIR") or os.path.join(BASE_DIR, "uploads")   # bench / 壓測指到暫存目錄
 os.makedirs(UPLOAD_DIR, exist_ok=True)
 
 # === 全站共用 notices.json 路徑（可用環境變數覆寫） ===
-NOTICES_FILE = os.getenv("NOTICES_FILE", os.path.join(BASE_DIR, "uploads", "notices.json"))
+NOTICES_FILE = os.getenv("NOTICES_FILE", os.path.join(UPLOAD_DIR, "notices.json"))
 os.makedirs(os.path.dirname(NOTICES_FILE), exist_ok=True)
 
+# === Workbook 快取：同一個 session 的 /sheet_info、/parse_pins 不再每次重讀 Excel ===
+def _load_workbook_full(path: str):
+    from openpyxl import load_workbook
+    return load_workbook(path, data_only=True)
+
+WB_CACHE = WorkbookCache(
+    loader=metrics.timed("load_workbook", _load_workbook_full),
+    max_bytes=int(WB_CACHE_MAX_MB * 1024 * 1024),
+    mem_factor=WB_CACHE_MEM_FACTOR,
+)
+
+# === 背景預解析工作（上傳後依序解析每張有圖的表） ===
+PREPARSE = PreparseManager()
+
 app = FastAPI()
-app.mount("/static", StaticFiles(directory=os.path.join(BASE_DIR, "static")), name="static")
+
+@app.exception_handler(ServerBusy)
+async def _server_busy(request: Request, exc: ServerBusy):
+    # 排隊已滿：請前端稍後重試，而不是讓所有人一起卡住
+    return JSONResponse({"error": "server busy, please retry"}, status_code=503, headers={"Retry-After": "2"})
+
+# 上傳類端點：Content-Length 明顯超過上限就在解析 multipart 之前擋掉
+_UPLOAD_PATHS = ("/upload", "/excel/paste_snapshot")
+
+@app.middleware("http")
+async def _limit_upload_size(request: Request, call_next):
+    if request.method == "POST" and request.url.path in _UPLOAD_PATHS:
+        try:
+            length = int(request.headers.get("content-length") or 0)
+        except ValueError:
+            length = 0
+        # 快照最多兩張圖，外加 multipart 邊界/欄位的餘裕
+        if length > 2 * MAX_UPLOAD_BYTES + 1024 * 1024:
+            return JSONResponse({"error": "request body too large"}, status_code=413)
+    return await call_next(request)
+
+# 較大的 JSON 回應（/parse_pins、/sheet_load…）壓縮後再送；SSE、檔案等其他型別不碰
+JSON_GZIP_MIN_BYTES = int(float(os.getenv("JSON_GZIP_MIN_KB", "4")) * 1024)
+
+@app.middleware("http")
+async def _compress_json(request: Request, call_next):
+    response = await call_next(request)
+    if (JSON_GZIP_MIN_BYTES <= 0
+            or response.headers.get("content-type", "").split(";")[0].strip() != "application/json"
+            or "content-encoding" in response.headers):
+        return response
+    if not accepts_gzip(request.headers.get("accept-encoding")):
+        add_vary(response)  # 同一網址可能回 gzip：快取要依 Accept-Encoding 分開存
+        return response
+    body = b"".join([chunk async for chunk in response.body_iterator])
+    return gzip_json_response(response, body, JSON_GZIP_MIN_BYTES)
+
+# 每個請求的耗時 / 各階段時間：計入 /metrics，並以 Server-Timing header 回給前端（DevTools → Timing 可直接看）
+# 最外層（最後註冊）→ 量到的是整個請求，含上面兩個 middleware
+@app.middleware("http")
+async def _request_metrics(request: Request, call_next):
+    timer = metrics.RequestTimer()
+    status = 500
+    try:
+        response = await call_next(request)
+        status = response.status_code
+    finally:
+        route = request.scope.get("route")
+        # 以路由樣板計數（/uploads/{sid}/{fname}），不讓 session id 撐爆 label；沒對到路由的合成一類
+        label = getattr(route, "path", None) or ("/static" if request.url.path.startswith("/static/") else "unmatched")
+        total = timer.finish(request.method, label, status)
+    response.headers["Server-Timing"] = metrics.server_timing(timer.stages, total)
+    return response
+
+async def _session_sweeper():
+    """背景清掃：定期跑 _sweep_shared()（在 io 池執行）。"""
+    while True:
+        await asyncio.sleep(SESSION_SWEEP_SECONDS)
+        try:
+            await EXECUTOR.run_io(_sweep_shared)
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            pass  # 清掃失敗下一輪再試，不影響服務
+
+# === 暖機：伺服器開始接受連線後才在背景跑，/、/me、/notices 不必等 ===
+def _warm_templates():
+    # 編譯 index.html，順便算好 static_url 用到的內容雜湊
+    templates.get_template("index.html").render(request=None)
+
+async def _warm_cpu_pool():
+    # 父行程已載入的模組會被 fork 出來的子行程繼承；spawn 時子行程自己 import
+    await asyncio.gather(*(EXECUTOR.run_cpu(startup.preload) for _ in range(max(1, EXECUTOR.cpu_workers))))
+
+WARMUP_STEPS = (
+    ("import_openpyxl", lambda: EXECUTOR.run_io(
+        startup.preload, ("openpyxl", "openpyxl.styles", "openpyxl.drawing.image"))),
+    ("import_pillow", lambda: EXECUTOR.run_io(startup.preload, ("PIL.Image", "PIL.ImageDraw", "PIL.ImageFont"))),
+    ("import_numpy", lambda: EXECUTOR.run_io(startup.preload, ("numpy",))),
+    ("rules", lambda: EXECUTOR.run_io(RULES.get)),
+    ("notices", lambda: EXECUTOR.run_io(NOTICES.get)),
+    ("templates", lambda: EXECUTOR.run_io(_warm_templates)),
+    ("cpu_pool", _warm_cpu_pool),
+)
+
+@app.on_event("startup")
+async def _start_session_sweeper():
+    if SESSION_SWEEP_SECONDS > 0:
+        app.state.session_sweeper = asyncio.create_task(_session_sweeper())
+    if metrics.LOOP_LAG_INTERVAL > 0:
+        app.state.loop_lag_monitor = asyncio.create_task(metrics.monitor_loop_lag())
+    if startup.WARMUP_ENABLED:
+        app.state.warmup = asyncio.create_task(startup.warmup(WARMUP_STEPS))
+    startup.mark("ready")
+
+@app.on_event("shutdown")
+async def _shutdown_executor():
+    for name in ("session_sweeper", "loop_lag_monitor", "warmup"):
+        task = getattr(app.state, name, None)
+        if task:
+            task.cancel()
+    PREPARSE.cancel_all()
+    EXECUTOR.shutdown()
+# /static：index.html 用 static_url() 產生帶內容雜湊的網址（可長期快取），文字類資源回 br / gzip
+STATIC = VersionedStaticFiles(directory=os.path.join(BASE_DIR, "static"))
+app.mount("/static", STATIC, name="static")
 templates = Jinja2Templates(directory=os.path.join(BASE_DIR, "templates"))
+templates.env.globals["static_url"] = STATIC.url
 
 # === 身分/環境設定（以環境變數為主） ===
 TRUST_PROXY = os.getenv("TRUST_PROXY", "1") == "1"
@@ -99,129 +247,313 @@ async def me(request: Request):
     })
 
 
+# Prometheus 抓取端點（多 worker 時每次只會抓到其中一個 worker 的數字，見 README）
+metrics.REGISTRY.add_collector(lambda: metrics.simple_lines(
+    "padlist_workbook_cache_requests_total", "counter", "Workbook cache lookups",
+    {'result="hit"': WB_CACHE.hits, 'result="miss"': WB_CACHE.misses}))
+metrics.REGISTRY.add_collector(lambda: metrics.simple_lines(
+    "padlist_workbook_cache_bytes", "gauge", "Estimated memory held by cached workbooks",
+    {"": WB_CACHE.stats()["est_bytes"]}))
+metrics.REGISTRY.add_collector(lambda: metrics.simple_lines(
+    "padlist_executor_pending_jobs", "gauge", "Jobs running or queued in the io/cpu pools",
+    {"": EXECUTOR.stats()["pending"]}))
+
+metrics.REGISTRY.add_collector(startup.collect)
+
+@app.get("/metrics")
+async def metrics_endpoint():
+    return Response(metrics.REGISTRY.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
+# 啟動時間報告：各 import / 初始化階段、暖機每一步的耗時，以及重量級套件目前是否已載入
+@app.get("/startup")
+async def startup_report():
+    return JSONResponse(startup.report())
+
 @app.get("/favicon.ico")
 async def favicon():
     return RedirectResponse(url="/static/app.ico")
 
-# === 新增：將檔名安全化（用於輸出圖檔）===
-def _safe_name(name: str) -> str:
-    keep = "-_.()[]{}+@！@全形也可用"
-    return "".join(ch if ch.isalnum() or ch in keep else "_" for ch in name).strip("_") or "sheet"
+# === 延遲抽圖：上傳時只存索引，第一次被 /sheet_info 或 /uploads 要到時才解出來 ===
+SHEET_IMAGES_JSON = "sheet_images.json"   # {sheet_name: 圖檔名}（前端 URL 用）
+SHEET_MEDIA_JSON = "sheet_media.json"     # {圖檔名: zip 內影像路徑}（延遲抽圖用）
+
+def _write_sheet_image_index(sess_dir: str, name_to_media: Dict[str, str]):
+    files = {nm: sheet_image_filename(nm, media) for nm, media in name_to_media.items()}
+    _write_json_atomic(os.path.join(sess_dir, SHEET_IMAGES_JSON), files)
+    _write_json_atomic(os.path.join(sess_dir, SHEET_MEDIA_JSON), {files[nm]: media for nm, media in name_to_media.items()})
+    return files
+
+def _load_session_json(sess_dir: str, name: str) -> Dict[str, Any]:
+    path = os.path.join(sess_dir, name)
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        return data if isinstance(data, dict) else {}
+    except Exception:
+        return {}
 
-# === 新增：建構「每個工作表 → 最大張圖片」對應表，並把圖片解出來到 session 目錄 ===
-def _build_sheet_image_map(xlsx_path: str, out_dir: str):
+def _ensure_session_image(sess_dir: str, fname: str) -> Optional[str]:
     """
-    回傳:
-      (ordered_sheet_names, map_name_to_saved_path)
-      - ordered_sheet_names: 依 workbook sheets 原始順序的名稱清單
-      - map_name_to_saved_path: {sheet_name: /abs/save/path/of/largest_image}
-    規則：
-      - 只挑每張工作表面積最大的圖片（用 cx*cy 估算）
-      - 若該表沒有圖片，略過（不進下拉）
-      - 若無尺寸資訊，退回第一張
-    """
-    with zipfile.ZipFile(xlsx_path, "r") as zf:
-        # 1) 解析 workbook.xml，取得 sheet name 與 rid
-        wbk_xml = "xl/workbook.xml"
-        wbk_rels = "xl/_rels/workbook.xml.rels"
-        ns = {
-            "main": "http://schemas.openxmlformats.org/spreadsheetml/2006/main",
-            "r": "http://schemas.openxmlformats.org/officeDocument/2006/relationships",
-            "xdr": "http://schemas.openxmlformats.org/drawingml/2006/spreadsheetDrawing",
-            "a": "http://schemas.openxmlformats.org/drawingml/2006/main",
-            "pr": "http://schemas.openxmlformats.org/package/2006/relationships",
-        }
-        sheets_order = []
-        wtree = ET.fromstring(zf.read(wbk_xml))
-        for s in wtree.findall(".//main:sheets/main:sheet", ns):
-            sheets_order.append((s.attrib.get("name",""), s.attrib.get("{%s}id" % ns["r"], "")))
-
-        # 2) rId → worksheet 路徑
-        rid_to_ws = {}
-        rtree = ET.fromstring(zf.read(wbk_rels))
-        for rel in rtree.findall(".//pr:Relationship", ns):
-            rid = rel.attrib.get("Id","")
-            tgt = rel.attrib.get("Target","")
-            # target 通常像 "worksheets/sheet1.xml"
-            rid_to_ws[rid] = pp.normpath(pp.join("xl", tgt))
-
-        # 3) worksheet → drawing → images，挑最大張
-        name_to_saved = {}
-        for sheet_name, rid in sheets_order:
-            ws_path = rid_to_ws.get(rid)
-            if not ws_path or ws_path not in zf.namelist():
-                continue
-
-            # 找這張工作表的 rels，裡面會有 drawing
-            ws_rels = pp.normpath(pp.join("xl/worksheets/_rels", pp.basename(ws_path) + ".rels"))
-            if ws_rels not in zf.namelist():
-                continue
-
-            wsrels_tree = ET.fromstring(zf.read(ws_rels))
-            drawing_target = None
-            for rel in wsrels_tree.findall(".//pr:Relationship", ns):
-                if rel.attrib.get("Type","").endswith("/drawing"):
-                    drawing_target = rel.attrib.get("Target","")  # ex: "../drawings/drawing1.xml"
+    確保 session 目錄裡有這張圖；還沒解出來就從 workbook.xlsx 抽出來（順便產生預覽 / 螢幕解析度版本）。
+    fname 也可以是金字塔衍生檔（xxx_largest.png.screen.webp），不存在就先確保原圖再產生。回傳路徑或 None。
+    """
+    out_path = os.path.join(sess_dir, fname)
+    if os.path.exists(out_path):
+        return out_path
+    base = image_pyramid.derived_base(fname)
+    if base is not None:
+        src = _ensure_session_image(sess_dir, base)
+        if src and image_pyramid.ensure_pyramid(src) is not None and os.path.exists(out_path):
+            return out_path
+        return None
+    media = _load_session_json(sess_dir, SHEET_MEDIA_JSON).get(fname)
+    xlsx_path = os.path.join(sess_dir, "workbook.xlsx")
+    if not media or not os.path.exists(xlsx_path):
+        return None
+    with stage("image_write"):
+        extract_zip_entry(xlsx_path, media, out_path)
+    with stage("image_pyramid"):
+        image_pyramid.ensure_pyramid(out_path)
+    return out_path
+
+def _image_levels(session_id: str, data_dir: str, fname: str, build: bool = True) -> Optional[Dict[str, Any]]:
+    """
+    工作表圖片各解析度的 URL：{"width", "height", "levels": [{"name", "url", "width", "height"}], "tiles"}；
+    levels 由小到大（preview → screen → full），前端依顯示尺寸挑一層。沒有金字塔（停用 / 失敗）回 None。
+    build=False：只讀現成的 manifest（給 event loop 上的呼叫端，不做影像處理）。
+    """
+    if build:
+        manifest = image_pyramid.ensure_pyramid(os.path.join(data_dir, fname))
+    else:
+        manifest = image_pyramid.load_manifest(data_dir, fname)
+    if manifest is None:
+        return None
+    prefix = f"/uploads/{session_id}/"
+    out = {
+        "width": manifest["width"],
+        "height": manifest["height"],
+        "levels": [{"name": lv["name"], "url": prefix + lv["file"], "width": lv["width"], "height": lv["height"]}
+                   for lv in manifest["levels"]],
+        "tiles": None,
+    }
+    if manifest.get("tiles"):
+        out["tiles"] = {**manifest["tiles"], "url_pattern": prefix + manifest["tiles"]["pattern"]}
+        out["tiles"].pop("pattern", None)
+    return out
+
+# === 內容定址儲存區（content-addressed store）：相同內容的 workbook 只存一份 ===
+# uploads/_store/<sha256>/ 內放 workbook.xlsx、sheet 圖片索引、解出的圖片與每張表的解析結果；
+# session 目錄只留 content.json 指向它（另外放這個 session 自己輸出的快照檔）。
+STORE_DIR = os.path.join(UPLOAD_DIR, "_store")
+STORE_INCOMING_DIR = os.path.join(STORE_DIR, "_incoming")
+os.makedirs(STORE_INCOMING_DIR, exist_ok=True)
+CONTENT_JSON = "content.json"
+WORKBOOK_META_JSON = "workbook_meta.json"   # {"all_sheets": [...]}
+UPLOAD_CHUNK = int(os.getenv("UPLOAD_CHUNK_KB", "256")) * 1024
+# 單一上傳檔（Excel 或快照圖）的大小上限；與 nginx client_max_body_size 對齊
+MAX_UPLOAD_BYTES = int(float(os.getenv("MAX_UPLOAD_MB", "50")) * 1024 * 1024)
+XLSX_MAGIC = b"PK\x03\x04"   # xlsx 本質是 zip
+
+# 多 worker 共用狀態：session 索引 + 跨 worker 作廢用的版本號（SQLite，放在 uploads/ 底下一起持久化）
+STATE = SharedState(os.path.join(UPLOAD_DIR, "_state.db"))
+
+# PAD list 歷史索引（SQLite）：每次存解析結果時一併寫入，/api/archive/* 跨專案查詢
+ARCHIVE = open_archive() if ARCHIVE_ENABLED else None
+
+def _write_json_atomic(path: str, data):
+    tmp_path = f"{path}.{uuid.uuid4().hex[:6]}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(data, f, ensure_ascii=False)
+    os.replace(tmp_path, path)
+
+class UploadRejected(Exception):
+    def __init__(self, status_code: int, message: str):
+        super().__init__(message)
+        self.status_code = status_code
+        self.message = message
+
+def _copy_hashed(src, dst_path: str, max_bytes: Optional[int] = None, magic: Optional[bytes] = None):
+    """
+    把上傳內容以固定大小分塊寫到 dst_path，同時計算 sha256；回傳 (digest, bytes)。
+    - magic：檔頭必須相符（第一塊就檢查，不符立刻拒絕）
+    - max_bytes：超過就中止並刪掉半寫的檔案
+    記憶體用量只跟 UPLOAD_CHUNK 有關，與檔案大小無關。
+    """
+    h = hashlib.sha256()
+    total = 0
+    try:
+        with open(dst_path, "wb") as dst:
+            while True:
+                chunk = src.read(UPLOAD_CHUNK)
+                if not chunk:
                     break
-            if not drawing_target:
-                continue
-
-            drawing_xml = pp.normpath(pp.join(pp.dirname(ws_path), drawing_target))  # → xl/drawings/drawing1.xml
-            if drawing_xml not in zf.namelist():
-                continue
-
-            # drawing 的 rels：把 r:embed → 影像檔路徑對上
-            drawing_rels = pp.normpath(pp.join(pp.dirname(drawing_xml), "_rels", pp.basename(drawing_xml) + ".rels"))
-            if drawing_rels not in zf.namelist():
-                continue
-            drels_tree = ET.fromstring(zf.read(drawing_rels))
-            embed_to_media = {}
-            for rel in drels_tree.findall(".//pr:Relationship", ns):
-                if rel.attrib.get("Type","").endswith("/image"):
-                    rid_img = rel.attrib.get("Id","")
-                    tgt_img = rel.attrib.get("Target","")  # ex: "../media/image1.png"
-                    media_path = pp.normpath(pp.join(pp.dirname(drawing_xml), tgt_img))  # → xl/media/image1.png
-                    embed_to_media[rid_img] = media_path
-
-            # 解析 drawing.xml 找出所有圖片的 a:blip（拿 r:embed）與 a:ext（拿 cx, cy）
-            dtree = ET.fromstring(zf.read(drawing_xml))
-            candidates = []  # [(area, embed_id)]
-            for pic in dtree.findall(".//xdr:pic", ns):
-                blip = pic.find(".//a:blip", ns)
-                if blip is None:
-                    continue
-                embed_id = blip.attrib.get("{%s}embed" % ns["r"])
-                # 嘗試抓尺寸（有些檔可能沒有 ext）
-                ext = pic.find(".//a:xfrm/a:ext", ns)
-                try:
-                    cx = int(ext.attrib.get("cx","0")) if ext is not None else 0
-                    cy = int(ext.attrib.get("cy","0")) if ext is not None else 0
-                except Exception:
-                    cx = cy = 0
-                area = cx * cy
-                candidates.append((area, embed_id))
-
-            if not candidates:
-                continue
-            # 依面積挑最大；若都 0，這個排序也會保留第一張
-            candidates.sort(key=lambda t: t[0], reverse=True)
-            _, best_embed = candidates[0]
-            media_rel = embed_to_media.get(best_embed)
-            if not media_rel or media_rel not in zf.namelist():
-                continue
-
-            # 寫出檔案到 session 目錄
-            ext = os.path.splitext(media_rel)[1].lower() or ".png"
-            out_name = f"{_safe_name(sheet_name)}_largest{ext}"
-            out_path = os.path.join(out_dir, out_name)
-            with open(out_path, "wb") as f:
-                f.write(zf.read(media_rel))
+                if total == 0 and magic and not chunk.startswith(magic):
+                    raise UploadRejected(400, "不是有效的 .xlsx 檔案")
+                total += len(chunk)
+                if max_bytes is not None and total > max_bytes:
+                    raise UploadRejected(413, f"檔案超過上限 {max_bytes / (1024 * 1024):g} MB")
+                h.update(chunk)
+                dst.write(chunk)
+    except BaseException:
+        if os.path.exists(dst_path):
+            os.remove(dst_path)
+        raise
+    if magic and total == 0:
+        os.remove(dst_path)
+        raise UploadRejected(400, "不是有效的 .xlsx 檔案")
+    return h.hexdigest(), total
+
+def _store_dir(digest: str) -> str:
+    return os.path.join(STORE_DIR, digest)
+
+def _ingest_to_store(tmp_path: str, digest: str) -> bool:
+    """把暫存檔放進 store；已有相同內容就直接丟掉暫存檔。回傳是否為新內容。"""
+    sdir = _store_dir(digest)
+    os.makedirs(sdir, exist_ok=True)
+    dst = os.path.join(sdir, "workbook.xlsx")
+    if os.path.exists(dst):
+        os.remove(tmp_path)
+        os.utime(sdir)  # 重新計算 store GC 的寬限期，別的 worker 的清掃不會刪掉正要被參照的內容
+        return False
+    os.replace(tmp_path, dst)
+    return True
 
-            name_to_saved[sheet_name] = out_path
+def _session_digest(sess_dir: str) -> Optional[str]:
+    """session 參照的 store 雜湊：先查共用索引，沒有（較舊的 session）再讀 content.json。"""
+    try:
+        digest = STATE.session_digest(os.path.basename(sess_dir))
+    except Exception:
+        digest = None
+    return digest or _load_session_json(sess_dir, CONTENT_JSON).get("sha256")
+
+def _session_data_dir(sess_dir: str) -> str:
+    """session 的資料來源目錄：有 content.json 就指向 store，否則是舊版 session 目錄本身。"""
+    digest = _session_digest(sess_dir)
+    return _store_dir(digest) if digest else sess_dir
+
+# session id 一律是上傳時產生的 uuid4().hex[:10]；其他格式（路徑、..、_store 等）不碰檔案系統
+SESSION_ID_RE = re.compile(r"^[0-9a-f]{10}$")
 
-        # 只有「有圖」的工作表需要列入選單
-        ordered_names_with_image = [nm for nm, _ in sheets_order if nm in name_to_saved]
-        return ordered_names_with_image, name_to_saved
+def _valid_session_id(session_id: Optional[str]) -> bool:
+    return bool(session_id) and SESSION_ID_RE.fullmatch(session_id) is not None
+
+def _resolve_session(session_id: str):
+    """
+    回傳 (sess_dir, data_dir, xlsx_path, cache_key)；相同內容的 session 共用同一個快取鍵。
+    session_id 格式不對回 None（呼叫端當作 session not found）。
+    """
+    if not _valid_session_id(session_id):
+        return None
+    sess_dir = os.path.join(UPLOAD_DIR, session_id)
+    data_dir = _session_data_dir(sess_dir)
+    cache_key = os.path.basename(data_dir) if data_dir != sess_dir else session_id
+    return sess_dir, data_dir, os.path.join(data_dir, "workbook.xlsx"), cache_key
+
+# === Session 生命週期：最後存取時間、TTL / 配額清掃、過期回 410 ===
+SESSIONS = SessionManager(
+    upload_dir=UPLOAD_DIR,
+    store_dir=STORE_DIR,
+    ttl_seconds=SESSION_TTL_HOURS * 3600,
+    quota_bytes=int(SESSION_QUOTA_MB * 1024 * 1024),
+    tombstone_seconds=SESSION_TOMBSTONE_HOURS * 3600,
+    content_digest=_session_digest,
+    on_store_removed=lambda digest: WB_CACHE.invalidate(digest),
+    on_session_expired=lambda sess_dir: STATE.forget_sessions([os.path.basename(sess_dir)]),
+)
+SWEEP_LOCK = os.path.join(UPLOAD_DIR, "_sweep.lock")
+_seen_store_gen = 0
+
+def _memo_prune_missing() -> int:
+    """丟掉 store 目錄已被刪除的解析結果。"""
+    with _RESULT_MEMO_LOCK:
+        gone = [p for p in _RESULT_MEMO if not os.path.isdir(os.path.dirname(os.path.dirname(p)))]
+        for p in gone:
+            _RESULT_MEMO.pop(p, None)
+        return len(gone)
+
+def _sweep_shared():
+    """
+    多 worker 時同一時間只有一個 worker 在清掃（拿不到鎖就跳過這一輪）；
+    刪了 store 內容就 bump "store" 版本號，其他 worker 看到版本變了再清掉自己記憶體裡指向已刪內容的快取。
+    """
+    global _seen_store_gen
+    with file_lock(SWEEP_LOCK, blocking=False) as got:
+        if got and SESSIONS.sweep().get("store_removed"):
+            STATE.bump("store")
+    gen = STATE.generation("store")
+    if gen != _seen_store_gen:
+        _seen_store_gen = gen
+        WB_CACHE.prune_missing()
+        _memo_prune_missing()
+
+def _session_gone(sess_dir: str) -> Optional[JSONResponse]:
+    """已過期的 session 回 410；否則更新最後存取時間並回 None。"""
+    if SESSIONS.is_expired(sess_dir):
+        return JSONResponse({"error": "session expired"}, status_code=410)
+    SESSIONS.touch(sess_dir)
+    return None
+
+# --- 每張工作表的解析結果（sheet_info / parse_pins）也存在 store，重複上傳直接沿用 ---
+def _sheet_result_path(data_dir: str, sheet_name: str, kind: str) -> str:
+    key = hashlib.sha1(sheet_name.encode("utf-8")).hexdigest()[:16]
+    return os.path.join(data_dir, "results", f"{key}.{kind}.json")
+
+# 記憶體層：解析結果先查這裡（背景預解析、或之前算過的表），沒有才讀 store 的 json
+RESULT_MEMO_ENTRIES = int(os.getenv("RESULT_MEMO_ENTRIES", "4096"))
+_RESULT_MEMO: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+_RESULT_MEMO_LOCK = threading.Lock()
+
+def _memo_put(path: str, data: Dict[str, Any]):
+    with _RESULT_MEMO_LOCK:
+        _RESULT_MEMO[path] = data
+        _RESULT_MEMO.move_to_end(path)
+        while len(_RESULT_MEMO) > RESULT_MEMO_ENTRIES:
+            _RESULT_MEMO.popitem(last=False)
+
+def _load_sheet_result(data_dir: str, sheet_name: str, kind: str) -> Optional[Dict[str, Any]]:
+    path = _sheet_result_path(data_dir, sheet_name, kind)
+    with _RESULT_MEMO_LOCK:
+        data = _RESULT_MEMO.get(path)
+        if data is not None:
+            _RESULT_MEMO.move_to_end(path)
+            metrics.CACHE.inc(cache="sheet_result", result="memory")
+            return data
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+    except Exception:
+        data = None
+    if not (isinstance(data, dict) and data.get("sheet") == sheet_name):
+        metrics.CACHE.inc(cache="sheet_result", result="miss")
+        return None
+    metrics.CACHE.inc(cache="sheet_result", result="disk")
+    _memo_put(path, data)
+    return data
+
+def _save_sheet_result(data_dir: str, sheet_name: str, kind: str, payload: Dict[str, Any]):
+    path = _sheet_result_path(data_dir, sheet_name, kind)
+    data = {"sheet": sheet_name, **payload}
+    _memo_put(path, data)
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        _write_json_atomic(path, data)
+    except Exception:
+        pass  # 結果快取寫不進去不影響回應
+    _archive_result(data_dir, sheet_name, kind, payload)
+
+def _archive_result(data_dir: str, sheet_name: str, kind: str, payload: Dict[str, Any]):
+    """解析結果寫進歷史索引；只收 store 裡的內容（以內容雜湊為鍵），寫不進去不影響回應。"""
+    if ARCHIVE is None or os.path.dirname(os.path.normpath(data_dir)) != STORE_DIR:
+        return
+    digest = os.path.basename(os.path.normpath(data_dir))
+    try:
+        with stage("archive_write"):
+            if kind == "info":
+                ARCHIVE.save_info(digest, sheet_name, payload)
+            elif kind == "pins":
+                ARCHIVE.save_pins(digest, sheet_name, payload["valid_pins"], payload["invalid_pins"])
+    except Exception:
+        pass
 
 def _sheet_has_data(ws) -> bool:
     """Heuristic: if any cell in the used range has a non-empty value."""
@@ -240,87 +572,15 @@ def _sheet_has_data(ws) -> bool:
     except Exception:
         return False
 
-def _read_cell_text(ws, cell_addr: str) -> str:
-    try:
-        value = ws[cell_addr].value
-        if value not in (None, ""):
-            return str(value)
-        # 若空，嘗試從合併儲存格取值
-        target_col_letter, target_row = coordinate_from_string(cell_addr)
-        target_col_idx = ws[cell_addr].column  # numeric
-        for mr in ws.merged_cells.ranges:
-            min_col, min_row, max_col, max_row = mr.bounds
-            # 與 WPF 相同邏輯：同列、且目標欄在合併範圍內
-            if min_row == int(target_row) and min_col <= target_col_idx <= max_col:
-                v = ws.cell(row=min_row, column=min_col).value
-                if v not in (None, ""):
-                    return str(v)
-    except Exception:
-        pass
-    return ""
-
-# === 自動偵測小工具（中文註解） ===
-def _scan_text(ws, max_rows=120, max_cols=40):
-    """把前 max_rows × max_cols 的儲存格掃一遍，回傳 (r,c,文字) 的生成器。"""
-    for r in range(1, max_rows + 1):
-        for c in range(1, max_cols + 1):
-            v = ws.cell(row=r, column=c).value
-            if v not in (None, ""):
-                yield r, c, str(v).strip()
-
-def _find_cell(ws, keywords, **kw):
-    """在頁面左上角區域找『包含 keywords 任一關鍵字』的儲存格。
-    回傳 (row, col)；多筆時採『最靠上、再最靠左』的那一格。"""
-    if isinstance(keywords, str):
-        keywords = [keywords]
-    kws = [k.lower() for k in keywords]
-    best = None
-    for r, c, s in _scan_text(ws, **kw):
-        s_low = s.lower()
-        if any(k in s_low for k in kws):
-            if best is None or (r < best[0] or (r == best[0] and c < best[1])):
-                best = (r, c)
-    return best
-
-# 文字正規化：去掉非英數，轉小寫，便於比對「等於」
-def _norm(s: str) -> str:
-    return re.sub(r'[^a-z0-9]+', '', s.lower()) if s else ''
-
-def _find_header_exact(ws, patterns, **kw):
-    """
-    找『完全等於』其中一個 pattern（比對用 _norm）
-    例如：patterns=["pin", "pinno", "pin#"]，就不會把 "Pin Name" 誤判成 "Pin"
-    """
-    pats = [_norm(p) for p in (patterns if isinstance(patterns, (list, tuple)) else [patterns])]
-    best = None
-    for r, c, s in _scan_text(ws, **kw):
-        if _norm(s) in pats:
-            if best is None or (r < best[0] or (r == best[0] and c < best[1])):
-                best = (r, c)
-    return best
-
-
-def _col_letter(cidx: int) -> str:
-    from openpyxl.utils import get_column_letter
-    return get_column_letter(cidx)
-
-def _find_header_exact_in_row(ws, patterns, row, col_from=1, col_to=None):
-    """只在 row 這一列找『完全等於 patterns 之一』的表頭。會回傳 (row, col)。"""
-    if isinstance(patterns, (list, tuple)):
-        pats = [_norm(p) for p in patterns]
-    else:
-        pats = [_norm(patterns)]
-    if row < 1 or row > (ws.max_row or 0):
-        return None
-    if col_to is None:
-        col_to = min(ws.max_column or 0, 100)
-
-    for c in range(max(1, col_from), col_to + 1):
-        v = ws.cell(row=row, column=c).value
-        if v not in (None, "") and _norm(str(v)) in pats:
-            return (row, c)
-    return None
 
+def _sheet_text_index(cached, sheet_name: str) -> SheetTextIndex:
+    """取（或建立）掛在 workbook 快取上的工作表文字索引；同一張表之後的請求直接沿用。"""
+    st = cached.sheet_state(sheet_name)
+    idx = st.get("text_index")
+    if idx is None:
+        with stage("sheet_index"):
+            idx = st["text_index"] = SheetTextIndex(cached.wb[sheet_name])
+    return idx
 
 def _extract_first_image_from_xlsx(xlsx_path: str, out_dir: str) -> Optional[str]:
     # 直接從 zip 取 xl/media/* 第一張
@@ -343,16 +603,125 @@ def _extract_first_image_from_xlsx(xlsx_path: str, out_dir: str) -> Optional[str
 async def index(request: Request):
     return templates.TemplateResponse("index.html", {"request": request})
 
+def _write_bytes(path: str, data: bytes):
+    with open(path, "wb") as f:
+        f.write(data)
+
+def _prepare_store_index(sdir: str, cache_key: str):
+    """新內容：讀 workbook 分頁名（順便預熱快取）並存 meta。回傳 all_sheets。"""
+    cached = WB_CACHE.get(cache_key, os.path.join(sdir, "workbook.xlsx"))
+    all_sheets = list(cached.wb.sheetnames)
+    _write_json_atomic(os.path.join(sdir, WORKBOOK_META_JSON), {"all_sheets": all_sheets})
+    return all_sheets
+
+# === 增量重新上傳：與上一個 session 比對每張表的內容指紋，沒變的表直接沿用結果 ===
+SHEET_FINGERPRINTS_JSON = "sheet_fingerprints.json"   # {sheet_name: sha256}
+
+def _store_fingerprints(data_dir: str) -> Dict[str, str]:
+    fps = _load_session_json(data_dir, SHEET_FINGERPRINTS_JSON)
+    if not fps:
+        with stage("sheet_fingerprints"):
+            fps = sheet_fingerprints(os.path.join(data_dir, "workbook.xlsx"))
+        _write_json_atomic(os.path.join(data_dir, SHEET_FINGERPRINTS_JSON), fps)
+    return fps
+
+def _copy_sheet_results(prev_dir: str, data_dir: str, sheet_name: str):
+    """內容沒變的表：把上一份的 info / pins 與已解出的圖直接搬過來，不再解析。"""
+    for kind in ("info", "pins"):
+        if _load_sheet_result(data_dir, sheet_name, kind) is not None:
+            continue
+        saved = _load_sheet_result(prev_dir, sheet_name, kind)
+        if saved is not None:
+            _save_sheet_result(data_dir, sheet_name, kind, {k: v for k, v in saved.items() if k != "sheet"})
+    src = _load_session_json(prev_dir, SHEET_IMAGES_JSON).get(sheet_name)
+    dst = _load_session_json(data_dir, SHEET_IMAGES_JSON).get(sheet_name)
+    src_path = os.path.join(prev_dir, src) if src else None
+    dst_path = os.path.join(data_dir, dst) if dst else None
+    if not (src_path and dst_path and os.path.exists(src_path)):
+        return
+    pairs = [(src_path, dst_path)]
+    manifest = image_pyramid.load_manifest(prev_dir, src)
+    if manifest is not None and src == dst:
+        # 多解析度版本也一起搬（manifest 裡記的是檔名，同名才能直接沿用）
+        pairs += [(os.path.join(prev_dir, lv["file"]), os.path.join(data_dir, lv["file"]))
+                  for lv in manifest["levels"] if lv["file"] != src]
+        pairs.append((os.path.join(prev_dir, image_pyramid.manifest_name(src)),
+                      os.path.join(data_dir, image_pyramid.manifest_name(dst))))
+    for a, b in pairs:
+        if not os.path.exists(a) or os.path.exists(b):
+            continue
+        try:
+            os.link(a, b)
+        except OSError:
+            shutil.copyfile(a, b)
+
+def _incremental_job(prev_session_id: str, data_dir: str, xlsx_path: str, cache_key: str,
+                     sheets: List[str]) -> Dict[str, Any]:
+    """
+    比對上一個 session（同一份檔案改過再上傳）：
+    unchanged 的表沿用結果；changed / added 的表重新解析，changed 的表附上 pin 差異。
+    """
+    out: Dict[str, Any] = {"prev_session_id": prev_session_id}
+    if not _valid_session_id(prev_session_id):
+        out["error"] = "invalid previous session"
+        return out
+    prev_sess, prev_dir, prev_xlsx, prev_key = _resolve_session(prev_session_id)
+    if SESSIONS.is_expired(prev_sess) or not os.path.exists(prev_xlsx):
+        out["error"] = "previous session not found or expired"
+        return out
+
+    new_fps = _store_fingerprints(data_dir)
+    old_fps = new_fps if prev_dir == data_dir else _store_fingerprints(prev_dir)
+    prev_sheets = list(_load_session_json(prev_dir, SHEET_IMAGES_JSON).keys())
+
+    changed, unchanged, added, diffs = [], [], [], {}
+    open_wb = _workbook_opener(cache_key, xlsx_path)
+    for sheet in sheets:
+        if sheet not in prev_sheets:
+            added.append(sheet)
+            continue
+        if old_fps.get(sheet) is not None and old_fps.get(sheet) == new_fps.get(sheet):
+            unchanged.append(sheet)
+            if prev_dir != data_dir:
+                _copy_sheet_results(prev_dir, data_dir, sheet)
+            continue
+        changed.append(sheet)
+        new = _pins_result(data_dir, xlsx_path, cache_key, sheet, open_wb=open_wb)
+        old = _pins_result(prev_dir, prev_xlsx, prev_key, sheet)
+        diffs[sheet] = diff_pins(old[0] if old else [], new[0] if new else [])
+
+    out.update({
+        "changed_sheets": changed,
+        "unchanged_sheets": unchanged,
+        "added_sheets": added,
+        "removed_sheets": [s for s in prev_sheets if s not in sheets],
+        "diffs": diffs,
+    })
+    return out
+
 @app.post("/upload")
-async def upload_excel(file: UploadFile = File(...)):
+async def upload_excel(
+    file: UploadFile = File(...),
+    prev_session_id: Optional[str] = Form(None),  # 同一份檔案改過再傳：只重新解析有變動的表
+):
+    sess_dir = tmp_path = new_store_dir = None
     try:
         sid = uuid.uuid4().hex[:10]
         sess_dir = os.path.join(UPLOAD_DIR, sid)
         os.makedirs(sess_dir, exist_ok=True)
 
-        saved_path = os.path.join(sess_dir, "workbook.xlsx")
-        with open(saved_path, "wb") as f:
-            f.write(await file.read())
+        # 邊寫邊算 sha256；相同內容已在 store 就不再存第二份
+        tmp_path = os.path.join(STORE_INCOMING_DIR, f"{sid}.xlsx")
+        with stage("upload_body"):
+            digest, nbytes = await EXECUTOR.run_io(_copy_hashed, file.file, tmp_path, MAX_UPLOAD_BYTES, XLSX_MAGIC)
+        metrics.BYTES.inc(nbytes, kind="upload")
+        sdir = _store_dir(digest)
+        if await EXECUTOR.run_io(_ingest_to_store, tmp_path, digest):
+            new_store_dir = sdir
+            metrics.CACHE.inc(cache="store", result="miss")
+        else:
+            metrics.CACHE.inc(cache="store", result="hit")  # 相同內容已在 store
+        saved_path = os.path.join(sdir, "workbook.xlsx")
 
         # wb = load_workbook(saved_path, data_only=True)
         # sheets = [ws.title for ws in wb.worksheets if _sheet_has_data(ws)]
@@ -363,104 +732,106 @@ async def upload_excel(file: UploadFile = File(...)):
         # img_url = f"/uploads/{sid}/" + os.path.basename(img_path) if img_path else None
         # 
         # return JSONResponse({"session_id": sid, "sheets": sheets, "image_url": img_url})
-        # 讀 workbook，建立「每表最大圖」對應（只列出有圖的工作表）
-        wb = load_workbook(saved_path, data_only=True)
-        sheets_with_img_ordered, map_name_to_saved = _build_sheet_image_map(saved_path, sess_dir)
-        all_sheets = list(wb.sheetnames)  # ★ 新增：所有分頁名
-
-        # 將對應表存成 json，給 /sheet_info 使用
-        mapping_json = os.path.join(sess_dir, "sheet_images.json")
-        with open(mapping_json, "w", encoding="utf-8") as f:
-            json.dump({k: os.path.basename(v) for k, v in map_name_to_saved.items()}, f, ensure_ascii=False)
+        meta = _load_session_json(sdir, WORKBOOK_META_JSON)
+        sheet_files = _load_session_json(sdir, SHEET_IMAGES_JSON)
+        if meta.get("all_sheets") is not None and os.path.exists(os.path.join(sdir, SHEET_MEDIA_JSON)):
+            # 重複上傳：索引都在 store 裡，直接沿用
+            all_sheets = meta["all_sheets"]
+        else:
+            # 讀 workbook，建立「每表最大圖」索引（只列出有圖的工作表；圖片等到被要求時才解出來）
+            # workbook 要留在本行程的快取 → io 池；索引是純 zip/XML → cpu 池，兩者同時進行
+            all_sheets, (_, map_name_to_media) = await asyncio.gather(
+                EXECUTOR.run_io(_prepare_store_index, sdir, digest),  # 順便預熱快取，後續 /sheet_info 直接命中
+                EXECUTOR.run_cpu(index_sheet_images, saved_path, stage_name="image_index"),  # drawing/rels XML 解析
+            )
+            # 將對應表存成 json，給 /sheet_info、/uploads 使用（dict 保留工作表順序）
+            sheet_files = await EXECUTOR.run_io(_write_sheet_image_index, sdir, map_name_to_media)
+        sheets_with_img_ordered = list(sheet_files.keys())
+
+        # session 只記錄指向 store 的內容雜湊
+        await EXECUTOR.run_io(_write_json_atomic, os.path.join(sess_dir, CONTENT_JSON), {"sha256": digest})
+        await EXECUTOR.run_io(STATE.register_session, sid, digest)
+        SESSIONS.touch(sess_dir)
+        if ARCHIVE is not None:
+            try:
+                await EXECUTOR.run_io(ARCHIVE.record_workbook, digest, file.filename)
+            except Exception:
+                pass  # 歷史索引寫不進去不影響上傳
+
+        incremental = None
+        if prev_session_id:
+            incremental = await EXECUTOR.run_io(_incremental_job, prev_session_id.strip(), sdir, saved_path,
+                                                digest, sheets_with_img_ordered)
+
+        # 回應之後在背景依序預解析每張有圖的表（進度：/preparse/{sid}、/preparse/{sid}/events）
+        preparse_job = _start_preparse(sdir, saved_path, digest, sheets_with_img_ordered)
 
         # 預設顯示第一個有圖的工作表之圖片
         default_image_url = None
         if sheets_with_img_ordered:
             first_sheet = sheets_with_img_ordered[0]
-            fname = os.path.basename(map_name_to_saved[first_sheet])
-            default_image_url = f"/uploads/{sid}/{fname}"
+            default_image_url = f"/uploads/{sid}/{sheet_files[first_sheet]}"
 
-        return JSONResponse({
+        payload = {
             "session_id": sid,
             # 僅包含「有圖」的工作表，前端下拉就不會出現沒圖的表
             "sheets": sheets_with_img_ordered,
             "all_sheets": all_sheets,            # ★ 新增：所有分頁（給前端做 1to1/1to9 防呆）
             # 初始圖（第一個工作表的「最大張」）
-            "default_image_url": default_image_url
-        })
+            "default_image_url": default_image_url,
+            "preparse": preparse_job is not None,
+        }
+        if incremental is not None:
+            payload["incremental"] = incremental
+        return JSONResponse(payload)
     except Exception as e:
+        # 失敗的上傳不留下空的 session 目錄 / 暫存檔
+        if sess_dir:
+            shutil.rmtree(sess_dir, ignore_errors=True)
+        if tmp_path and os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        if new_store_dir:
+            shutil.rmtree(new_store_dir, ignore_errors=True)  # 讀不了的內容不要留在 store
+        if isinstance(e, ServerBusy):
+            raise
+        if isinstance(e, UploadRejected):
+            return JSONResponse({"error": e.message}, status_code=e.status_code)
         return JSONResponse({"error": f"Failed to read Excel: {type(e).__name__}: {e}"}, status_code=400)
 
-@app.post("/excel/paste_snapshot")
-async def excel_paste_snapshot(
-    session_id: str = Form(...),
-    sheet_name: Optional[str] = Form(None),
-    # target_height_cm: float = Form(18.0),  # ★ 舊參數保留也可，但本文不再使用
-    img: UploadFile = File(None),
-    img_left: UploadFile = File(None),
-    img_right: UploadFile = File(None),
-):
-    """
-    新版行為：
-    - 若同時收到 img_left + img_right：分別建立兩個新工作表，各自貼圖（不改大小）。
-      * 1:1圖 分頁：A1 寫「1:1圖」（60pt），A2 放左圖，視圖縮放 30%
-      * 1:9圖 分頁：A1 寫「1:9圖」（60pt），A2 放右圖，視圖縮放 30%
-    - 若只收到 img：建立 1 個分頁，A1 寫「1:1圖」，A2 放此圖，視圖縮放 30%
-    - 不再進行合併與依公分高度縮放。
-    """
-    # 1) 檢查 session / workbook 是否存在
-    sess_dir = os.path.join(UPLOAD_DIR, session_id)
-    wb_path  = os.path.join(sess_dir, "workbook.xlsx")
-    if not os.path.exists(wb_path):
-        raise HTTPException(status_code=400, detail="找不到此工作階段的 Excel 檔案")
-
-    # 2) 讀圖（移除透明、用白底鋪，維持原解析度）
-    def _read_img(buf: bytes) -> Image.Image:
-        im = Image.open(io.BytesIO(buf))
-        if im.mode in ("RGBA", "LA"):
-            bg = Image.new("RGB", im.size, (255, 255, 255))
-            bg.paste(im, mask=im.split()[-1])
-            return bg
-        return im.convert("RGB")
-
-    left_img = right_img = single_img = None
-    if img_left and img_right:
-        left_img  = _read_img(await img_left.read())
-        right_img = _read_img(await img_right.read())
-    elif img:
-        single_img = _read_img(await img.read())
-    else:
-        raise HTTPException(status_code=400, detail="沒有收到任何影像（img 或 img_left/img_right）")
-
-    # 3) 開啟 Excel
-    wb = load_workbook(wb_path)
-
-    # 取唯一名稱的小工具（沿用你原本的做法）
-    def _unique_sheetname(wb, base):
-        name = base
-        i = 1
-        while name in wb.sheetnames:
-            i += 1
-            name = f"{base} {i}"
-        return name
-
+# === Excel 快照匯出：解碼圖片（cpu 池）→ 新增分頁並存檔（io 池） ===
+def _snapshot_tmp_png(sess_dir: str, prefix: str) -> str:
+    """匯出用的暫存 PNG：每次呼叫一個唯一檔名（呼叫端負責刪除）。"""
+    fd, path = tempfile.mkstemp(prefix=prefix, suffix=".png", dir=sess_dir)
+    os.close(fd)
+    return path
+
+# 取唯一名稱的小工具（沿用你原本的做法）
+def _unique_sheetname(existing, base):
+    name = base
+    i = 1
+    while name in existing:
+        i += 1
+        name = f"{base} {i}"
+    return name
+
+def _snapshot_sheet_prefix(sheet_name: Optional[str]) -> str:
     # 以目前選單的表名當 prefix，避免非法字元（: / ? * [ ] 等在 Excel 分頁名不允許）
-    prefix = (sheet_name or "Sheet").replace(":", "_").replace("/", "_").replace("\\", "_").replace("[", "(").replace("]", ")").replace("*", "_").replace("?", "_")
-
-    def _add_sheet_with_image(img_pil: Image.Image, title_text: str, sheet_suffix: str, tmp_filename: str):
-        """
-        在新分頁 A1 寫大字、A2 貼圖、視圖縮 30%。
-        img_pil：要貼的 PIL 圖
-        title_text：A1 文字（例如 "1:1圖"）
-        sheet_suffix：用來組成分頁名，如 "_1to1" / "_1to9"
-        tmp_filename：暫存 PNG 檔名
-        """
-        # 存成暫存檔（openpyxl 圖片建議從檔案或 PIL 物件）
-        out_png = os.path.join(sess_dir, tmp_filename)
-        img_pil.save(out_png, "PNG")
+    return (sheet_name or "Sheet").replace(":", "_").replace("/", "_").replace("\\", "_").replace("[", "(").replace("]", ")").replace("*", "_").replace("?", "_")
 
+def _export_snapshot_openpyxl(wb_path: str, out_xlsx: str, prefix: str, items):
+    """
+    items：[(png_path, title_text, sheet_suffix), ...]
+    在每個新分頁 A1 寫大字、A2 貼圖、視圖縮 30%，最後存成 out_xlsx。
+    """
+    from openpyxl import load_workbook
+    from openpyxl.styles import Font  # ★ 新增：設定 A1 字體大小用
+    from openpyxl.drawing.image import Image as XLImage
+    with stage("load_workbook"):
+        wb = load_workbook(wb_path)
+    created = []
+    for png_path, title_text, sheet_suffix in items:
         base_title = f"{prefix}{sheet_suffix}"
-        ws_title   = _unique_sheetname(wb, base_title)  # 例如 "AAA_1to1"
+        ws_title   = _unique_sheetname(wb.sheetnames, base_title)  # 例如 "AAA_1to1"
         ws         = wb.create_sheet(title=ws_title)
 
         # A1 放標題（60pt，大字）
@@ -470,7 +841,7 @@ async def excel_paste_snapshot(
         ws.row_dimensions[1].height = 85
 
         # 插入圖片（不改大小）→ 放在 A2，避免覆蓋 A1 的大字
-        xlimg = XLImage(out_png)
+        xlimg = XLImage(png_path)
         ws.add_image(xlimg, "A2")
 
         # 視圖縮放 30%
@@ -479,34 +850,243 @@ async def excel_paste_snapshot(
             ws.sheet_view.zoomScaleNormal = 30
         except Exception:
             pass  # 某些版本只要設 zoomScale 即可
+        created.append(ws_title)
+
+    with stage("wb_save"):
+        wb.save(out_xlsx)
+    return created
 
-        return ws_title
+# 匯出引擎：zip（直接修補 OOXML，預設）/ openpyxl（舊流程，整本讀進來再存）
+EXPORT_ENGINE = os.getenv("EXPORT_ENGINE", "zip")
+
+def _export_snapshot(wb_path: str, out_xlsx: str, prefix: str, items):
+    """
+    items：[(png_path, title_text, sheet_suffix, (w, h)), ...]
+    zip 引擎遇到不支援的結構時自動退回 openpyxl。
+    """
+    if EXPORT_ENGINE == "zip":
+        try:
+            with stage("snapshot_patch"):
+                return append_image_sheets(wb_path, out_xlsx, prefix, items)
+        except PatchUnsupported:
+            pass
+    return _export_snapshot_openpyxl(wb_path, out_xlsx, prefix, [it[:3] for it in items])
 
-    created_sheets = []
-    if left_img and right_img:
-        created_sheets.append(_add_sheet_with_image(left_img,  "1:1圖", "_1to1", "padlist_left.png"))
-        created_sheets.append(_add_sheet_with_image(right_img, "1:9圖", "_1to9", "padlist_right.png"))
+# === 伺服器端快照：用與前端相同的版面、pin 資料、校正與樣式畫出舞台（不必在瀏覽器截圖再上傳） ===
+SNAPSHOT_VIEWS = ("1to1", "zoom")
+
+def _form_float(form, key: str) -> Optional[float]:
+    try:
+        v = float(form.get(key))
+    except (TypeError, ValueError):
+        return None
+    return v if math.isfinite(v) else None
+
+def _form_color(form, key: str) -> Optional[str]:
+    v = (form.get(key) or "").strip()
+    return v if re.fullmatch(r"#(?:[0-9a-fA-F]{3}|[0-9a-fA-F]{6})", v) else None
+
+def _snapshot_style(form) -> Dict[str, Any]:
+    """前端目前的 Pin 樣式與校正（都可省略：省略就用預設值 / 工作表偵測到的 chip size）。"""
+    scope = (form.get("line_scope") or "all").strip()
+    return {
+        "pin_color": _form_color(form, "pin_color"),
+        "pin_color_inner": _form_color(form, "pin_color_inner"),
+        "line_scope": scope if scope in ("all", "inner", "outer") else "all",
+        "chip_w": _form_float(form, "chip_w"),
+        "chip_h": _form_float(form, "chip_h"),
+        "offsets": {k: _form_float(form, f"offset_{k}") or 0.0 for k in ("left", "right", "top", "bottom")},
+        "stamp_text": (form.get("stamp_text") or "").strip()[:40] or None,
+    }
+
+def _snapshot_image_path(data_dir: str, fname: str, need_px: float) -> Optional[str]:
+    """晶片圖：有多解析度版本就挑「長邊夠用」的最小一層，沒有就用原圖。"""
+    src = _ensure_session_image(data_dir, fname)
+    if not src:
+        return None
+    manifest = image_pyramid.ensure_pyramid(src)
+    if manifest:
+        for lv in manifest["levels"]:
+            if max(lv["width"], lv["height"]) >= need_px:
+                return os.path.join(data_dir, lv["file"])
+    return src
+
+def _snapshot_spec(session_id: str, sheet_name: str, style: Dict[str, Any]):
+    """
+    組出 snapshot_render.render_snapshot 要的資料（不含 view / pin_scale）；在 io 池執行。
+    回傳 (sess_dir, spec) 或錯誤回應。
+    """
+    resolved = _resolve_session(session_id)
+    if resolved is None:
+        return JSONResponse({"error": "session not found"}, status_code=404)
+    sess_dir, data_dir, xlsx_path, cache_key = resolved
+    gone = _session_gone(sess_dir)
+    if gone:
+        return gone
+    if not os.path.exists(xlsx_path):
+        return JSONResponse({"error": "session not found"}, status_code=404)
+    open_wb = _workbook_opener(cache_key, xlsx_path)
+    info = _sheet_info_result(data_dir, xlsx_path, cache_key, sheet_name, open_wb)
+    if info is None:
+        return JSONResponse({"error": "sheet not found"}, status_code=404)
+    chip_w = style["chip_w"] or float((info.get("chip_size") or {}).get("width") or 0)
+    chip_h = style["chip_h"] or float((info.get("chip_size") or {}).get("height") or 0)
+    if chip_w <= 0 or chip_h <= 0:
+        return JSONResponse({"error": "此工作表未偵測到 chip size（寬/高）"}, status_code=400)
+    valid_pins, _ = _pins_result(data_dir, xlsx_path, cache_key, sheet_name, open_wb=open_wb)
+
+    image_path = None
+    fname = _load_session_json(data_dir, SHEET_IMAGES_JSON).get(sheet_name)
+    if fname:
+        # 放大視圖最大約 400×560 px（× SNAPSHOT_SCALE）
+        image_path = _snapshot_image_path(data_dir, fname, 560 * snapshot_render.SNAPSHOT_SCALE)
+    try:
+        rules = RULES.snapshot().data
+    except Exception:
+        rules = None  # 規則檔壞掉：文字框只用通用顏色
+    spec = {
+        **style,
+        "chip_w": chip_w, "chip_h": chip_h,
+        "image_path": image_path,
+        "pins": valid_pins,
+        "rules": rules,
+        "project_code": info.get("project_code") or "",
+        "extras": info.get("extras"),
+    }
+    return sess_dir, spec
+
+@app.post("/snapshot.png")
+async def snapshot_png(request: Request):
+    """
+    伺服器端畫出的舞台 PNG（取代前端 html2canvas 截圖）。
+    表單：session_id、sheet_name、view（1to1 / zoom）、pin_scale，其餘同 _snapshot_style。
+    """
+    form = await request.form()
+    session_id, sheet_name = form.get("session_id"), form.get("sheet_name")
+    view = form.get("view") or "1to1"
+    if not session_id or not sheet_name or view not in SNAPSHOT_VIEWS:
+        return JSONResponse({"error": "需要 session_id、sheet_name，view 為 1to1 或 zoom"}, status_code=400)
+    res = await EXECUTOR.run_io(_snapshot_spec, session_id, sheet_name, _snapshot_style(form))
+    if isinstance(res, Response):
+        return res
+    sess_dir, spec = res
+    spec.update(view=view, pin_scale=_form_float(form, "pin_scale"))
+    out_png = os.path.join(sess_dir, f"padlist_snapshot_{uuid.uuid4().hex[:8]}.png")
+    await EXECUTOR.run_cpu(snapshot_render.render_snapshot, spec, out_png, stage_name="snapshot_render")
+    return FileResponse(out_png, media_type="image/png", filename="padlist_snapshot.png",
+                        headers={"Cache-Control": "no-store"}, background=BackgroundTask(os.remove, out_png))
+
+@app.post("/excel/paste_snapshot")
+async def excel_paste_snapshot(
+    request: Request,
+    session_id: str = Form(...),
+    sheet_name: Optional[str] = Form(None),
+    # target_height_cm: float = Form(18.0),  # ★ 舊參數保留也可，但本文不再使用
+    img: UploadFile = File(None),
+    img_left: UploadFile = File(None),
+    img_right: UploadFile = File(None),
+):
+    """
+    新版行為：
+    - 若同時收到 img_left + img_right：分別建立兩個新工作表，各自貼圖（不改大小）。
+      * 1:1圖 分頁：A1 寫「1:1圖」（60pt），A2 放左圖，視圖縮放 30%
+      * 1:9圖 分頁：A1 寫「1:9圖」（60pt），A2 放右圖，視圖縮放 30%
+    - 若只收到 img：建立 1 個分頁，A1 寫「1:1圖」，A2 放此圖，視圖縮放 30%
+    - 不再進行合併與依公分高度縮放。
+    - 三個影像欄位都沒給：由伺服器畫 1:1（點線 1.5 倍）與放大視圖（4 倍）兩張（樣式欄位同 /snapshot.png）。
+    """
+    # 1) 檢查 session / workbook 是否存在（workbook 在 store，輸出檔放 session 自己的目錄）
+    resolved = _resolve_session(session_id)
+    if resolved is None:
+        raise HTTPException(status_code=404, detail="找不到此工作階段")
+    sess_dir, _, wb_path, _ = resolved
+    gone = _session_gone(sess_dir)
+    if gone:
+        return gone
+    if not os.path.exists(wb_path):
+        raise HTTPException(status_code=400, detail="找不到此工作階段的 Excel 檔案")
+
+    # 2) 讀圖並存成暫存 PNG（openpyxl 圖片建議從檔案）：[(上傳檔, A1 文字, 分頁後綴, 暫存檔名字首)]
+    #    暫存檔名每個請求各自唯一（同一 session 同時匯出兩次也不會互相覆蓋），匯出後一律刪除
+    if img_left and img_right:
+        parts = [(img_left,  "1:1圖", "_1to1", "padlist_left_"),
+                 (img_right, "1:9圖", "_1to9", "padlist_right_")]
+    elif img:
+        parts = [(img, "1:1圖", "_1to1", "padlist_single_")]
     else:
-        created_sheets.append(_add_sheet_with_image(single_img, "1:1圖", "_1to1", "padlist_single.png"))
+        parts = []
 
-    # 4) 存檔並回傳
-    stamp     = datetime.now().strftime("%Y%m%d_%H%M%S")
-    out_xlsx  = os.path.join(sess_dir, f"workbook_with_snapshot_{stamp}.xlsx")
-    wb.save(out_xlsx)
+    items = []
+    try:
+        if not parts:
+            if not sheet_name:
+                raise HTTPException(status_code=400, detail="沒有收到任何影像（img 或 img_left/img_right），也沒有 sheet_name 可供繪製")
+            res = await EXECUTOR.run_io(_snapshot_spec, session_id, sheet_name, _snapshot_style(await request.form()))
+            if isinstance(res, Response):
+                return res
+            _, spec = res
+            for view, title_text, sheet_suffix, tmp_prefix in (("1to1", "1:1圖", "_1to1", "padlist_left_"),
+                                                               ("zoom", "1:9圖", "_1to9", "padlist_right_")):
+                out_png = _snapshot_tmp_png(sess_dir, tmp_prefix)
+                items.append((out_png, title_text, sheet_suffix, None))
+                size = await EXECUTOR.run_cpu(snapshot_render.render_snapshot,
+                                              {**spec, "view": view, "pin_scale": snapshot_render.VIEW_PIN_SCALE[view]},
+                                              out_png, stage_name="snapshot_render")
+                items[-1] = (out_png, title_text, sheet_suffix, size)
+
+        for up, title_text, sheet_suffix, tmp_prefix in parts:
+            # 上傳的圖先分塊落地（不整包讀進記憶體），再交給 cpu 池解碼
+            out_png = _snapshot_tmp_png(sess_dir, tmp_prefix)
+            items.append((out_png, title_text, sheet_suffix, None))
+            raw_path = f"{out_png}.upload"
+            try:
+                with stage("upload_body"):
+                    _, nbytes = await EXECUTOR.run_io(_copy_hashed, up.file, raw_path, MAX_UPLOAD_BYTES)
+                metrics.BYTES.inc(nbytes, kind="snapshot_upload")
+                size = await EXECUTOR.run_cpu(snapshot_render.flatten_png, raw_path, out_png, stage_name="snapshot_decode")
+            except UploadRejected as e:
+                raise HTTPException(status_code=e.status_code, detail=e.message)
+            finally:
+                if os.path.exists(raw_path):
+                    os.remove(raw_path)
+            items[-1] = (out_png, title_text, sheet_suffix, size)
+
+        # 3) 開啟 Excel、新增分頁，4) 存檔並回傳
+        stamp     = datetime.now().strftime("%Y%m%d_%H%M%S")
+        out_name  = f"workbook_with_snapshot_{stamp}.xlsx"   # 下載檔名；落地檔另加亂數，同一秒的匯出不互相覆蓋
+        out_xlsx  = os.path.join(sess_dir, f"workbook_with_snapshot_{stamp}_{uuid.uuid4().hex[:6]}.xlsx")
+        await EXECUTOR.run_io(_export_snapshot, wb_path, out_xlsx, _snapshot_sheet_prefix(sheet_name), items)
+    finally:
+        for png_path, *_ in items:
+            if os.path.exists(png_path):
+                os.remove(png_path)
 
     return FileResponse(
         out_xlsx,
         media_type="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
-        filename=os.path.basename(out_xlsx),
+        filename=out_name,
     )
 
 
 
 @app.get("/uploads/{sid}/{fname}")
-async def serve_upload(sid: str, fname: str):
-    path = os.path.join(UPLOAD_DIR, sid, fname)
+async def serve_upload(request: Request, sid: str, fname: str):
+    # session 自己的輸出檔（快照等）優先，其次是 store 裡共用的工作表圖片
+    if not _valid_session_id(sid) or fname.startswith(".") or os.path.basename(fname) != fname:
+        return JSONResponse({"error": "file not found"}, status_code=404)
+    sess_dir = os.path.join(UPLOAD_DIR, sid)
+    gone = _session_gone(sess_dir)
+    if gone:
+        return gone
+    path = os.path.join(sess_dir, fname)
     if os.path.exists(path):
-        return FileResponse(path)
+        # 快照輸出會以同名覆寫 → 只帶 ETag，每次重新驗證
+        return file_response(request.headers, path, REVALIDATE)
+    # 工作表圖片採延遲抽取：第一次被要求時才從 workbook 解出來
+    path = await EXECUTOR.run_io(_ensure_session_image, _session_data_dir(sess_dir), fname)
+    if path:
+        # store 內容以雜湊定址，同一個網址的內容永遠不變
+        return file_response(request.headers, path, PRIVATE_IMMUTABLE)
     return JSONResponse({"error": "file not found"}, status_code=404)
 
 @app.post("/sheet_info")
@@ -514,209 +1094,326 @@ async def sheet_info(
     session_id: str = Form(...),
     sheet_name: str = Form(...),
 ):
-    sess_dir = os.path.join(UPLOAD_DIR, session_id)
-    xlsx_path = os.path.join(sess_dir, "workbook.xlsx")
-    if not os.path.exists(xlsx_path):
-        return JSONResponse({"error": "session not found"}, status_code=404)
-
-    wb = load_workbook(xlsx_path, data_only=True)
-    if sheet_name not in wb.sheetnames:
-        return JSONResponse({"error": "sheet not found"}, status_code=404)
-    ws = wb[sheet_name]
-
-    # === 自動偵測：Chip Size / Project Code / PadWindow / CUP（中文註解） ===
-    # 1) Chip Size：找含「chip size」的關鍵字，往右一格讀取文字並解析 "123 um x 456 um"
-    cs_pos = _find_cell(ws, ["chip size", "chipsize", "chip-size"])
-    width = height = None
-    if cs_pos:
-        r, c = cs_pos
-        cell_txt = _read_cell_text(ws, f"{_col_letter(c+1)}{r}")
-        m = re.search(r"(\d+\.?\d*)\s*um\s*[X×x]\s*(\d+\.?\d*)\s*um", str(cell_txt))
-        if m:
-            width = float(m.group(1))
-            height = float(m.group(2))
-
-    # 2) Project Code：找到「Name」關鍵字，往右一格
-    proj_pos = _find_cell(ws, ["name"])
-    project_code = None
-    if proj_pos:
-        r, c = proj_pos
-        project_code = _read_cell_text(ws, f"{_col_letter(c+1)}{r}") or ""
-
-    # 3) PadWindow / CUP：各自往右一格（可選）
-    padwindow = cup = None
-    pw_pos = _find_cell(ws, ["padwindow", "pad window"])
-    if pw_pos:
-        r, c = pw_pos
-        padwindow = _read_cell_text(ws, f"{_col_letter(c+1)}{r}") or ""
-    cup_pos = _find_cell(ws, ["cup"])
-    if cup_pos:
-        r, c = cup_pos
-        cup = _read_cell_text(ws, f"{_col_letter(c+1)}{r}") or ""
-
-
-    # 依工作表回傳對應的「最大張圖片」
-    mapping_json = os.path.join(sess_dir, "sheet_images.json")
-    img_url = None
-    if os.path.exists(mapping_json):
-        try:
-            with open(mapping_json, "r", encoding="utf-8") as f:
-                m = json.load(f)  # {sheet_name: filename}
-            fname = m.get(sheet_name)
-            if fname:
-                img_url = f"/uploads/{session_id}/{fname}"
-        except Exception:
-            img_url = None
+    return await EXECUTOR.run_io(_sheet_info_job, session_id, sheet_name)
+
+def _detect_sheet_info(cached, sheet_name: str) -> Dict[str, Any]:
+    """Chip Size / Project Code / PadWindow / CUP 偵測（不含圖片 URL）。"""
+    idx = _sheet_text_index(cached, sheet_name)
+    with stage("sheet_info_detect"):
+        info = detect_sheet_info(cached.wb[sheet_name], idx)
+    metrics.ITEMS.inc(kind="sheet_info")
+    return info
+
+def _workbook_opener(cache_key: str, xlsx_path: str):
+    """回傳一個「第一次呼叫才向快取取 workbook、之後沿用同一份」的函式（同一請求內只開一次）。"""
+    box = []
+
+    def open_wb():
+        if not box:
+            box.append(WB_CACHE.get(cache_key, xlsx_path))
+        return box[0]
+    return open_wb
+
+def _sheet_info_result(data_dir: str, xlsx_path: str, cache_key: str, sheet_name: str,
+                       open_wb=None) -> Optional[Dict[str, Any]]:
+    """偵測結果（記憶體 → store → 實際偵測）；工作表不存在回 None。"""
+    # 同內容的 workbook 之前解析過 → 直接用之前的結果
+    info = _load_sheet_result(data_dir, sheet_name, "info")
+    if info is None:
+        cached = (open_wb or _workbook_opener(cache_key, xlsx_path))()
+        if sheet_name not in cached.wb.sheetnames:
+            return None
+        info = _detect_sheet_info(cached, sheet_name)
+        _save_sheet_result(data_dir, sheet_name, "info", info)
+    return info
+
+def _sheet_image_url(session_id: str, data_dir: str, sheet_name: str) -> Optional[str]:
+    """工作表對應的「最大張圖片」URL（第一次被要求時才從 workbook 解出來）。"""
+    fname = _load_session_json(data_dir, SHEET_IMAGES_JSON).get(sheet_name)  # {sheet_name: filename}
+    if not fname:
+        return None
+    try:
+        if _ensure_session_image(data_dir, fname):
+            return f"/uploads/{session_id}/{fname}"
+    except Exception:
+        pass
+    return None
 
-    return JSONResponse({
-        "chip_size": {"width": width, "height": height},
-        "project_code": project_code,
+def _sheet_info_payload(info: Dict[str, Any], img_url: Optional[str],
+                        img_levels: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    return {
+        "chip_size": info["chip_size"],
+        "project_code": info["project_code"],
         "image_url": img_url,
-        "extras": {"PadWindow": padwindow, "CUP": cup}
-    })
+        "image_levels": img_levels,  # 多解析度版本（preview / screen / full），前端依顯示尺寸挑
+        "extras": info["extras"]
+    }
+
+def _sheet_info_job(session_id: str, sheet_name: str):
+    """/sheet_info：只取 info 部分的 _sheet_load_job（相容舊前端）。"""
+    return _sheet_load_job(session_id, sheet_name, parts=("info",))
+
+# === Pin 表解析：表頭偵測 + 逐列掃描（classic / stream 兩種引擎共用） ===
+# classic：沿用快取中的完整 workbook；stream：read-only + iter_rows，只拉四個欄位
+PARSE_PINS_ENGINE = os.getenv("PARSE_PINS_ENGINE", "classic")
+# 背景預解析沒有使用者在等同一份 workbook 的其他部分，預設直接走 stream
+PREPARSE_ENGINE = os.getenv("PREPARSE_ENGINE", "stream")
 
 @app.post("/parse_pins")
 async def parse_pins(
     session_id: str = Form(...),
     sheet_name: str = Form(...),
+    engine: Optional[str] = Form(None),  # "classic" / "stream"；未給則用 PARSE_PINS_ENGINE
+    verdicts: Optional[str] = Form(None),  # "1"/"true"：一併回傳每個 valid pin 的規則判定
 ):
-    sess_dir = os.path.join(UPLOAD_DIR, session_id)
-    xlsx_path = os.path.join(sess_dir, "workbook.xlsx")
-    if not os.path.exists(xlsx_path):
-        return JSONResponse({"error": "session not found"}, status_code=404)
+    want_verdicts = (verdicts or "").strip().lower() in ("1", "true", "yes", "on")
+    return await EXECUTOR.run_io(_parse_pins_job, session_id, sheet_name, engine, want_verdicts)
 
-    wb = load_workbook(xlsx_path, data_only=True)
-    if sheet_name not in wb.sheetnames:
-        return JSONResponse({"error": "sheet not found"}, status_code=404)
-    ws = wb[sheet_name]
-    if ws.max_row is None or ws.max_row == 0:
-        return JSONResponse({"valid_pins": [], "invalid_pins": []})
-
-        # === 自動偵測：PIN / Text Name / X-axis / Y-axis 四個欄位置與起始列 ===
-    # 容許不同寫法（大小寫/空白/破折號）
-    pin_hdr = _find_header_exact(ws, ["pin", "pinno", "pin#", "pinno."])
-    name_hdr = _find_header_exact(ws, ["textname", "pinname", "name"])
-    x_hdr   = _find_header_exact(ws, ["xaxis", "x-axis", "x"])
-    y_hdr   = _find_header_exact(ws, ["yaxis", "y-axis", "y"])
-
-        # === 讓 Name 表頭「靠近 PIN/X/Y 所在的表頭列」 ===
-    header_row_guess = max(pin_hdr[0], x_hdr[0], y_hdr[0])  # 多半同列，取最大那列當表頭列
-
-    # 先嘗試：只在這一列找 name 表頭
-    name_near = _find_header_exact_in_row(ws, ["textname", "pinname", "name"], header_row_guess)
-    if not name_near:
-        # 再放寬到 ±2 列
-        for dr in ( -1, 1, -2, 2 ):
-            cand = _find_header_exact_in_row(ws, ["textname", "pinname", "name"], header_row_guess + dr)
-            if cand:
-                name_near = cand
-                break
-    if name_near:
-        name_hdr = name_near
-
-    # 若 name 跟 pin 還是在同一欄，優先從「同列表頭、pin 右邊」再找一次
-    if name_hdr and pin_hdr and name_hdr[1] == pin_hdr[1]:
-        cand = _find_header_exact_in_row(ws, ["textname", "pinname", "name"],
-                                         header_row_guess, col_from=pin_hdr[1] + 1)
-        if cand:
-            name_hdr = cand
-
-
-    # 若 pin_hdr 與 name_hdr 指到同一格（例如標頭是 "Pin Name"）
-    if pin_hdr and name_hdr and pin_hdr == name_hdr:
-        hdr_txt = _read_cell_text(ws, f"{_col_letter(pin_hdr[1])}{pin_hdr[0]}")
-        if "name" in (hdr_txt or "").lower():
-            # 這格應該歸「Name」，重新搜「Pin No」但限定只找 "PIN/PIN NO/PIN#"
-            pin_hdr = _find_header_exact(ws, ["pin", "pinno", "pin#", "pinno."])
-
-    if not (pin_hdr and name_hdr and x_hdr and y_hdr):
-        return JSONResponse({"valid_pins": [], "invalid_pins": ["未偵測到表頭（PIN/Name/X-axis/Y-axis）"]})
-        
-
-    # 取「最靠下的表頭列」+1 作為資料起始列（避免表頭不在同一列的情況）
-    start_row = max(pin_hdr[0], name_hdr[0], x_hdr[0], y_hdr[0]) + 1
-
-    from openpyxl.utils import get_column_letter
-    col_pin = get_column_letter(pin_hdr[1])
-    col_nam = get_column_letter(name_hdr[1])
-    col_x   = get_column_letter(x_hdr[1])
-    col_y   = get_column_letter(y_hdr[1])
-
-    def read_cell(col_letter: str, row_idx: int) -> str:
+def _pins_payload(valid_pins, invalid_pins, want_verdicts: bool = False) -> Dict[str, Any]:
+    payload = {"valid_pins": valid_pins, "invalid_pins": invalid_pins}
+    if want_verdicts:
         try:
-            v = ws[f"{col_letter}{row_idx}"].value
-            s = "" if v in (None, "") else str(v)
-            # 🆕 去掉 NBSP(\u00A0) 與全形空白(\u3000)，再 strip
-            return s.replace("\u00A0", "").replace("\u3000", "").strip()
-        except Exception:
-            return ""
-
-    valid_pins, invalid_pins = [], []
-
-    r = start_row
-    while r <= ws.max_row:
-        pin_no   = read_cell(col_pin, r)
-        pin_name = read_cell(col_nam, r)
-        num = lambda s: re.sub(r"[^0-9.+-]", "", (s or ""))
-        x_text = num(read_cell(col_x, r))
-        y_text = num(read_cell(col_y, r))
-
-
-        # 停止條件：四欄都空白 → 結束掃描
-        if pin_no == "" and pin_name == "" and x_text == "" and y_text == "":
-            break
-
-        # === 決定這列的「身分」 ===
-        has_id = (pin_no != "" or pin_name != "")   # 🆕 只要 PIN 或 NAME 有其一
-        has_xy = (x_text != "" or y_text != "")
-
-        # 兩欄都空白，但座標有東西 → 視為雜訊列，直接跳過
-        if not has_id and has_xy:
-            r += 1
-            continue
-
-        # 嘗試把座標轉 float
-        try:
-            x = float(x_text)
-            y = float(y_text)
-        except Exception:
-            x = y = None
-
-        # 強化 NC 偵測（N/C、n c…都抓得到）
-        norm_name = re.sub(r'[^a-z]', '', (pin_name or '').lower())
-        is_nc = (norm_name == "nc")
-
-        # === 加入 invalid 或 valid 的規則 ===
-        if (pin_no == "" or is_nc or x is None or y is None):
-            # 🆕 只有當「至少有 PIN 或 NAME 其中一個」才列入 invalid_pins
-            if has_id:
-                invalid_pins.append(f"{pin_no}, {(pin_name or '').strip()}")
+            rules = RULES.get()
+        except Exception as e:
+            # 規則檔壞掉時不影響解析結果本身
+            payload["verdicts_error"] = str(e)
         else:
-            cleaned_name = (pin_name or "").replace(" ", "")
-            valid_pins.append({"pin_no": pin_no, "pin_name": cleaned_name, "x": x, "y": y})
+            payload["verdicts"] = rules.verdicts(valid_pins)
+            payload["rules_version"] = rules.version
+    return payload
+
+def _pins_result(data_dir: str, xlsx_path: str, cache_key: str, sheet_name: str,
+                 engine: Optional[str] = None, open_wb=None, default_engine: Optional[str] = None):
+    """回傳 (valid_pins, invalid_pins)；工作表不存在回 None。default_engine 未給時用 PARSE_PINS_ENGINE。"""
+    # 未指定引擎時，可直接沿用之前的解析結果（指定引擎代表要實際比對，就重算）
+    if engine is None:
+        saved = _load_sheet_result(data_dir, sheet_name, "pins")
+        if saved is not None:
+            return saved["valid_pins"], saved["invalid_pins"]
+
+    if (engine or default_engine or PARSE_PINS_ENGINE) == "stream":
+        result = parse_pins_stream(xlsx_path, sheet_name, timer=stage)
+        if result is None:
+            return None
+        valid_pins, invalid_pins = result
+    else:
+        cached = (open_wb or _workbook_opener(cache_key, xlsx_path))()
+        wb = cached.wb
+        if sheet_name not in wb.sheetnames:
+            return None
+        ws = wb[sheet_name]
+        if ws.max_row is None or ws.max_row == 0:
+            return [], []
+        idx = _sheet_text_index(cached, sheet_name)
+        valid_pins, invalid_pins = parse_pins_from_index(idx, classic_pin_rows, timer=stage)
+
+    metrics.ITEMS.inc(kind="pin_sheet")
+    metrics.ITEMS.inc(len(valid_pins), kind="pin_valid")
+    metrics.ITEMS.inc(len(invalid_pins), kind="pin_invalid")
+    _save_sheet_result(data_dir, sheet_name, "pins", {"valid_pins": valid_pins, "invalid_pins": invalid_pins})
+    return valid_pins, invalid_pins
+
+def _parse_pins_job(session_id: str, sheet_name: str, engine: Optional[str] = None,
+                    want_verdicts: bool = False):
+    """/parse_pins：只取 pins 部分的 _sheet_load_job（相容舊前端）。"""
+    return _sheet_load_job(session_id, sheet_name, parts=("pins",), engine=engine, want_verdicts=want_verdicts)
+
+
+# === 一次載入一張表：info + 圖片 URL + pins（+ 規則判定），一個來回、workbook 只開一次 ===
+@app.post("/sheet_load")
+async def sheet_load(
+    session_id: str = Form(...),
+    sheet_name: str = Form(...),
+    engine: Optional[str] = Form(None),
+    verdicts: Optional[str] = Form(None),
+):
+    want_verdicts = (verdicts or "").strip().lower() in ("1", "true", "yes", "on")
+    return await EXECUTOR.run_io(_sheet_load_job, session_id, sheet_name, ("info", "pins"), engine, want_verdicts)
+
+def _sheet_load_job(session_id: str, sheet_name: str, parts=("info", "pins"),
+                    engine: Optional[str] = None, want_verdicts: bool = False):
+    """/sheet_load、/sheet_info、/parse_pins 共用的同步本體（在 io 池執行，不佔用 event loop）。"""
+    resolved = _resolve_session(session_id)
+    if resolved is None:
+        return JSONResponse({"error": "session not found"}, status_code=404)
+    sess_dir, data_dir, xlsx_path, cache_key = resolved
+    gone = _session_gone(sess_dir)
+    if gone:
+        return gone
+    if not os.path.exists(xlsx_path):
+        return JSONResponse({"error": "session not found"}, status_code=404)
 
-        r += 1
+    open_wb = _workbook_opener(cache_key, xlsx_path)
+    payload: Dict[str, Any] = {}
+    if "info" in parts:
+        info = _sheet_info_result(data_dir, xlsx_path, cache_key, sheet_name, open_wb)
+        if info is None:
+            return JSONResponse({"error": "sheet not found"}, status_code=404)
+        img_url = _sheet_image_url(session_id, data_dir, sheet_name)
+        img_levels = None
+        if img_url:
+            img_levels = _image_levels(session_id, data_dir, img_url.rsplit("/", 1)[-1])
+        payload.update(_sheet_info_payload(info, img_url, img_levels))
+    if "pins" in parts:
+        result = _pins_result(data_dir, xlsx_path, cache_key, sheet_name, engine, open_wb)
+        if result is None:
+            return JSONResponse({"error": "sheet not found"}, status_code=404)
+        payload.update(_pins_payload(*result, want_verdicts))
+    return JSONResponse(payload)
+
+
+# === 背景預解析：上傳後依序把每張有圖的表解析好，進度用輪詢或 SSE 取得 ===
+def _preparse_sheet(data_dir: str, xlsx_path: str, cache_key: str, sheet_name: str) -> Dict[str, Any]:
+    """預解析一張表（info + pins + 抽圖）；結果寫進記憶體/ store，之後端點直接取用。"""
+    open_wb = _workbook_opener(cache_key, xlsx_path)
+    info = _sheet_info_result(data_dir, xlsx_path, cache_key, sheet_name, open_wb)
+    if info is None:
+        raise KeyError(f"sheet not found: {sheet_name}")
+    fname = _load_session_json(data_dir, SHEET_IMAGES_JSON).get(sheet_name)
+    if fname:
+        _ensure_session_image(data_dir, fname)
+    valid_pins, invalid_pins = _pins_result(data_dir, xlsx_path, cache_key, sheet_name, open_wb=open_wb,
+                                            default_engine=PREPARSE_ENGINE)
+    return {"info": info, "pins": {"valid_pins": valid_pins, "invalid_pins": invalid_pins}}
+
+def _start_preparse(data_dir: str, xlsx_path: str, cache_key: str, sheets: List[str]):
+    if not PREPARSE_ENABLED or not sheets:
+        return None
+
+    async def work(sheet_name: str):
+        return await EXECUTOR.run_io(_preparse_sheet, data_dir, xlsx_path, cache_key, sheet_name)
+
+    return PREPARSE.start(cache_key, sheets, work)
+
+def _preparse_event(session_id: str, data_dir: str, ev: Dict[str, Any]) -> Dict[str, Any]:
+    """把工作事件轉成給這個 session 的格式（info 與 /sheet_info 同形，pins 與 /parse_pins 同形）。"""
+    out = {"sheet": ev["sheet"], "ok": ev["ok"], "seconds": ev["seconds"]}
+    if ev["ok"]:
+        res = ev["result"]
+        fname = _load_session_json(data_dir, SHEET_IMAGES_JSON).get(ev["sheet"])
+        img_url = f"/uploads/{session_id}/{fname}" if fname else None
+        img_levels = _image_levels(session_id, data_dir, fname, build=False) if fname else None
+        out["info"] = _sheet_info_payload(res["info"], img_url, img_levels)
+        out["pins"] = res["pins"]
+    else:
+        out["error"] = ev["error"]
+    return out
+
+def _preparse_lookup(session_id: str):
+    """回傳 (job, data_dir, 錯誤回應)。"""
+    resolved = _resolve_session(session_id)
+    if resolved is None:
+        return None, None, JSONResponse({"error": "session not found"}, status_code=404)
+    sess_dir, data_dir, xlsx_path, cache_key = resolved
+    gone = _session_gone(sess_dir)
+    if gone:
+        return None, data_dir, gone
+    if not os.path.exists(xlsx_path):
+        return None, data_dir, JSONResponse({"error": "session not found"}, status_code=404)
+    return PREPARSE.get(cache_key), data_dir, None
+
+@app.get("/preparse/{session_id}")
+async def preparse_status(session_id: str, since: int = 0):
+    """輪詢：進度 + 第 since 筆之後的每表結果。沒有背景工作時 state = "none"。"""
+    job, data_dir, err = _preparse_lookup(session_id)
+    if err:
+        return err
+    if job is None:
+        return JSONResponse({"state": "none", "total": 0, "done": 0, "sheets": [], "results": []})
+    payload = job.progress()
+    payload["results"] = [_preparse_event(session_id, data_dir, ev) for ev in job.events[max(0, since):]]
+    return JSONResponse(payload)
+
+@app.get("/preparse/{session_id}/events")
+async def preparse_events(session_id: str):
+    """SSE：每完成一張表送一個 "sheet" 事件，全部完成送 "done"。"""
+    job, data_dir, err = _preparse_lookup(session_id)
+    if err:
+        return err
+
+    def sse(event: str, data: Dict[str, Any]) -> str:
+        return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+    async def stream():
+        if job is None:
+            yield sse("done", {"state": "none", "total": 0, "done": 0})
+            return
+        sent = 0
+        while True:
+            while sent < len(job.events):
+                yield sse("sheet", _preparse_event(session_id, data_dir, job.events[sent]))
+                sent += 1
+            if job.finished:
+                p = job.progress()
+                yield sse("done", {"state": p["state"], "total": p["total"], "done": p["done"]})
+                return
+            if not await job.wait_change(15):
+                yield ": keep-alive\n\n"
+
+    return StreamingResponse(stream(), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+
+# === 幾何分析：側邊 / 內外圈 / 連線交叉（前端拖 OFFSET 時可改由伺服器計算） ===
+@app.post("/geometry")
+async def pin_geometry(request: Request):
+    """
+    JSON：{pins: [{pin_no, x, y}], chip_w, chip_h, min_point?, max_point?, anchors?, line_width?, scope?}
+    回傳每個 pin 的 side/ring、rails、是否雙圈、交叉的線段對（以 pin_no 表示）。
+    """
+    try:
+        body = await request.json()
+        pins = body.get("pins") or []
+        chip_w = float(body.get("chip_w") or 0)
+        chip_h = float(body.get("chip_h") or 0)
+        if chip_w <= 0 or chip_h <= 0:
+            return JSONResponse({"error": "chip_w / chip_h 必須大於 0"}, status_code=400)
+        for p in pins:
+            float(p["x"]); float(p["y"])
+    except Exception as e:
+        return JSONResponse({"error": f"invalid payload: {e}"}, status_code=400)
 
-    return JSONResponse({"valid_pins": valid_pins, "invalid_pins": invalid_pins})
+    result = await EXECUTOR.run_cpu(
+        geometry.analyze, pins, chip_w, chip_h,
+        body.get("min_point"), body.get("max_point"), body.get("anchors"),
+        float(body.get("line_width") or 1.0), body.get("scope") or "all",
+    )
+    return JSONResponse(result)
 
 
+def _notices_view(raw):
+    """回應內容：預設值再以已保存的內容覆蓋（檔案不存在 / 不是物件就只有預設值）。"""
+    data = DEFAULT_NOTES.copy()
+    if isinstance(raw, dict):
+        data.update(raw)
+    return data
+
+# 記憶體快取：檔案 mtime/size 沒變就不重讀；儲存時連同 ETag 一起換新
+NOTICES = JsonFileCache(NOTICES_FILE, transform=_notices_view)
+
+def _cached_json_response(request: Request, snap) -> Response:
+    """帶 ETag 的 JSON 回應；If-None-Match 命中回 304。no-cache：瀏覽器每次都會帶 ETag 回來確認。"""
+    headers = {"ETag": snap.etag, "Cache-Control": "no-cache", "Vary": "Accept-Encoding"}
+    # 304 要比對用戶端手上那個編碼版本的 ETag（會被 _compress_json 壓縮的話就是 gzip 版）
+    etag = snap.etag
+    if (0 < JSON_GZIP_MIN_BYTES <= len(snap.body)
+            and accepts_gzip(request.headers.get("accept-encoding"))):
+        etag = encoding_etag(snap.etag, "gzip")
+    if etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers={**headers, "ETag": etag})
+    return Response(snap.body, media_type="application/json", headers=headers)
 
 @app.get("/notices")
-async def get_notices(session_id: str | None = None):
+async def get_notices(request: Request, session_id: str | None = None):
     """
     讀取『全站共用』注意事項。
     為了相容舊版，保留 session_id 參數但已忽略。
     """
-    data = DEFAULT_NOTES.copy()
     try:
-        if os.path.exists(NOTICES_FILE):
-            with open(NOTICES_FILE, "r", encoding="utf-8") as f:
-                saved = json.load(f)
-                if isinstance(saved, dict):
-                    data.update(saved)  # 以已保存內容覆蓋預設
+        snap = NOTICES.get()
     except Exception:
-        pass
-    return JSONResponse(data)
+        return JSONResponse(DEFAULT_NOTES.copy())  # 檔案壞掉時只給預設值（不帶 ETag、不快取）
+    return _cached_json_response(request, snap)
 
 @app.post("/notices")
 async def save_notices(
@@ -727,46 +1424,32 @@ async def save_notices(
 ):
     """
     儲存『全站共用』注意事項；只有 is_editor 的來源可寫入。
-    採用「原子覆寫」避免同時寫入造成檔案半寫壞掉。
+    採用「原子覆寫」避免同時寫入造成檔案半寫壞掉；寫完快取與 ETag 立即換成新版。
     """
     if not is_editor(request):
         return JSONResponse({"error": "forbidden"}, status_code=403)
     if key not in ("operation", "bonding"):
         return JSONResponse({"error": "invalid key"}, status_code=400)
 
-    # 讀舊內容（若檔案壞掉就當空物件）
-    data = {}
-    try:
-        if os.path.exists(NOTICES_FILE):
-            with open(NOTICES_FILE, "r", encoding="utf-8") as f:
-                data = json.load(f) or {}
-    except Exception:
-        data = {}
+    def mutate(raw):
+        # 舊內容壞掉 / 不是物件就當空物件
+        data = dict(raw) if isinstance(raw, dict) else {}
+        data[key] = text
+        return data
 
-    data[key] = text
-
-    # 原子寫入：寫臨時檔 → os.replace 覆蓋
-    tmp_path = NOTICES_FILE + ".tmp"
-    with open(tmp_path, "w", encoding="utf-8") as f:
-        json.dump(data, f, ensure_ascii=False, indent=2)
-        f.flush()
-        os.fsync(f.fileno())
-    os.replace(tmp_path, NOTICES_FILE)
-
-    return JSONResponse({"ok": True})
+    snap = await EXECUTOR.run_io(NOTICES.update, mutate)
+    return JSONResponse({"ok": True}, headers={"ETag": snap.etag})
 
 # === 新增：自定義規則 API ===
 RULES_FILE = os.path.join(BASE_DIR, "validation_rules.json")
+# 編譯後的規則索引（檔案有變才重編）；/parse_pins 的 verdicts 也用同一份
+RULES = RuleEngine(RULES_FILE)
 
 @app.get("/api/rules")
-async def get_rules():
-    """讀取當前驗證規則"""
-    if not os.path.exists(RULES_FILE):
-        return JSONResponse({"rules": [], "forbidden_pins": []})
+async def get_rules(request: Request):
+    """讀取當前驗證規則（記憶體快取 + ETag）"""
     try:
-        with open(RULES_FILE, "r", encoding="utf-8") as f:
-            data = json.load(f)
-            return JSONResponse(data)
+        return _cached_json_response(request, RULES.snapshot())
     except Exception as e:
         return JSONResponse({"error": str(e)}, status_code=500)
 
@@ -778,13 +1461,49 @@ async def save_rules(request: Request):
     
     try:
         data = await request.json()
-        # 原子寫入
-        tmp_path = RULES_FILE + ".tmp"
-        with open(tmp_path, "w", encoding="utf-8") as f:
-            json.dump(data, f, ensure_ascii=False, indent=2)
-            f.flush()
-            os.fsync(f.fileno())
-        os.replace(tmp_path, RULES_FILE)
-        return JSONResponse({"ok": True})
+        # 原子寫入；快取、ETag 與編譯好的規則索引一起換新
+        await EXECUTOR.run_io(RULES.save, data)
+        return JSONResponse({"ok": True}, headers={"ETag": RULES.snapshot().etag})
     except Exception as e:
-        return JSONResponse({"error": str(e)}, status_code=500)
\ No newline at end of file
+        return JSONResponse({"error": str(e)}, status_code=500)
+
+
+# === PAD list 歷史索引查詢（分頁：page 從 1 起、page_size 最多 500） ===
+def _archive_query(fn, *args, **kwargs):
+    if ARCHIVE is None:
+        return JSONResponse({"error": "archive disabled"}, status_code=404)
+    try:
+        return JSONResponse(fn(*args, **kwargs))
+    except ValueError as e:
+        return JSONResponse({"error": str(e)}, status_code=400)
+
+@app.get("/api/archive/pins")
+async def archive_pins(pin_no: str = "", pin_name: str = "", project: str = "",
+                       page: int = 1, page_size: int = PAGE_SIZE_DEFAULT):
+    """依 pin_no / pin_name / project 查歷史 pin（不分大小寫；結尾加 * 為字首比對）。"""
+    return await EXECUTOR.run_io(_archive_query, ARCHIVE and ARCHIVE.search_pins,
+                                 pin_no, pin_name, project, page, page_size)
+
+@app.get("/api/archive/sheets")
+async def archive_sheets(project: str = "", filename: str = "",
+                         page: int = 1, page_size: int = PAGE_SIZE_DEFAULT):
+    """依專案代號 / 檔名查歷史工作表（最近更新的在前）。"""
+    return await EXECUTOR.run_io(_archive_query, ARCHIVE and ARCHIVE.search_sheets,
+                                 project, filename, page, page_size)
+
+@app.get("/api/archive/sheets/{sheet_id}")
+async def archive_sheet(sheet_id: int):
+    """一張歷史工作表的完整 pin 表。"""
+    if ARCHIVE is None:
+        return JSONResponse({"error": "archive disabled"}, status_code=404)
+    detail = await EXECUTOR.run_io(ARCHIVE.sheet_detail, sheet_id)
+    if detail is None:
+        return JSONResponse({"error": "sheet not found"}, status_code=404)
+    return JSONResponse(detail)
+
+@app.get("/api/archive/projects")
+async def archive_projects(prefix: str = "", page: int = 1, page_size: int = PAGE_SIZE_DEFAULT):
+    """專案代號清單（字首篩選），附工作表數。"""
+    return await EXECUTOR.run_io(_archive_query, ARCHIVE and ARCHIVE.projects, prefix, page, page_size)
+
+startup.mark("app_setup")  # 路由註冊、快取與狀態物件建立完成
@@ -0,0 +1,281 @@
+"""
+效能量測：Prometheus 文字格式的 /metrics、Server-Timing header、慢請求的 cProfile
+- stage("load_workbook")：量一段程式的耗時 → padlist_stage_seconds{stage=...} 直方圖，
+  同時記到目前請求的 Server-Timing（io 池裡執行的也算，executor 會把請求的 context 帶進去）
+- Counter / Histogram：不依賴 prometheus_client 的最小實作（行程內、執行緒安全）
+- event loop 延遲：背景每 LOOP_LAG_INTERVAL 秒醒來一次，量「比預定晚了多久」→ padlist_event_loop_lag_seconds
+  （有同步工作卡住 loop 時這裡會先看出來；壓測工具 loadtest.py 也讀這個）
+- 慢請求 profile（選用）：PROFILE_SLOW_MS > 0 時，依 PROFILE_SAMPLE 比例抽樣的請求會開 cProfile，
+  總耗時超過門檻就把 .prof 存到 PROFILE_DIR（用 `python -m pstats` 或 snakeviz 看）
+多 worker 時每個 worker 各自計數；Prometheus 抓到的是回應那個 worker 的數字（見 README）。
+"""
+import asyncio
+import contextlib
+import contextvars
+import cProfile
+import os
+import pstats
+import random
+import re
+import threading
+import time
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+
+# === 參數（可用環境變數覆寫） ===
+PROFILE_SLOW_MS = float(os.getenv("PROFILE_SLOW_MS", "0"))      # 0 = 關閉
+PROFILE_SAMPLE = float(os.getenv("PROFILE_SAMPLE", "1.0"))      # 抽樣比例（0–1）
+PROFILE_DIR = os.getenv("PROFILE_DIR", "")                      # 空白 = uploads/_profiles
+PROFILE_KEEP = 200                                              # 最多保留幾個 .prof（舊的先刪）
+LOOP_LAG_INTERVAL = float(os.getenv("LOOP_LAG_INTERVAL", "0.1"))  # 秒；0 = 不量 event loop 延遲
+
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+
+def _fmt_labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    parts = []
+    for n, v in zip(names, values):
+        v = str(v).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+        parts.append(f'{n}="{v}"')
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _fmt_num(v: float) -> str:
+    if v == float("inf"):
+        return "+Inf"
+    return repr(float(v)) if not float(v).is_integer() else str(int(v))
+
+
+class Counter:
+    def __init__(self, name: str, help_text: str, labelnames: Sequence[str] = ()):
+        self.name, self.help, self.labelnames = name, help_text, tuple(labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1.0, **labels):
+        key = tuple(str(labels.get(n, "")) for n in self.labelnames)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            items = sorted(self._values.items())
+        for key, v in items:
+            lines.append(f"{self.name}{_fmt_labels(self.labelnames, key)} {_fmt_num(v)}")
+        return lines
+
+
+class Histogram:
+    def __init__(self, name: str, help_text: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = DEFAULT_BUCKETS):
+        self.name, self.help, self.labelnames = name, help_text, tuple(labelnames)
+        self.buckets = tuple(sorted(buckets)) + (float("inf"),)
+        self._series: Dict[Tuple[str, ...], list] = {}   # key → [每個 bucket 的計數..., sum, count]
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels):
+        key = tuple(str(labels.get(n, "")) for n in self.labelnames)
+        with self._lock:
+            s = self._series.get(key)
+            if s is None:
+                s = self._series[key] = [0] * len(self.buckets) + [0.0, 0]
+            for i, b in enumerate(self.buckets):
+                if value <= b:
+                    s[i] += 1
+                    break
+            s[-2] += value
+            s[-1] += 1
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            items = sorted((k, list(v)) for k, v in self._series.items())
+        for key, s in items:
+            acc = 0
+            for i, b in enumerate(self.buckets):
+                acc += s[i]
+                le = 'le="' + _fmt_num(b) + '"'
+                lines.append(f"{self.name}_bucket{_fmt_labels(self.labelnames, key, le)} {acc}")
+            lines.append(f"{self.name}_sum{_fmt_labels(self.labelnames, key)} {s[-2]!r}")
+            lines.append(f"{self.name}_count{_fmt_labels(self.labelnames, key)} {s[-1]}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self._metrics: list = []
+        self._collectors: List[Callable[[], List[str]]] = []
+
+    def register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def add_collector(self, fn: Callable[[], List[str]]):
+        """render 時才取值的指標（例如快取命中數），fn 回傳 Prometheus 文字行。"""
+        self._collectors.append(fn)
+
+    def render(self) -> str:
+        lines: List[str] = []
+        for m in self._metrics:
+            lines.extend(m.render())
+        for fn in self._collectors:
+            try:
+                lines.extend(fn())
+            except Exception:
+                pass
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+REQUESTS = REGISTRY.register(Counter(
+    "padlist_http_requests_total", "HTTP requests", ("method", "route", "status")))
+REQUEST_SECONDS = REGISTRY.register(Histogram(
+    "padlist_http_request_seconds", "HTTP request latency (until response headers)", ("method", "route")))
+STAGE_SECONDS = REGISTRY.register(Histogram(
+    "padlist_stage_seconds", "Time spent in an instrumented stage", ("stage",)))
+BYTES = REGISTRY.register(Counter(
+    "padlist_bytes_total", "Bytes received/written by kind", ("kind",)))
+ITEMS = REGISTRY.register(Counter(
+    "padlist_items_total", "Work items processed (sheets, pins, images)", ("kind",)))
+CACHE = REGISTRY.register(Counter(
+    "padlist_cache_requests_total", "Cache lookups by cache and result", ("cache", "result")))
+LOOP_LAG = REGISTRY.register(Histogram(
+    "padlist_event_loop_lag_seconds", "How late the event loop woke up a sleeping probe task",
+    buckets=(0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5)))
+
+
+def simple_lines(name: str, mtype: str, help_text: str, samples: Dict[str, float]) -> List[str]:
+    """collector 用：{label 字串: 值} → Prometheus 文字行（label 字串如 'result="hit"'，空字串表示無 label）。"""
+    lines = [f"# HELP {name} {help_text}", f"# TYPE {name} {mtype}"]
+    for labels, v in samples.items():
+        lines.append(f"{name}{{{labels}}} {_fmt_num(v)}" if labels else f"{name} {_fmt_num(v)}")
+    return lines
+
+
+async def monitor_loop_lag(interval: float = LOOP_LAG_INTERVAL):
+    """背景工作：sleep(interval) 實際多睡了多久 = loop 被同步工作佔住的時間。"""
+    loop = asyncio.get_running_loop()
+    while True:
+        t0 = loop.time()
+        await asyncio.sleep(interval)
+        LOOP_LAG.observe(max(0.0, loop.time() - t0 - interval))
+
+
+# === 每個請求的 stage 紀錄（Server-Timing） ===
+_REQUEST_STAGES: contextvars.ContextVar[Optional[List[Tuple[str, float]]]] = \
+    contextvars.ContextVar("padlist_request_stages", default=None)
+_REQUEST_PROFILES: contextvars.ContextVar[Optional[List[cProfile.Profile]]] = \
+    contextvars.ContextVar("padlist_request_profiles", default=None)
+
+
+@contextlib.contextmanager
+def stage(name: str):
+    t0 = time.perf_counter()
+    try:
+        yield
+    finally:
+        dt = time.perf_counter() - t0
+        STAGE_SECONDS.observe(dt, stage=name)
+        stages = _REQUEST_STAGES.get()
+        if stages is not None:
+            stages.append((name, dt))
+
+
+def timed(name: str, fn: Callable) -> Callable:
+    """把函式包成「呼叫時計入 stage」的版本（例如 workbook 快取的 loader）。"""
+    def wrapper(*args, **kwargs):
+        with stage(name):
+            return fn(*args, **kwargs)
+    return wrapper
+
+
+def run_with_profile(fn: Callable, *args, **kwargs):
+    """在 io 池執行：若目前請求有抽樣 profile，這段工作也各自 profile 一份，最後合併。"""
+    profiles = _REQUEST_PROFILES.get()
+    if profiles is None:
+        return fn(*args, **kwargs)
+    prof = cProfile.Profile()
+    try:
+        return prof.runcall(fn, *args, **kwargs)
+    finally:
+        profiles.append(prof)
+
+
+_SERVER_TIMING_TOKEN = re.compile(r"[^A-Za-z0-9_.-]")
+
+
+def server_timing(stages: List[Tuple[str, float]], total: float) -> str:
+    """同名 stage 合併加總（例如逐表迴圈），最後附 total。"""
+    merged: Dict[str, float] = {}
+    for name, dt in stages:
+        merged[name] = merged.get(name, 0.0) + dt
+    parts = [f"{_SERVER_TIMING_TOKEN.sub('_', n)};dur={dt * 1000:.1f}" for n, dt in merged.items()]
+    parts.append(f"total;dur={total * 1000:.1f}")
+    return ", ".join(parts)
+
+
+class RequestTimer:
+    """middleware 用：一個請求的 stage 紀錄 + （抽樣時的）profile。"""
+    _loop_profiling = threading.Lock()   # event loop 執行緒同時只能有一個 cProfile
+
+    def __init__(self):
+        self.stages: List[Tuple[str, float]] = []
+        self.profiles: Optional[List[cProfile.Profile]] = None
+        self._loop_prof: Optional[cProfile.Profile] = None
+        self._tokens = []
+        self.t0 = time.perf_counter()
+        self._tokens.append((_REQUEST_STAGES, _REQUEST_STAGES.set(self.stages)))
+        if PROFILE_SLOW_MS > 0 and random.random() < PROFILE_SAMPLE:
+            self.profiles = []
+            self._tokens.append((_REQUEST_PROFILES, _REQUEST_PROFILES.set(self.profiles)))
+            if self._loop_profiling.acquire(blocking=False):
+                self._loop_prof = cProfile.Profile()
+                self._loop_prof.enable()
+
+    def finish(self, method: str, route: str, status: int) -> float:
+        total = time.perf_counter() - self.t0
+        if self._loop_prof is not None:
+            self._loop_prof.disable()
+            self.profiles.append(self._loop_prof)
+            self._loop_profiling.release()
+        for var, token in reversed(self._tokens):
+            var.reset(token)
+        REQUESTS.inc(method=method, route=route, status=status)
+        REQUEST_SECONDS.observe(total, method=method, route=route)
+        if self.profiles and total * 1000 >= PROFILE_SLOW_MS:
+            try:
+                dump_profile(self.profiles, method, route, total)
+            except Exception:
+                pass
+        return total
+
+
+def _profile_dir() -> str:
+    if PROFILE_DIR:
+        return PROFILE_DIR
+    upload_dir = os.getenv("UPLOAD_DIR") or os.path.join(os.path.dirname(os.path.abspath(__file__)), "uploads")
+    return os.path.join(upload_dir, "_profiles")
+
+
+def dump_profile(profiles: List[cProfile.Profile], method: str, route: str, total: float) -> str:
+    out_dir = _profile_dir()
+    os.makedirs(out_dir, exist_ok=True)
+    stats = pstats.Stats(profiles[0])
+    for p in profiles[1:]:
+        stats.add(p)
+    slug = re.sub(r"[^A-Za-z0-9]+", "_", route).strip("_") or "root"
+    path = os.path.join(out_dir, f"{time.strftime('%Y%m%d_%H%M%S')}_{os.getpid()}_{method}_{slug}_{int(total * 1000)}ms.prof")
+    stats.dump_stats(path)
+    # 只保留最新的 PROFILE_KEEP 個
+    files = sorted((os.path.join(out_dir, f) for f in os.listdir(out_dir) if f.endswith(".prof")),
+                   key=lambda p: os.path.getmtime(p))
+    for old in files[:-PROFILE_KEEP]:
+        try:
+            os.remove(old)
+        except OSError:
+            pass
+    return path
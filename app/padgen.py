@@ -0,0 +1,236 @@
+"""
+合成 PAD list workbook 產生器（給 bench.py / 壓測 / 手動測試用，內容可重現）
+- 每張表：Chip Size / Name / PadWindow / CUP 資訊列、Pin 表（PIN / Pin Name / X-axis / Y-axis）、晶片圖 + 小 logo
+- 表頭擺法可選，涵蓋 detect_pin_headers 要處理的寫法：
+  - classic：同一列 PIN / Pin Name / X-axis / Y-axis（"Pin Name" 不可被當成 PIN 欄）
+  - merged：PIN 跨兩列合併、Pin Name 跨兩欄合併
+  - split：Text Name 在 PIN/X/Y 表頭的上一列
+  - pinno：Pin No. / Name / X / Y，表頭不在第一欄
+  - mixed：依表輪流使用上述四種
+- 腳位沿晶片四邊排列（少數內圈），混入少量 NC / 缺座標的無效列
+- 存檔後改寫成 Excel 的寫法（rels 用相對路徑、圖片 spPr 帶 a:xfrm 尺寸），跟使用者實際上傳的檔案一致
+- 同一個 seed 產出的內容相同（檔案位元組會因 openpyxl 寫入時間不同而略有差異）
+
+用法（在 app/ 目錄下）：
+  python padgen.py out.xlsx --sheets 5 --pins 400 --header mixed --image 1600x1200
+  python padgen.py big.xlsx --sheets 20 --pins 2000 --image 4000x3000 --image-format jpeg
+"""
+import argparse
+import io
+import os
+import posixpath
+import random
+import re
+import shutil
+import sys
+import zipfile
+from typing import Any, Dict, Optional, Tuple
+
+import numpy as np
+from openpyxl import Workbook
+from openpyxl.drawing.image import Image as XLImage
+from PIL import Image
+
+
+HEADER_LAYOUTS = ("classic", "merged", "split", "pinno")
+_SIGNALS = ("GPIO", "ADC", "SDA", "SCL", "TX", "RX", "CLK", "RST", "SPI_MOSI", "SPI_MISO", "LED")
+_POWER = ("VDD", "VSS", "VDDPST", "VSSPST", "AVDD", "AVSS", "DVDD", "DVSS")
+
+
+def parse_size(text: str) -> Optional[Tuple[int, int]]:
+    """'1600x1200' → (1600, 1200)；'0' / 空白 → None（不放圖）。"""
+    text = (text or "").strip().lower()
+    if text in ("", "0", "none"):
+        return None
+    w, _, h = text.partition("x")
+    return int(w), int(h or w)
+
+
+def chip_image_bytes(size: Tuple[int, int], rnd: random.Random, fmt: str = "png") -> bytes:
+    """像晶片照片的圖：漸層底 + 隨機方塊 + 雜訊（純色圖壓縮率不真實，會讓抽圖/縮圖量測失準）。"""
+    w, h = size
+    rng = np.random.default_rng(rnd.randrange(1 << 30))
+    gy, gx = np.mgrid[0:h, 0:w]
+    base = np.stack([(gx * 160 // max(1, w - 1)) + 40,
+                     (gy * 120 // max(1, h - 1)) + 60,
+                     np.full((h, w), 90)], axis=-1).astype(np.int16)
+    for _ in range(40):
+        x0, y0 = int(rng.integers(0, w)), int(rng.integers(0, h))
+        bw, bh = int(rng.integers(w // 40 + 1, w // 6 + 2)), int(rng.integers(h // 40 + 1, h // 6 + 2))
+        base[y0:y0 + bh, x0:x0 + bw] += rng.integers(-60, 60, size=3, dtype=np.int16)
+    base += rng.integers(-3, 4, size=base.shape, dtype=np.int16)
+    im = Image.fromarray(np.clip(base, 0, 255).astype(np.uint8), "RGB")
+    buf = io.BytesIO()
+    if fmt == "jpeg":
+        im.save(buf, "JPEG", quality=85)
+    else:
+        im.save(buf, "PNG")
+    return buf.getvalue()
+
+
+def _logo_bytes() -> bytes:
+    buf = io.BytesIO()
+    Image.new("RGB", (120, 40), (20, 60, 140)).save(buf, "PNG")
+    return buf.getvalue()
+
+
+def pin_rows(n: int, chip_w: float, chip_h: float, rnd: random.Random, invalid_rate: float = 0.02):
+    """產生 n 列 (pin_no, pin_name, x, y)：沿四邊逆時針排列，約 5% 在內圈，少數無效列。"""
+    rows = []
+    perimeter = 2 * (chip_w + chip_h)
+    margin = min(chip_w, chip_h) * 0.04
+    for i in range(n):
+        t = (i + 0.5) / n * perimeter
+        inner = rnd.random() < 0.05
+        m = margin * (3 if inner else 1)
+        # 座標以左下角（MIN）為原點，與 geometry.chip_to_stage / app.js chipToStage 相同：落在 [m, chip - m]
+        lo_x, hi_x, lo_y, hi_y = m, chip_w - m, m, chip_h - m
+        if t < chip_w:                                   # 下邊（左 → 右）
+            x, y = lo_x + t / chip_w * (hi_x - lo_x), lo_y
+        elif t < chip_w + chip_h:                        # 右邊（下 → 上）
+            x, y = hi_x, lo_y + (t - chip_w) / chip_h * (hi_y - lo_y)
+        elif t < 2 * chip_w + chip_h:                    # 上邊（右 → 左）
+            x, y = hi_x - (t - chip_w - chip_h) / chip_w * (hi_x - lo_x), hi_y
+        else:                                            # 左邊（上 → 下）
+            x, y = lo_x, hi_y - (t - 2 * chip_w - chip_h) / chip_h * (hi_y - lo_y)
+        name = rnd.choice(_POWER) if rnd.random() < 0.3 else f"{rnd.choice(_SIGNALS)}{rnd.randrange(32)}"
+        x, y = round(x, 2), round(y, 2)
+        r = rnd.random()
+        if r < invalid_rate / 2:
+            name = rnd.choice(("NC", "N/C", "n c"))
+        elif r < invalid_rate:
+            x = ""                                       # 缺座標
+        rows.append((str(i + 1), name, x, y))
+    return rows
+
+
+def _write_header(ws, layout: str, top: int, left: int):
+    """寫表頭，回傳 (資料起始列, [PIN 欄, Name 欄, X 欄, Y 欄])。"""
+    if layout == "classic":
+        cols = [left, left + 1, left + 2, left + 3]
+        for c, text in zip(cols, ("PIN", "Pin Name", "X-axis", "Y-axis")):
+            ws.cell(top, c, text)
+        return top + 1, cols
+    if layout == "merged":
+        cols = [left, left + 1, left + 3, left + 4]     # Pin Name 佔兩欄，資料寫在左邊那欄
+        ws.cell(top, left, "PIN")
+        ws.merge_cells(start_row=top, start_column=left, end_row=top + 1, end_column=left)
+        ws.cell(top + 1, left + 1, "Pin Name")
+        ws.merge_cells(start_row=top + 1, start_column=left + 1, end_row=top + 1, end_column=left + 2)
+        ws.cell(top + 1, left + 3, "X-axis")
+        ws.cell(top + 1, left + 4, "Y-axis")
+        return top + 2, cols
+    if layout == "split":
+        cols = [left, left + 1, left + 2, left + 3]
+        ws.cell(top, left + 1, "Text Name")
+        ws.cell(top + 1, left, "PIN")
+        ws.cell(top + 1, left + 2, "X-axis")
+        ws.cell(top + 1, left + 3, "Y-axis")
+        return top + 2, cols
+    if layout == "pinno":
+        cols = [left + 1, left + 2, left + 3, left + 4]
+        ws.cell(top, left, "No.")
+        for c, text in zip(cols, ("Pin No.", "Name", "X", "Y")):
+            ws.cell(top, c, text)
+        return top + 1, cols
+    raise ValueError(f"unknown header layout: {layout}")
+
+
+_TARGET_RE = re.compile(r'Target="/([^"]+)"')
+_ANCHOR_RE = re.compile(r"<oneCellAnchor>.*?</oneCellAnchor>", re.S)
+_ANCHOR_EXT_RE = re.compile(r'<ext cx="(\d+)" cy="(\d+)" ?/>')
+
+
+def excel_style(path: str):
+    """openpyxl 存的是絕對 Target（/xl/...）、圖片沒有 a:xfrm；改成 Excel 存檔的樣子（原地改寫）。"""
+    tmp = path + ".tmp"
+    with zipfile.ZipFile(path) as zi, zipfile.ZipFile(tmp, "w", zipfile.ZIP_DEFLATED) as zo:
+        for item in zi.infolist():
+            data = zi.read(item.filename)
+            if item.filename.endswith(".rels"):
+                # xl/worksheets/_rels/sheet1.xml.rels 的來源 part 在 xl/worksheets/
+                src_dir = posixpath.dirname(posixpath.dirname(item.filename))
+                data = _TARGET_RE.sub(lambda m: f'Target="{posixpath.relpath(m.group(1), src_dir or ".")}"',
+                                      data.decode("utf-8")).encode("utf-8")
+            elif item.filename.startswith("xl/drawings/drawing") and item.filename.endswith(".xml"):
+                def add_xfrm(m):
+                    block = m.group(0)
+                    ext = _ANCHOR_EXT_RE.search(block)
+                    if not ext:
+                        return block
+                    return block.replace("<spPr>", f'<spPr><a:xfrm><a:off x="0" y="0"/>'
+                                                   f'<a:ext cx="{ext.group(1)}" cy="{ext.group(2)}"/></a:xfrm>', 1)
+                data = _ANCHOR_RE.sub(add_xfrm, data.decode("utf-8")).encode("utf-8")
+            zo.writestr(item, data)
+    shutil.move(tmp, path)
+
+
+def make_workbook(path: str, sheets: int = 3, pins: int = 200, header: str = "mixed",
+                  image: Optional[Tuple[int, int]] = (1600, 1200), image_format: str = "png",
+                  seed: int = 1, invalid_rate: float = 0.02) -> Dict[str, Any]:
+    """產生 workbook 寫到 path，回傳摘要（每張表的表頭擺法、pin 數、有效 pin 數）。"""
+    if header != "mixed" and header not in HEADER_LAYOUTS:
+        raise ValueError(f"header must be mixed or one of {HEADER_LAYOUTS}")
+    rnd = random.Random(seed)
+    wb = Workbook()
+    wb.remove(wb.active)
+    logo = _logo_bytes()
+    summary = {"path": path, "seed": seed, "sheets": []}
+    for s in range(sheets):
+        name = f"PAD_{s + 1:02d}"
+        ws = wb.create_sheet(name)
+        layout = HEADER_LAYOUTS[s % len(HEADER_LAYOUTS)] if header == "mixed" else header
+        chip_w = float(rnd.randrange(800, 5000, 10))
+        chip_h = float(rnd.randrange(800, 5000, 10))
+
+        ws["A1"] = "Chip Size"
+        ws["B1"] = f"{chip_w:g} um x {chip_h:g} um"
+        ws["A2"] = "Name"
+        ws["B2"] = f"PRJ{seed:03d}{s:02d}"
+        ws["A3"] = "PadWindow"
+        ws["B3"] = f"{rnd.choice((50, 60, 70))}x{rnd.choice((50, 60, 70))}"
+        ws["A4"] = "CUP"
+        ws["B4"] = rnd.choice(("yes", "no"))
+
+        top = 6 + rnd.randrange(3)
+        start_row, cols = _write_header(ws, layout, top, left=1 + rnd.randrange(3))
+        rows = pin_rows(pins, chip_w, chip_h, rnd, invalid_rate)
+        for r, values in enumerate(rows, start=start_row):
+            for c, v in zip(cols, values):
+                ws.cell(r, c, v)
+
+        if image:
+            ws.add_image(XLImage(io.BytesIO(chip_image_bytes(image, rnd, image_format))), "K2")
+            ws.add_image(XLImage(io.BytesIO(logo)), "K40")
+
+        valid = sum(1 for _, n, x, _y in rows if x != "" and "".join(ch for ch in n.lower() if ch.isalpha()) != "nc")
+        summary["sheets"].append({"name": name, "header": layout, "pins": pins, "valid_pins": valid})
+
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    wb.save(path)
+    excel_style(path)
+    summary["bytes"] = os.path.getsize(path)
+    return summary
+
+
+def main(argv=None) -> int:
+    ap = argparse.ArgumentParser(description="產生合成的 PAD list workbook（bench / 壓測用）")
+    ap.add_argument("out", help="輸出 .xlsx 路徑")
+    ap.add_argument("--sheets", type=int, default=3, help="工作表數")
+    ap.add_argument("--pins", type=int, default=200, help="每張表的 pin 數")
+    ap.add_argument("--header", default="mixed", choices=("mixed",) + HEADER_LAYOUTS, help="表頭擺法")
+    ap.add_argument("--image", default="1600x1200", help="晶片圖尺寸 WxH（0 = 不放圖）")
+    ap.add_argument("--image-format", default="png", choices=("png", "jpeg"))
+    ap.add_argument("--invalid-rate", type=float, default=0.02, help="無效列（NC / 缺座標）比例")
+    ap.add_argument("--seed", type=int, default=1)
+    args = ap.parse_args(argv)
+
+    summary = make_workbook(args.out, sheets=args.sheets, pins=args.pins, header=args.header,
+                            image=parse_size(args.image), image_format=args.image_format,
+                            seed=args.seed, invalid_rate=args.invalid_rate)
+    print(f"{summary['path']}: {len(summary['sheets'])} sheet(s), {summary['bytes'] / 1e6:.1f} MB", file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,596 @@
+"""
+PAD list 偵測核心（不依賴 FastAPI）：網頁端點與批次工具（batch.py）共用同一套邏輯
+- 每張工作表的最大圖片索引 / 抽圖
+- Chip Size / Project Code / PadWindow / CUP 偵測
+- Pin 表頭偵測 + 逐列掃描（classic / stream 兩種讀法）
+"""
+import contextlib
+import hashlib
+import os
+import re
+import shutil
+import uuid
+import zipfile
+import posixpath as pp
+import xml.etree.ElementTree as ET
+from typing import Any, Dict, Optional
+
+# openpyxl 只在真的要讀儲存格時才 import（見 read_cell_text / _col_letter / parse_pins_stream），
+# 只用到抽圖索引的 cpu 池工作與網頁冷啟動都不必載入
+
+
+# === 新增：將檔名安全化（用於輸出圖檔）===
+def safe_name(name: str) -> str:
+    keep = "-_.()[]{}+@！@全形也可用"
+    return "".join(ch if ch.isalnum() or ch in keep else "_" for ch in name).strip("_") or "sheet"
+
+# === 建構「每個工作表 → 最大張圖片」索引（只讀 zip 內的 XML，不解出圖片） ===
+def index_sheet_images(xlsx_path: str):
+    """
+    回傳:
+      (ordered_sheet_names, map_name_to_media)
+      - ordered_sheet_names: 依 workbook sheets 原始順序、且「有圖」的工作表名稱清單
+      - map_name_to_media: {sheet_name: zip 內的影像路徑，例如 xl/media/image1.png}
+    規則：
+      - 只挑每張工作表面積最大的圖片（用 cx*cy 估算）
+      - 若該表沒有圖片，略過（不進下拉）
+      - 若無尺寸資訊，退回第一張
+    """
+    with zipfile.ZipFile(xlsx_path, "r") as zf:
+        names = set(zf.namelist())
+        # 1) 解析 workbook.xml，取得 sheet name 與 rid
+        wbk_xml = "xl/workbook.xml"
+        wbk_rels = "xl/_rels/workbook.xml.rels"
+        ns = {
+            "main": "http://schemas.openxmlformats.org/spreadsheetml/2006/main",
+            "r": "http://schemas.openxmlformats.org/officeDocument/2006/relationships",
+            "xdr": "http://schemas.openxmlformats.org/drawingml/2006/spreadsheetDrawing",
+            "a": "http://schemas.openxmlformats.org/drawingml/2006/main",
+            "pr": "http://schemas.openxmlformats.org/package/2006/relationships",
+        }
+        sheets_order = []
+        wtree = ET.fromstring(zf.read(wbk_xml))
+        for s in wtree.findall(".//main:sheets/main:sheet", ns):
+            sheets_order.append((s.attrib.get("name",""), s.attrib.get("{%s}id" % ns["r"], "")))
+
+        # 2) rId → worksheet 路徑
+        rid_to_ws = {}
+        rtree = ET.fromstring(zf.read(wbk_rels))
+        for rel in rtree.findall(".//pr:Relationship", ns):
+            rid = rel.attrib.get("Id","")
+            tgt = rel.attrib.get("Target","")
+            # target 通常像 "worksheets/sheet1.xml"
+            rid_to_ws[rid] = pp.normpath(pp.join("xl", tgt))
+
+        # 3) worksheet → drawing → images，挑最大張
+        name_to_media = {}
+        for sheet_name, rid in sheets_order:
+            ws_path = rid_to_ws.get(rid)
+            if not ws_path or ws_path not in names:
+                continue
+
+            # 找這張工作表的 rels，裡面會有 drawing
+            ws_rels = pp.normpath(pp.join("xl/worksheets/_rels", pp.basename(ws_path) + ".rels"))
+            if ws_rels not in names:
+                continue
+
+            wsrels_tree = ET.fromstring(zf.read(ws_rels))
+            drawing_target = None
+            for rel in wsrels_tree.findall(".//pr:Relationship", ns):
+                if rel.attrib.get("Type","").endswith("/drawing"):
+                    drawing_target = rel.attrib.get("Target","")  # ex: "../drawings/drawing1.xml"
+                    break
+            if not drawing_target:
+                continue
+
+            drawing_xml = pp.normpath(pp.join(pp.dirname(ws_path), drawing_target))  # → xl/drawings/drawing1.xml
+            if drawing_xml not in names:
+                continue
+
+            # drawing 的 rels：把 r:embed → 影像檔路徑對上
+            drawing_rels = pp.normpath(pp.join(pp.dirname(drawing_xml), "_rels", pp.basename(drawing_xml) + ".rels"))
+            if drawing_rels not in names:
+                continue
+            drels_tree = ET.fromstring(zf.read(drawing_rels))
+            embed_to_media = {}
+            for rel in drels_tree.findall(".//pr:Relationship", ns):
+                if rel.attrib.get("Type","").endswith("/image"):
+                    rid_img = rel.attrib.get("Id","")
+                    tgt_img = rel.attrib.get("Target","")  # ex: "../media/image1.png"
+                    media_path = pp.normpath(pp.join(pp.dirname(drawing_xml), tgt_img))  # → xl/media/image1.png
+                    embed_to_media[rid_img] = media_path
+
+            # 解析 drawing.xml 找出所有圖片的 a:blip（拿 r:embed）與 a:ext（拿 cx, cy）
+            dtree = ET.fromstring(zf.read(drawing_xml))
+            candidates = []  # [(area, embed_id)]
+            for pic in dtree.findall(".//xdr:pic", ns):
+                blip = pic.find(".//a:blip", ns)
+                if blip is None:
+                    continue
+                embed_id = blip.attrib.get("{%s}embed" % ns["r"])
+                # 嘗試抓尺寸（有些檔可能沒有 ext）
+                ext = pic.find(".//a:xfrm/a:ext", ns)
+                try:
+                    cx = int(ext.attrib.get("cx","0")) if ext is not None else 0
+                    cy = int(ext.attrib.get("cy","0")) if ext is not None else 0
+                except Exception:
+                    cx = cy = 0
+                area = cx * cy
+                candidates.append((area, embed_id))
+
+            if not candidates:
+                continue
+            # 依面積挑最大；若都 0，這個排序也會保留第一張
+            candidates.sort(key=lambda t: t[0], reverse=True)
+            _, best_embed = candidates[0]
+            media_rel = embed_to_media.get(best_embed)
+            if not media_rel or media_rel not in names:
+                continue
+
+            name_to_media[sheet_name] = media_rel
+
+        # 只有「有圖」的工作表需要列入選單
+        ordered_names_with_image = [nm for nm, _ in sheets_order if nm in name_to_media]
+        return ordered_names_with_image, name_to_media
+
+def sheet_image_filename(sheet_name: str, media_path: str) -> str:
+    """解出來的圖檔名（固定規則，索引階段就能先決定 URL）。"""
+    ext = os.path.splitext(media_path)[1].lower() or ".png"
+    return f"{safe_name(sheet_name)}_largest{ext}"
+
+def extract_zip_entry(xlsx_path: str, media_path: str, out_path: str):
+    """把 zip 內的一個檔案串流寫到 out_path（先寫暫存檔再 rename，避免半寫檔被讀到）。"""
+    tmp_path = f"{out_path}.{uuid.uuid4().hex[:6]}.tmp"
+    with zipfile.ZipFile(xlsx_path, "r") as zf, zf.open(media_path) as src, open(tmp_path, "wb") as dst:
+        shutil.copyfileobj(src, dst, 1024 * 1024)
+    os.replace(tmp_path, out_path)
+
+# === 建構「每個工作表 → 最大張圖片」對應表，並把圖片全部解出來到 out_dir（批次用） ===
+def build_sheet_image_map(xlsx_path: str, out_dir: str):
+    """
+    回傳:
+      (ordered_sheet_names, map_name_to_saved_path)
+      - map_name_to_saved_path: {sheet_name: /abs/save/path/of/largest_image}
+    """
+    ordered, name_to_media = index_sheet_images(xlsx_path)
+    name_to_saved = {}
+    for sheet_name in ordered:
+        out_path = os.path.join(out_dir, sheet_image_filename(sheet_name, name_to_media[sheet_name]))
+        extract_zip_entry(xlsx_path, name_to_media[sheet_name], out_path)
+        name_to_saved[sheet_name] = out_path
+    return ordered, name_to_saved
+
+def read_cell_text(ws, cell_addr: str) -> str:
+    from openpyxl.utils.cell import coordinate_from_string
+    try:
+        value = ws[cell_addr].value
+        if value not in (None, ""):
+            return str(value)
+        # 若空，嘗試從合併儲存格取值
+        target_col_letter, target_row = coordinate_from_string(cell_addr)
+        target_col_idx = ws[cell_addr].column  # numeric
+        for mr in ws.merged_cells.ranges:
+            min_col, min_row, max_col, max_row = mr.bounds
+            # 與 WPF 相同邏輯：同列、且目標欄在合併範圍內
+            if min_row == int(target_row) and min_col <= target_col_idx <= max_col:
+                v = ws.cell(row=min_row, column=min_col).value
+                if v not in (None, ""):
+                    return str(v)
+    except Exception:
+        pass
+    return ""
+
+# 文字正規化：去掉非英數，轉小寫，便於比對「等於」
+def _norm(s: str) -> str:
+    return re.sub(r'[^a-z0-9]+', '', s.lower()) if s else ''
+
+# === 自動偵測小工具（中文註解） ===
+class SheetTextIndex:
+    """
+    把前 max_rows × max_cols 的儲存格「只掃一遍」，建立文字索引：
+      - by_norm：_norm(文字) → [(r,c), ...]（依列、再依欄排序）
+      - cells：[(r, c, 小寫文字)]，給「包含關鍵字」的查詢用（查過的結果會記住）
+    之後所有關鍵字/表頭查詢都查表，不再重掃整個區域。
+    """
+
+    def __init__(self, ws, max_rows=120, max_cols=40, row_cols=None):
+        # row_cols：額外把每列讀到第幾欄（只給 find_exact_in_row 用）；
+        # read-only 模式回頭讀單格很貴，所以一次讀寬一點
+        self.ws = ws
+        self.max_rows = max_rows
+        self.max_cols = max_cols
+        self.row_cols = max(row_cols or max_cols, max_cols)
+        self.cells = []
+        self.by_norm: Dict[str, list] = {}
+        self.by_pos: Dict[tuple, str] = {}
+        self._contains_memo: Dict[tuple, Optional[tuple]] = {}
+        rows = ws.iter_rows(min_row=1, max_row=max_rows, min_col=1, max_col=self.row_cols, values_only=True)
+        for r, row in enumerate(rows, start=1):
+            for c, v in enumerate(row, start=1):
+                if v in (None, ""):
+                    continue
+                s = str(v).strip()
+                n = _norm(s)
+                self.by_pos[(r, c)] = n
+                if c <= max_cols:
+                    self.cells.append((r, c, s.lower()))
+                    self.by_norm.setdefault(n, []).append((r, c))
+
+    def find_contains(self, keywords):
+        """找『包含 keywords 任一關鍵字』的儲存格；多筆時採『最靠上、再最靠左』。"""
+        kws = tuple(k.lower() for k in keywords)
+        if kws not in self._contains_memo:
+            # cells 本身就是依列、欄順序，第一個命中的就是最靠上、最靠左
+            self._contains_memo[kws] = next(
+                ((r, c) for r, c, s_low in self.cells if any(k in s_low for k in kws)), None)
+        return self._contains_memo[kws]
+
+    def find_exact(self, patterns):
+        """找『_norm 後完全等於』其中一個 pattern 的儲存格（最靠上、再最靠左）。"""
+        hits = [self.by_norm[p][0] for p in {_norm(p) for p in patterns} if p in self.by_norm]
+        return min(hits) if hits else None
+
+    def find_exact_in_row(self, patterns, row, col_from=1, col_to=None):
+        """只在 row 這一列找；索引範圍外的欄位才回頭讀儲存格。"""
+        pats = {_norm(p) for p in patterns}
+        ws = self.ws
+        # 掃描過的區域一定算在範圍內（read-only 模式可能拿不到 max_row/max_column）
+        if row < 1 or row > max(ws.max_row or 0, self.max_rows):
+            return None
+        if col_to is None:
+            col_to = min(max(ws.max_column or self.row_cols, self.max_cols), 100)
+
+        for c in range(max(1, col_from), col_to + 1):
+            if row <= self.max_rows and c <= self.row_cols:
+                n = self.by_pos.get((row, c))
+            else:
+                v = ws.cell(row=row, column=c).value
+                n = None if v in (None, "") else _norm(str(v))
+            if n is not None and n in pats:
+                return (row, c)
+        return None
+
+def _as_list(x):
+    return list(x) if isinstance(x, (list, tuple)) else [x]
+
+def _find_cell(idx: SheetTextIndex, keywords):
+    """在頁面左上角區域找『包含 keywords 任一關鍵字』的儲存格。
+    回傳 (row, col)；多筆時採『最靠上、再最靠左』的那一格。"""
+    return idx.find_contains(_as_list(keywords))
+
+def _find_header_exact(idx: SheetTextIndex, patterns):
+    """
+    找『完全等於』其中一個 pattern（比對用 _norm）
+    例如：patterns=["pin", "pinno", "pin#"]，就不會把 "Pin Name" 誤判成 "Pin"
+    """
+    return idx.find_exact(_as_list(patterns))
+
+
+def _col_letter(cidx: int) -> str:
+    from openpyxl.utils import get_column_letter
+    return get_column_letter(cidx)
+
+def _find_header_exact_in_row(idx: SheetTextIndex, patterns, row, col_from=1, col_to=None):
+    """只在 row 這一列找『完全等於 patterns 之一』的表頭。會回傳 (row, col)。"""
+    return idx.find_exact_in_row(_as_list(patterns), row, col_from=col_from, col_to=col_to)
+
+
+# === 工作表資訊偵測：Chip Size / Project Code / PadWindow / CUP ===
+def detect_sheet_info(ws, idx: SheetTextIndex) -> Dict[str, Any]:
+    """Chip Size / Project Code / PadWindow / CUP 偵測（不含圖片 URL）。"""
+    # === 自動偵測：Chip Size / Project Code / PadWindow / CUP（中文註解） ===
+    # 1) Chip Size：找含「chip size」的關鍵字，往右一格讀取文字並解析 "123 um x 456 um"
+    cs_pos = _find_cell(idx, ["chip size", "chipsize", "chip-size"])
+    width = height = None
+    if cs_pos:
+        r, c = cs_pos
+        cell_txt = read_cell_text(ws, f"{_col_letter(c+1)}{r}")
+        m = re.search(r"(\d+\.?\d*)\s*um\s*[X×x]\s*(\d+\.?\d*)\s*um", str(cell_txt))
+        if m:
+            width = float(m.group(1))
+            height = float(m.group(2))
+
+    # 2) Project Code：找到「Name」關鍵字，往右一格
+    proj_pos = _find_cell(idx, ["name"])
+    project_code = None
+    if proj_pos:
+        r, c = proj_pos
+        project_code = read_cell_text(ws, f"{_col_letter(c+1)}{r}") or ""
+
+    # 3) PadWindow / CUP：各自往右一格（可選）
+    padwindow = cup = None
+    pw_pos = _find_cell(idx, ["padwindow", "pad window"])
+    if pw_pos:
+        r, c = pw_pos
+        padwindow = read_cell_text(ws, f"{_col_letter(c+1)}{r}") or ""
+    cup_pos = _find_cell(idx, ["cup"])
+    if cup_pos:
+        r, c = cup_pos
+        cup = read_cell_text(ws, f"{_col_letter(c+1)}{r}") or ""
+
+    return {
+        "chip_size": {"width": width, "height": height},
+        "project_code": project_code,
+        "extras": {"PadWindow": padwindow, "CUP": cup},
+    }
+
+
+# === Pin 表解析：表頭偵測 + 逐列掃描（classic / stream 兩種引擎共用） ===
+# classic：完整載入的 workbook（網頁端沿用快取）；stream：read-only + iter_rows，只拉四個欄位
+_NUM_STRIP_RE = re.compile(r"[^0-9.+-]")
+_NON_ALPHA_RE = re.compile(r"[^a-z]")
+
+def detect_pin_headers(idx: SheetTextIndex):
+    """
+    自動偵測：PIN / Text Name / X-axis / Y-axis 四個欄位置。
+    回傳 (pin_hdr, name_hdr, x_hdr, y_hdr)，任一個可能是 None。
+    """
+    ws = idx.ws
+    # 容許不同寫法（大小寫/空白/破折號）
+    pin_hdr = _find_header_exact(idx, ["pin", "pinno", "pin#", "pinno."])
+    name_hdr = _find_header_exact(idx, ["textname", "pinname", "name"])
+    x_hdr   = _find_header_exact(idx, ["xaxis", "x-axis", "x"])
+    y_hdr   = _find_header_exact(idx, ["yaxis", "y-axis", "y"])
+    # 缺 PIN / X / Y 任一個就不是 pin 表（例如封面頁）：照原樣回傳，由呼叫端回 NO_HEADER_MSG
+    if pin_hdr is None or x_hdr is None or y_hdr is None:
+        return pin_hdr, name_hdr, x_hdr, y_hdr
+
+        # === 讓 Name 表頭「靠近 PIN/X/Y 所在的表頭列」 ===
+    header_row_guess = max(pin_hdr[0], x_hdr[0], y_hdr[0])  # 多半同列，取最大那列當表頭列
+
+    # 先嘗試：只在這一列找 name 表頭
+    name_near = _find_header_exact_in_row(idx, ["textname", "pinname", "name"], header_row_guess)
+    if not name_near:
+        # 再放寬到 ±2 列
+        for dr in ( -1, 1, -2, 2 ):
+            cand = _find_header_exact_in_row(idx, ["textname", "pinname", "name"], header_row_guess + dr)
+            if cand:
+                name_near = cand
+                break
+    if name_near:
+        name_hdr = name_near
+
+    # 若 name 跟 pin 還是在同一欄，優先從「同列表頭、pin 右邊」再找一次
+    if name_hdr and pin_hdr and name_hdr[1] == pin_hdr[1]:
+        cand = _find_header_exact_in_row(idx, ["textname", "pinname", "name"],
+                                         header_row_guess, col_from=pin_hdr[1] + 1)
+        if cand:
+            name_hdr = cand
+
+
+    # 若 pin_hdr 與 name_hdr 指到同一格（例如標頭是 "Pin Name"）
+    if pin_hdr and name_hdr and pin_hdr == name_hdr:
+        hdr_txt = read_cell_text(ws, f"{_col_letter(pin_hdr[1])}{pin_hdr[0]}")
+        if "name" in (hdr_txt or "").lower():
+            # 這格應該歸「Name」，重新搜「Pin No」但限定只找 "PIN/PIN NO/PIN#"
+            pin_hdr = _find_header_exact(idx, ["pin", "pinno", "pin#", "pinno."])
+
+    return pin_hdr, name_hdr, x_hdr, y_hdr
+
+def _cell_str(v) -> str:
+    s = "" if v in (None, "") else str(v)
+    # 🆕 去掉 NBSP(\u00A0) 與全形空白(\u3000)，再 strip
+    return s.replace("\u00A0", "").replace("\u3000", "").strip()
+
+def scan_pin_rows(rows):
+    """
+    rows：依序產生 (pin_no, pin_name, x, y) 四個「原始儲存格值」的 iterable。
+    回傳 (valid_pins, invalid_pins)；遇到四欄都空白的列就停止。
+    """
+    valid_pins, invalid_pins = [], []
+
+    for raw_pin, raw_name, raw_x, raw_y in rows:
+        pin_no   = _cell_str(raw_pin)
+        pin_name = _cell_str(raw_name)
+        x_text = _NUM_STRIP_RE.sub("", _cell_str(raw_x))
+        y_text = _NUM_STRIP_RE.sub("", _cell_str(raw_y))
+
+
+        # 停止條件：四欄都空白 → 結束掃描
+        if pin_no == "" and pin_name == "" and x_text == "" and y_text == "":
+            break
+
+        # === 決定這列的「身分」 ===
+        has_id = (pin_no != "" or pin_name != "")   # 🆕 只要 PIN 或 NAME 有其一
+        has_xy = (x_text != "" or y_text != "")
+
+        # 兩欄都空白，但座標有東西 → 視為雜訊列，直接跳過
+        if not has_id and has_xy:
+            continue
+
+        # 嘗試把座標轉 float
+        try:
+            x = float(x_text)
+            y = float(y_text)
+        except Exception:
+            x = y = None
+
+        # 強化 NC 偵測（N/C、n c…都抓得到）
+        norm_name = _NON_ALPHA_RE.sub('', (pin_name or '').lower())
+        is_nc = (norm_name == "nc")
+
+        # === 加入 invalid 或 valid 的規則 ===
+        if (pin_no == "" or is_nc or x is None or y is None):
+            # 🆕 只有當「至少有 PIN 或 NAME 其中一個」才列入 invalid_pins
+            if has_id:
+                invalid_pins.append(f"{pin_no}, {(pin_name or '').strip()}")
+        else:
+            cleaned_name = (pin_name or "").replace(" ", "")
+            valid_pins.append({"pin_no": pin_no, "pin_name": cleaned_name, "x": x, "y": y})
+
+    return valid_pins, invalid_pins
+
+def classic_pin_rows(ws, cols, start_row):
+    """classic：逐列讀四個指定欄（直到 ws.max_row）。"""
+    # max_row 在非 read-only 模式每次都會掃過所有儲存格，只在開始時讀一次
+    last = ws.max_row
+    for r in range(start_row, last + 1):
+        yield tuple(ws.cell(row=r, column=c).value for c in cols)
+
+def stream_pin_rows(ws, cols, start_row):
+    """stream：iter_rows(values_only=True) 只拉四個欄所涵蓋的區間。"""
+    cmin, cmax = min(cols), max(cols)
+    offs = [c - cmin for c in cols]
+    for row in ws.iter_rows(min_row=start_row, min_col=cmin, max_col=cmax, values_only=True):
+        yield tuple(row[o] if o < len(row) else None for o in offs)
+
+NO_HEADER_MSG = "未偵測到表頭（PIN/Name/X-axis/Y-axis）"
+
+def _no_timer(name: str):
+    return contextlib.nullcontext()
+
+def parse_pins_from_index(idx: SheetTextIndex, row_source, timer=None):
+    """
+    表頭偵測 + 逐列掃描；row_source 為 classic_pin_rows / stream_pin_rows。
+    timer(stage 名稱) → context manager：量測兩個階段各花多少時間（webapp 的 metrics.stage；批次不用）。
+    """
+    timer = timer or _no_timer
+    with timer("pins_header"):
+        pin_hdr, name_hdr, x_hdr, y_hdr = detect_pin_headers(idx)
+    if not (pin_hdr and name_hdr and x_hdr and y_hdr):
+        return [], [NO_HEADER_MSG]
+
+    # 取「最靠下的表頭列」+1 作為資料起始列（避免表頭不在同一列的情況）
+    start_row = max(pin_hdr[0], name_hdr[0], x_hdr[0], y_hdr[0]) + 1
+    cols = (pin_hdr[1], name_hdr[1], x_hdr[1], y_hdr[1])
+    with timer("pins_scan"):
+        return scan_pin_rows(row_source(idx.ws, cols, start_row))
+
+def parse_pins_stream(xlsx_path: str, sheet_name: str, timer=None):
+    """stream 引擎：read-only 開檔，不建立整張表的 cell 物件；不存在的表回傳 None。"""
+    timer = timer or _no_timer
+    from openpyxl import load_workbook
+    with timer("load_workbook"):
+        wb = load_workbook(xlsx_path, read_only=True, data_only=True)
+    try:
+        if sheet_name not in wb.sheetnames:
+            return None
+        return parse_pins_readonly(wb[sheet_name], timer)
+    finally:
+        wb.close()
+
+def parse_pins_readonly(ws, timer=None):
+    """stream 引擎的本體：ws 來自 read-only workbook（批次處理同一個檔案的多張表時共用一份）。"""
+    timer = timer or _no_timer
+    with timer("sheet_index"):
+        idx = SheetTextIndex(ws, row_cols=100)
+    return parse_pins_from_index(idx, stream_pin_rows, timer)
+
+
+# === 增量重新上傳：每張表的內容指紋 + pin 差異 ===
+_NS_MAIN = "http://schemas.openxmlformats.org/spreadsheetml/2006/main"
+_NS_R = "http://schemas.openxmlformats.org/officeDocument/2006/relationships"
+_NS_PR = "http://schemas.openxmlformats.org/package/2006/relationships"
+_FP_VERSION = "1"
+
+def _rels_of(zf, names, part: str) -> Dict[str, tuple]:
+    """讀某個 part 的 .rels：{rId: (Type 尾段, 解析後的 zip 路徑)}。"""
+    rels_path = pp.join(pp.dirname(part), "_rels", pp.basename(part) + ".rels")
+    out = {}
+    if rels_path not in names:
+        return out
+    for rel in ET.fromstring(zf.read(rels_path)).iter(f"{{{_NS_PR}}}Relationship"):
+        if rel.attrib.get("TargetMode") == "External":
+            continue
+        tgt = rel.attrib.get("Target", "")
+        path = tgt.lstrip("/") if tgt.startswith("/") else pp.normpath(pp.join(pp.dirname(part), tgt))
+        out[rel.attrib.get("Id", "")] = (rel.attrib.get("Type", "").rsplit("/", 1)[-1], path)
+    return out
+
+def _shared_strings(zf, names, wb_rels) -> list:
+    path = next((p for t, p in wb_rels.values() if t == "sharedStrings"), "xl/sharedStrings.xml")
+    if path not in names:
+        return []
+    out = []
+    for si in ET.fromstring(zf.read(path)).iter(f"{{{_NS_MAIN}}}si"):
+        # 只取文字（rich text 的各段接起來），字型等格式不算
+        out.append("".join(t.text or "" for t in si.iter(f"{{{_NS_MAIN}}}t")))
+    return out
+
+def sheet_fingerprints(xlsx_path: str) -> Dict[str, str]:
+    """
+    每張工作表的內容指紋 {sheet_name: sha256}。只納入會影響解析結果的內容：
+      - 每個儲存格的位置、型別、樣式編號、值（共用字串換成實際文字，別張表改字造成的索引位移不算變動）
+      - 合併儲存格
+      - drawing XML、其 rels 與引用到的影像內容
+    選取範圍、欄寬列高等「存檔就會變」的檢視資訊不算。
+    """
+    c_tag, v_tag, is_tag, t_tag = (f"{{{_NS_MAIN}}}{n}" for n in ("c", "v", "is", "t"))
+    merge_tag = f"{{{_NS_MAIN}}}mergeCell"
+    media_digest: Dict[str, str] = {}
+
+    with zipfile.ZipFile(xlsx_path, "r") as zf:
+        names = set(zf.namelist())
+        wb_rels = _rels_of(zf, names, "xl/workbook.xml")
+        sst = _shared_strings(zf, names, wb_rels)
+        out = {}
+        for s in ET.fromstring(zf.read("xl/workbook.xml")).iter(f"{{{_NS_MAIN}}}sheet"):
+            name = s.attrib.get("name", "")
+            rel = wb_rels.get(s.attrib.get(f"{{{_NS_R}}}id", ""))
+            if not rel or rel[1] not in names:
+                continue
+            ws_path = rel[1]
+            h = hashlib.sha256(_FP_VERSION.encode())
+
+            with zf.open(ws_path) as fp:
+                for _, el in ET.iterparse(fp, events=("end",)):
+                    if el.tag == c_tag:
+                        t = el.get("t")
+                        v = el.find(v_tag)
+                        val = v.text if v is not None else None
+                        if t == "s" and val is not None:
+                            try:
+                                val = sst[int(val)]
+                            except (ValueError, IndexError):
+                                pass
+                        elif t == "inlineStr":
+                            isel = el.find(is_tag)
+                            val = "".join(x.text or "" for x in isel.iter(t_tag)) if isel is not None else None
+                        h.update(repr((el.get("r"), t, el.get("s"), val)).encode("utf-8"))
+                        el.clear()
+                    elif el.tag == merge_tag:
+                        h.update(b"M" + (el.get("ref") or "").encode())
+
+            for typ, part in sorted(_rels_of(zf, names, ws_path).values()):
+                if typ != "drawing" or part not in names:
+                    continue
+                h.update(b"D" + zf.read(part))
+                for dtyp, media in sorted(_rels_of(zf, names, part).values()):
+                    h.update(f"R{dtyp}:{media}".encode("utf-8"))
+                    if dtyp == "image" and media in names:
+                        if media not in media_digest:
+                            mh = hashlib.sha256()
+                            with zf.open(media) as mf:
+                                for chunk in iter(lambda: mf.read(1024 * 1024), b""):
+                                    mh.update(chunk)
+                            media_digest[media] = mh.hexdigest()
+                        h.update(media_digest[media].encode())
+            out[name] = h.hexdigest()
+        return out
+
+def diff_pins(old_pins, new_pins, tol: float = 1e-6) -> Dict[str, Any]:
+    """
+    兩份 valid_pins 的差異（以 pin_no 對應；同一個 pin_no 出現多次時依出現順序配對）：
+      added / removed：只在一邊出現的 pin
+      moved：座標變了（附 from/to）
+      renamed：名稱變了
+    """
+    def group(pins):
+        g: Dict[str, list] = {}
+        for p in pins:
+            g.setdefault(str(p.get("pin_no")), []).append(p)
+        return g
+
+    old_g, new_g = group(old_pins or []), group(new_pins or [])
+    added, removed, moved, renamed = [], [], [], []
+    for key in list(old_g) + [k for k in new_g if k not in old_g]:
+        olds, news = old_g.get(key, []), new_g.get(key, [])
+        for o, n in zip(olds, news):
+            if abs(float(o["x"]) - float(n["x"])) > tol or abs(float(o["y"]) - float(n["y"])) > tol:
+                moved.append({"pin_no": n["pin_no"], "pin_name": n.get("pin_name"),
+                              "from": {"x": o["x"], "y": o["y"]}, "to": {"x": n["x"], "y": n["y"]}})
+            if (o.get("pin_name") or "") != (n.get("pin_name") or ""):
+                renamed.append({"pin_no": n["pin_no"], "from": o.get("pin_name"), "to": n.get("pin_name")})
+        removed.extend(olds[len(news):])
+        added.extend(news[len(olds):])
+    return {"added": added, "removed": removed, "moved": moved, "renamed": renamed}
@@ -0,0 +1,109 @@
+"""
+上傳後的背景預解析：依 sheets 清單順序，把每張有圖的工作表先解析好
+- 以 workbook 內容雜湊為鍵；同內容的多個 session 共用同一個工作
+- 每張表完成就記一筆事件（結果或錯誤），給輪詢端點與 SSE 串流讀取
+- 一次只跑一張表，遇到執行層滿載（ServerBusy）就稍等再試，不跟使用者的請求搶資源
+"""
+import asyncio
+import contextvars
+import os
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+from executor import ServerBusy
+
+
+# === 參數（可用環境變數覆寫） ===
+PREPARSE_ENABLED = os.getenv("PREPARSE", "1") == "1"
+PREPARSE_MAX_JOBS = 64          # 記憶體裡最多保留幾個工作（含已完成）
+BUSY_RETRY_SECONDS = 0.5
+
+
+class PreparseJob:
+    def __init__(self, key: str, sheets: List[str]):
+        self.key = key
+        self.sheets = list(sheets)
+        self.events: List[Dict[str, Any]] = []   # [{"sheet", "ok", "result"/"error", "seconds"}]
+        self.finished = False
+        self.started_at = time.time()
+        self.task: Optional[asyncio.Task] = None
+        self._changed = asyncio.Event()
+
+    def _notify(self):
+        self._changed.set()
+        self._changed = asyncio.Event()
+
+    async def wait_change(self, timeout: float) -> bool:
+        """等到有新事件（或逾時）；回傳是否有變化。"""
+        ev = self._changed
+        try:
+            await asyncio.wait_for(ev.wait(), timeout)
+            return True
+        except asyncio.TimeoutError:
+            return False
+
+    def progress(self) -> Dict[str, Any]:
+        done = {e["sheet"]: ("done" if e["ok"] else "error") for e in self.events}
+        return {
+            "state": "done" if self.finished else "running",
+            "total": len(self.sheets),
+            "done": len(self.events),
+            "sheets": [{"sheet": s, "status": done.get(s, "pending")} for s in self.sheets],
+        }
+
+
+class PreparseManager:
+    def __init__(self, max_jobs: int = PREPARSE_MAX_JOBS):
+        self.max_jobs = max_jobs
+        self._jobs: "OrderedDict[str, PreparseJob]" = OrderedDict()
+
+    def get(self, key: str) -> Optional[PreparseJob]:
+        return self._jobs.get(key)
+
+    def start(self, key: str, sheets: List[str],
+              work: Callable[[str], Awaitable[Dict[str, Any]]]) -> PreparseJob:
+        """開始（或沿用進行中/已完成的）預解析工作。必須在 event loop 裡呼叫。"""
+        job = self._jobs.get(key)
+        if job is not None and job.sheets == list(sheets):
+            self._jobs.move_to_end(key)
+            return job
+        if job is not None and job.task and not job.task.done():
+            job.task.cancel()
+        job = PreparseJob(key, sheets)
+        self._jobs[key] = job
+        while len(self._jobs) > self.max_jobs:
+            _, old = self._jobs.popitem(last=False)
+            if old.task and not old.task.done():
+                old.task.cancel()
+        # 乾淨的 context：背景工作的 stage 計時不算進觸發它的那個請求（Server-Timing）
+        job.task = asyncio.get_running_loop().create_task(self._run(job, work), context=contextvars.Context())
+        return job
+
+    async def _run(self, job: PreparseJob, work):
+        try:
+            for sheet in job.sheets:
+                t0 = time.perf_counter()
+                while True:
+                    try:
+                        result = await work(sheet)
+                        ev = {"sheet": sheet, "ok": True, "result": result}
+                        break
+                    except ServerBusy:
+                        await asyncio.sleep(BUSY_RETRY_SECONDS)
+                    except asyncio.CancelledError:
+                        raise
+                    except Exception as e:
+                        ev = {"sheet": sheet, "ok": False, "error": f"{type(e).__name__}: {e}"}
+                        break
+                ev["seconds"] = round(time.perf_counter() - t0, 4)
+                job.events.append(ev)
+                job._notify()
+        finally:
+            job.finished = True
+            job._notify()
+
+    def cancel_all(self):
+        for job in self._jobs.values():
+            if job.task and not job.task.done():
+                job.task.cancel()
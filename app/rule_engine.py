@@ -0,0 +1,140 @@
+"""
+腳位驗證規則引擎（伺服器端）：把 validation_rules.json 編譯成「以腳位號碼為鍵」的索引
+- 每個 pattern 只編譯一次；檔案 mtime/size 變動時才重新編譯
+- 判定結果與前端 applyInputColors() 一致：
+  1) 有名稱且在 forbidden_pins → forbidden（red-alert）
+  2) 腳位屬於某條規則（依檔案順序取第一條）→ 名稱轉大寫後符合任一 pattern 為 pass（規則顏色），否則 fail（red-alert）
+  3) 其他 → 不判定，只給通用顏色（VSS/GND 綠、VDD… 粉、空白灰）
+- 驗證一張表的成本是 O(腳位數)：每個腳位只查一次 dict
+"""
+import re
+import threading
+from typing import Any, Callable, Dict, List, Optional
+
+from json_cache import JsonFileCache, JsonSnapshot
+
+
+RED_ALERT = "red-alert"
+GROUND_KEYS = ("VSS", "GND")
+POWER_KEYS = ("VDD", "VDP", "VCC", "VCCIO", "VDDIO")
+
+
+def classify_label(val: str) -> Optional[str]:
+    """通用顏色（對應前端 classifyInputLabel）。"""
+    u = (val or "").upper()
+    if not u:
+        return "gray"
+    if any(k in u for k in GROUND_KEYS):
+        return "green"
+    if any(k in u for k in POWER_KEYS):
+        return "pink"
+    return None
+
+
+def _js_string(v: Any) -> str:
+    """模擬 JS 的 String(v)（forbidden_pins 在前端會先 map(String) 再比對）。"""
+    if isinstance(v, bool):
+        return "true" if v else "false"
+    if isinstance(v, float) and v.is_integer():
+        return str(int(v))
+    if v is None:
+        return "null"
+    return str(v)
+
+
+def _compile_pattern(pat: Any) -> Callable[[str], bool]:
+    """pattern 可編譯就當 regex（search 語意，同 JS RegExp.test）；編不過就退回完全相等。"""
+    pat = _js_string(pat)
+    try:
+        # re.ASCII：讓 \d \w \b 的行為跟 JS 一樣只認 ASCII
+        rx = re.compile(pat, re.ASCII)
+    except re.error:
+        return lambda u: pat == u
+    return lambda u: rx.search(u) is not None
+
+
+class CompiledRule:
+    def __init__(self, rule: Dict[str, Any]):
+        self.id = rule.get("id")
+        self.color = rule.get("color")
+        self.description = rule.get("description")
+        pats = rule.get("allowed_patterns") or []
+        self.matchers = [_compile_pattern(p) for p in pats] if isinstance(pats, list) else []
+
+    def accepts(self, upper_name: str) -> bool:
+        return any(m(upper_name) for m in self.matchers)
+
+
+class CompiledRules:
+    """一份規則檔的編譯結果（不可變，可在多執行緒間共用）。"""
+
+    def __init__(self, data: Dict[str, Any], version: str = ""):
+        self.data = data
+        self.version = version
+        self.forbidden = {_js_string(p) for p in (data.get("forbidden_pins") or [])}
+        self.by_pin: Dict[str, CompiledRule] = {}
+        for rule in data.get("rules") or []:
+            if not isinstance(rule, dict):
+                continue
+            compiled = CompiledRule(rule)
+            for pin in rule.get("pins") or []:
+                # 前端是 rule.pins.includes(字串)：只有字串腳位會命中；同一腳位以第一條規則為準
+                if isinstance(pin, str):
+                    self.by_pin.setdefault(pin, compiled)
+
+    def verdict(self, pin_no: Any, pin_name: Any) -> Dict[str, Any]:
+        """單一腳位的判定：{"verdict": "pass"/"fail"/"forbidden"/None, "color": ..., "rule_id": ...}"""
+        key = _js_string(pin_no).strip()
+        val = ("" if pin_name is None else str(pin_name)).strip()
+        if val and key in self.forbidden:
+            return {"verdict": "forbidden", "color": RED_ALERT, "rule_id": None}
+        rule = self.by_pin.get(key)
+        if rule is not None:
+            if rule.accepts(val.upper()):
+                return {"verdict": "pass", "color": rule.color, "rule_id": rule.id}
+            return {"verdict": "fail", "color": RED_ALERT, "rule_id": rule.id}
+        return {"verdict": None, "color": classify_label(val), "rule_id": None}
+
+    def verdicts(self, pins: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """整張表（/parse_pins 的 valid_pins）逐一判定，順序與輸入相同。"""
+        out = []
+        for p in pins:
+            v = self.verdict(p.get("pin_no"), p.get("pin_name"))
+            v["pin_no"] = p.get("pin_no")
+            out.append(v)
+        return out
+
+
+EMPTY_RULES = {"rules": [], "forbidden_pins": []}
+
+
+class RuleEngine:
+    """規則檔的快取：檔案沒變就一直用同一份編譯結果（原始內容 / ETag 由 JsonFileCache 管）。"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self.doc = JsonFileCache(path, transform=lambda raw: dict(EMPTY_RULES) if raw is None else raw)
+        self._snap: Optional[JsonSnapshot] = None
+        self._compiled: Optional[CompiledRules] = None
+        self._lock = threading.Lock()
+
+    def _compile(self, snap: JsonSnapshot) -> CompiledRules:
+        with self._lock:
+            if self._compiled is None or self._snap is not snap:
+                self._compiled, self._snap = CompiledRules(snap.data, snap.version), snap
+            return self._compiled
+
+    def get(self) -> CompiledRules:
+        """取最新的編譯結果；檔案壞掉（JSON 錯誤）時丟出例外，由呼叫端決定怎麼回應。"""
+        return self._compile(self.doc.get())
+
+    def snapshot(self) -> JsonSnapshot:
+        """目前規則檔的內容（含序列化好的本體與 ETag），給 GET /api/rules。"""
+        return self.doc.get()
+
+    def save(self, data: Dict[str, Any]) -> CompiledRules:
+        """原子覆寫規則檔，並立即換上新的編譯結果。"""
+        return self._compile(self.doc.update(lambda _raw: data))
+
+    def invalidate(self):
+        self.doc.invalidate()
@@ -0,0 +1,191 @@
+"""
+Session 生命週期管理：uploads/ 不再只進不出
+- 每個 session 目錄有 .last_access（以 mtime 記錄最後存取時間，多個 worker 共用也沒問題）
+- 背景清掃：超過 TTL 的 session 會被清空，只留下 .expired 墓碑，讓端點回「session expired」
+- 總容量配額：uploads/ 超過上限時，依最後存取時間（LRU）由舊到新逐一過期
+- store（內容定址儲存區）裡沒有任何存活 session 參照的內容，過了寬限期就刪掉
+"""
+import os
+import shutil
+import time
+from typing import Callable, Dict, List, Optional
+
+
+# === 參數（可用環境變數覆寫） ===
+SESSION_TTL_HOURS = float(os.getenv("SESSION_TTL_HOURS", "72"))
+SESSION_QUOTA_MB = float(os.getenv("SESSION_QUOTA_MB", "5120"))
+SESSION_SWEEP_SECONDS = float(os.getenv("SESSION_SWEEP_SECONDS", "600"))
+# 墓碑保留多久（之後連目錄一起刪，前端只會拿到一般的 not found）
+SESSION_TOMBSTONE_HOURS = float(os.getenv("SESSION_TOMBSTONE_HOURS", "168"))
+# store 內容沒人參照後的寬限期（避免跟正在進行中的上傳搶）
+STORE_GRACE_SECONDS = 600
+
+ACCESS_MARK = ".last_access"
+EXPIRED_MARK = ".expired"
+TOUCH_INTERVAL = 60  # 同一個 session 最多每 60 秒更新一次 mtime
+
+
+def _dir_bytes(path: str) -> int:
+    total = 0
+    for root, _, files in os.walk(path):
+        for fn in files:
+            try:
+                total += os.lstat(os.path.join(root, fn)).st_size
+            except OSError:
+                pass
+    return total
+
+
+class SessionManager:
+    def __init__(self, upload_dir: str, store_dir: str, ttl_seconds: float, quota_bytes: int,
+                 tombstone_seconds: float,
+                 content_digest: Callable[[str], Optional[str]],
+                 on_store_removed: Optional[Callable[[str], None]] = None,
+                 on_session_expired: Optional[Callable[[str], None]] = None):
+        self.upload_dir = upload_dir
+        self.store_dir = store_dir
+        self.ttl_seconds = ttl_seconds
+        self.quota_bytes = quota_bytes
+        self.tombstone_seconds = tombstone_seconds
+        self._content_digest = content_digest      # sess_dir → 參照的 store 雜湊（舊版 session 回 None）
+        self._on_store_removed = on_store_removed  # 刪 store 內容時通知（例如作廢 workbook 快取）
+        self._on_session_expired = on_session_expired  # session 過期時通知（例如移除共用的 session 索引）
+
+    # --- 單一 session ---
+    def _is_session_dir(self, sess_dir: str) -> bool:
+        """sess_dir 解析後（含符號連結）必須直接位於 upload_dir 底下。"""
+        real = os.path.realpath(sess_dir)
+        return (os.path.dirname(real) == os.path.realpath(self.upload_dir)
+                and not os.path.basename(real).startswith(("_", ".")))
+
+    def touch(self, sess_dir: str):
+        """記錄最後存取時間（節流，避免每個請求都寫磁碟）；不在 upload_dir 裡的路徑一律不碰。"""
+        if not self._is_session_dir(sess_dir):
+            return
+        mark = os.path.join(sess_dir, ACCESS_MARK)
+        now = time.time()
+        try:
+            if now - os.stat(mark).st_mtime < TOUCH_INTERVAL:
+                return
+            os.utime(mark, (now, now))
+        except FileNotFoundError:
+            if os.path.isdir(sess_dir):
+                open(mark, "a").close()
+        except OSError:
+            pass
+
+    def last_access(self, sess_dir: str) -> float:
+        for p in (os.path.join(sess_dir, ACCESS_MARK), sess_dir):
+            try:
+                return os.stat(p).st_mtime
+            except OSError:
+                continue
+        return 0.0
+
+    def is_expired(self, sess_dir: str) -> bool:
+        return os.path.exists(os.path.join(sess_dir, EXPIRED_MARK))
+
+    def expire(self, sess_dir: str):
+        """清空 session 內容，只留墓碑。"""
+        for name in os.listdir(sess_dir):
+            p = os.path.join(sess_dir, name)
+            if os.path.isdir(p) and not os.path.islink(p):
+                shutil.rmtree(p, ignore_errors=True)
+            else:
+                try:
+                    os.remove(p)
+                except OSError:
+                    pass
+        open(os.path.join(sess_dir, EXPIRED_MARK), "w").close()
+        if self._on_session_expired:
+            self._on_session_expired(sess_dir)
+
+    # --- 清掃 ---
+    def _session_dirs(self) -> List[str]:
+        out = []
+        for name in os.listdir(self.upload_dir):
+            p = os.path.join(self.upload_dir, name)
+            # "_" 開頭是系統目錄（例如 _store），檔案（例如 notices.json）也不碰
+            if name.startswith("_") or name.startswith(".") or not os.path.isdir(p):
+                continue
+            out.append(p)
+        return out
+
+    def _gc_store(self, live_digests: set, now: float) -> List[str]:
+        """刪掉沒人參照、且過了寬限期的 store 內容；回傳被刪的雜湊清單。"""
+        removed = []
+        if not os.path.isdir(self.store_dir):
+            return removed
+        for name in os.listdir(self.store_dir):
+            p = os.path.join(self.store_dir, name)
+            if not os.path.isdir(p):
+                continue
+            if name.startswith("_"):
+                # _incoming：中斷的上傳暫存檔
+                for fn in os.listdir(p):
+                    fp = os.path.join(p, fn)
+                    try:
+                        if now - os.stat(fp).st_mtime > STORE_GRACE_SECONDS:
+                            os.remove(fp)
+                    except OSError:
+                        pass
+                continue
+            if name in live_digests:
+                continue
+            try:
+                if now - os.stat(p).st_mtime < STORE_GRACE_SECONDS:
+                    continue
+            except OSError:
+                continue
+            shutil.rmtree(p, ignore_errors=True)
+            removed.append(name)
+            if self._on_store_removed:
+                self._on_store_removed(name)
+        return removed
+
+    def sweep(self) -> Dict[str, int]:
+        """跑一輪清掃：TTL → store GC → 配額（LRU）。回傳統計。"""
+        now = time.time()
+        stats = {"expired_ttl": 0, "expired_quota": 0, "tombstones_removed": 0, "store_removed": 0}
+
+        live = []  # [(last_access, sess_dir, digest)]
+        for sess_dir in self._session_dirs():
+            if self.is_expired(sess_dir):
+                try:
+                    if now - os.stat(os.path.join(sess_dir, EXPIRED_MARK)).st_mtime > self.tombstone_seconds:
+                        shutil.rmtree(sess_dir, ignore_errors=True)
+                        stats["tombstones_removed"] += 1
+                except OSError:
+                    pass
+                continue
+            ts = self.last_access(sess_dir)
+            if now - ts > self.ttl_seconds:
+                self.expire(sess_dir)
+                stats["expired_ttl"] += 1
+                continue
+            live.append((ts, sess_dir, self._content_digest(sess_dir)))
+
+        stats["store_removed"] += len(self._gc_store({d for _, _, d in live if d}, now))
+        if self.quota_bytes <= 0:
+            return stats
+
+        # 配額：由最久沒用的 session 開始過期，直到總量低於上限
+        used = _dir_bytes(self.upload_dir)
+        if used <= self.quota_bytes:
+            return stats
+        store_bytes = {}
+        if os.path.isdir(self.store_dir):
+            for name in os.listdir(self.store_dir):
+                if not name.startswith("_"):
+                    store_bytes[name] = _dir_bytes(os.path.join(self.store_dir, name))
+        live.sort()
+        while used > self.quota_bytes and live:
+            _, sess_dir, _ = live.pop(0)
+            used -= _dir_bytes(sess_dir)
+            self.expire(sess_dir)
+            stats["expired_quota"] += 1
+            # 過期後 store 內容可能也沒人參照了（仍遵守寬限期）
+            for name in self._gc_store({d for _, _, d in live if d}, now):
+                used -= store_bytes.get(name, 0)
+                stats["store_removed"] += 1
+        return stats
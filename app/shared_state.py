@@ -0,0 +1,119 @@
+"""
+多 worker（uvicorn --workers N）共用的狀態
+- file_lock()：fcntl.flock 檔案鎖，跨行程互斥（同一行程內不同 fd 之間也互斥）
+  Windows 沒有 fcntl：退回行程內的 threading.Lock（只適用單一 worker）
+- SharedState：uploads/_state.db（SQLite，WAL 模式，多個行程可同時讀）
+    sessions：session id → store 內容雜湊（查 session 不必再開 content.json）
+    generations：具名版本號；某個 worker 作廢共用資料時 bump，其他 worker 比對版本號後整理自己的快取
+檔案型的設定（notices.json、validation_rules.json）本來就以 mtime/size 判斷是否重讀，各 worker 自然一致，
+這裡只負責它們「寫入」時的互斥。
+"""
+import contextlib
+import os
+import sqlite3
+import threading
+import time
+from typing import Dict, Iterable, Optional
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+
+_LOCAL_LOCKS: Dict[str, threading.Lock] = {}
+_LOCAL_LOCKS_GUARD = threading.Lock()
+
+
+@contextlib.contextmanager
+def file_lock(path: str, shared: bool = False, blocking: bool = True):
+    """
+    以 path 為鎖檔的跨行程鎖；yield 是否拿到鎖（blocking=False 時可能是 False）。
+    鎖檔本身不刪（刪了別的行程可能鎖在舊的 inode 上）。
+    """
+    if fcntl is None:
+        with _LOCAL_LOCKS_GUARD:
+            lock = _LOCAL_LOCKS.setdefault(os.path.abspath(path), threading.Lock())
+        got = lock.acquire(blocking)
+        try:
+            yield got
+        finally:
+            if got:
+                lock.release()
+        return
+
+    fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+    try:
+        flags = fcntl.LOCK_SH if shared else fcntl.LOCK_EX
+        if not blocking:
+            flags |= fcntl.LOCK_NB
+        try:
+            fcntl.flock(fd, flags)
+            got = True
+        except BlockingIOError:
+            got = False
+        try:
+            yield got
+        finally:
+            if got:
+                fcntl.flock(fd, fcntl.LOCK_UN)
+    finally:
+        os.close(fd)
+
+
+class SharedState:
+    def __init__(self, db_path: str):
+        self.db_path = db_path
+        self._local = threading.local()
+        self._init_schema()
+
+    def _conn(self) -> sqlite3.Connection:
+        """每個執行緒各自一條連線（sqlite3 連線不能跨執行緒共用）。"""
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=10, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def _init_schema(self):
+        # 多個 worker 同時啟動：建表用檔案鎖排隊，避免 "database is locked"
+        with file_lock(self.db_path + ".lock"):
+            self._conn().executescript("""
+                CREATE TABLE IF NOT EXISTS sessions (
+                    sid     TEXT PRIMARY KEY,
+                    digest  TEXT NOT NULL,
+                    created REAL NOT NULL
+                );
+                CREATE TABLE IF NOT EXISTS generations (
+                    name TEXT PRIMARY KEY,
+                    gen  INTEGER NOT NULL
+                );
+            """)
+
+    # --- sessions ---
+    def register_session(self, sid: str, digest: str):
+        self._conn().execute(
+            "INSERT OR REPLACE INTO sessions (sid, digest, created) VALUES (?, ?, ?)",
+            (sid, digest, time.time()))
+
+    def session_digest(self, sid: str) -> Optional[str]:
+        row = self._conn().execute("SELECT digest FROM sessions WHERE sid = ?", (sid,)).fetchone()
+        return row[0] if row else None
+
+    def forget_sessions(self, sids: Iterable[str]):
+        sids = list(sids)
+        if sids:
+            self._conn().executemany("DELETE FROM sessions WHERE sid = ?", [(s,) for s in sids])
+
+    # --- 跨 worker 作廢 ---
+    def bump(self, name: str) -> int:
+        conn = self._conn()
+        conn.execute("INSERT INTO generations (name, gen) VALUES (?, 1) "
+                     "ON CONFLICT(name) DO UPDATE SET gen = gen + 1", (name,))
+        return self.generation(name)
+
+    def generation(self, name: str) -> int:
+        row = self._conn().execute("SELECT gen FROM generations WHERE name = ?", (name,)).fetchone()
+        return row[0] if row else 0
@@ -0,0 +1,451 @@
+"""
+伺服器端快照繪製：用 Pillow 畫出與前端舞台（#stage）相同的畫面，取代瀏覽器的 html2canvas 截圖
+- 版面常數（標籤/文字框位置、EPAD 黃色區、HUD 膠囊）與 app.js / style.css 相同
+- 點/線的分圈、交叉偵測走 geometry.analyze（與前端 drawPinsAndLines / checkLineIntersections 同一套規則）
+- 文字框顏色走 rule_engine（與前端 applyInputColors 同一套規則）
+- 輸出 PNG，解析度為舞台 780×1020 的 SNAPSHOT_SCALE 倍（預設 2，與 html2canvas scale: 2 相同）
+- Pillow 在繪製時才 import，web 行程 import 本模組（只拿常數）不必載入
+render_snapshot() 的參數全是可 pickle 的基本型別，可以丟到 cpu 池執行。
+"""
+import functools
+import math
+import os
+import re
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+
+import geometry
+from rule_engine import CompiledRules, classify_label
+
+
+# === 參數（可用環境變數覆寫） ===
+SNAPSHOT_SCALE = float(os.getenv("SNAPSHOT_SCALE", "2"))
+SNAPSHOT_FONT = os.getenv("SNAPSHOT_FONT", "")            # 一般字型檔（需含中文，HUD 有中文字）
+SNAPSHOT_FONT_BOLD = os.getenv("SNAPSHOT_FONT_BOLD", "")  # 粗體字型檔；空白則用一般字型
+OVERLAY_SUPERSAMPLE = 2                                   # 點/線先畫在 2 倍大的圖層再縮小（抗鋸齒）
+
+# 找不到 SNAPSHOT_FONT 時依序嘗試（Docker 映像裝的是 fonts-noto-cjk）
+_FONT_CANDIDATES = (
+    "/usr/share/fonts/opentype/noto/NotoSansCJK-Regular.ttc",
+    "/usr/share/fonts/noto-cjk/NotoSansCJK-Regular.ttc",
+    "C:/Windows/Fonts/msjh.ttc",
+    "/System/Library/Fonts/PingFang.ttc",
+    "/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf",
+)
+_BOLD_CANDIDATES = (
+    "/usr/share/fonts/opentype/noto/NotoSansCJK-Bold.ttc",
+    "/usr/share/fonts/noto-cjk/NotoSansCJK-Bold.ttc",
+    "C:/Windows/Fonts/msjhbd.ttc",
+    "/usr/share/fonts/truetype/dejavu/DejaVuSans-Bold.ttf",
+)
+
+# === 舞台版面（app.js） ===
+STAGE_W, STAGE_H = 780, 1020
+LEFT_LABELS = ["A", "B", "2", "3", "6", "7", "8", "9", "11", "14", "15", "17", "18", "19", "22", "23", "24", "25", "28", "C", "D"]
+RIGHT_LABELS = ["J", "I", "79", "77", "75", "74", "73", "72", "69", "68", "65", "63", "61", "60", "59", "58", "57", "56", "53", "H", "G"]
+TOP_LABELS = ["P", "O", "N", "96", "95", "94", "93", "92", "91", "87", "85", "83", "81", "M", "L", "K"]
+BOTTOM_LABELS = ["E", "31", "32", "33", "35", "36", "37", "40", "41", "44", "45", "46", "47", "49", "50", "F"]
+STEP_V = STEP_H = 33
+LEFT_LABEL_X, LEFT_INPUT_X, LEFT_Y0 = 10, 35, 125
+RIGHT_LABEL_X, RIGHT_INPUT_X, RIGHT_Y0 = 735, 655, 125
+TOP_LABEL_Y, TOP_INPUT_Y, TOP_X0 = 10, 35, 125
+BOTTOM_LABEL_Y, BOTTOM_INPUT_Y, BOTTOM_X0 = 895, 815, 125
+PX_PER_UM_X = PX_PER_UM_Y = 0.08
+BASE_PIN_DOT_RADIUS = 1.0
+BASE_PIN_LINE_WIDTH = 1.0
+BIG_VIEW_RATIO = 0.9
+
+# 側邊標籤的固定底色（buildSideUI）
+LABEL_HIGHLIGHT = {
+    "17": "blue", "18": "blue", "19": "blue", "22": "blue", "9": "pink", "11": "green",
+    "56": "blue", "57": "blue", "58": "blue", "59": "blue", "61": "pink", "60": "green",
+    "87": "pink", "92": "pink", "91": "green", "41": "pink", "40": "green",
+}
+# 一個轉角只能打一條線（computeCornerConflictsFromValid）
+CORNER_PAIRS = (("D", "E"), ("F", "G"), ("A", "P"), ("K", "J"))
+
+# === 樣式（style.css） ===
+LABEL_SIZE = 25
+BOX_W, BOX_H = 80, 25
+FONT_PX = 12
+CLASS_COLORS = {"gray": "#dcdcdc", "green": "#90ee90", "pink": "#ffc0cb", "blue": "#add8e6", "red-alert": "#FF0000"}
+EPAD_W, EPAD_H = 400, 560
+EPAD_RECT = ((STAGE_W - EPAD_W) / 2, STAGE_H * 0.47 - EPAD_H / 2,
+             (STAGE_W + EPAD_W) / 2, STAGE_H * 0.47 + EPAD_H / 2)
+CONFLICT_COLOR = "#ff3b30"
+CONFLICT_WIDTH = 3
+MINMAX_COLOR = "#0000ff"
+HUD_H, HUD_PAD, HUD_GAP = 34, 12, 8
+
+# 匯出 Excel 時兩張圖各自的點線倍率（與原本前端 downloadExcelViaAPI 相同）
+VIEW_PIN_SCALE = {"1to1": 1.5, "zoom": 4.0}
+
+
+def norm_label(s: Any) -> str:
+    """app.js normLabel：去空白（含 NBSP）並轉大寫。"""
+    return "".join(str(s if s is not None else "").split()).replace("\u00a0", "").upper()
+
+
+@functools.lru_cache(maxsize=1)
+def label_slots() -> Dict[str, Dict[str, Any]]:
+    """
+    每個側邊標籤的位置（舞台座標）：
+    {label: {"side", "label_xy", "box": (l, t, r, b), "anchor": (x, y), "rotated"}}
+    box 是文字框實際佔的矩形（上/下排旋轉 90 度後）；anchor 是朝向晶片那一邊的中點（innerAnchorOfBox）。
+    """
+    slots = {}
+    for i, lab in enumerate(LEFT_LABELS):
+        x, y = LEFT_INPUT_X, LEFT_Y0 + i * STEP_V
+        slots[lab] = {"side": "left", "label_xy": (LEFT_LABEL_X, y), "box": (x, y, x + BOX_W, y + BOX_H),
+                      "anchor": (x + BOX_W, y + BOX_H / 2), "rotated": False}
+    for i, lab in enumerate(RIGHT_LABELS):
+        x, y = RIGHT_INPUT_X, RIGHT_Y0 + i * STEP_V
+        slots[lab] = {"side": "right", "label_xy": (RIGHT_LABEL_X, y), "box": (x, y, x + BOX_W, y + BOX_H),
+                      "anchor": (x, y + BOX_H / 2), "rotated": False}
+    # 上/下排：以左上角為軸順時針轉 90 度 → 佔 (x-25, y) 到 (x, y+80)
+    for i, lab in enumerate(TOP_LABELS):
+        x, y = TOP_X0 + 25 + i * STEP_H, TOP_INPUT_Y
+        slots[lab] = {"side": "top", "label_xy": (TOP_X0 + i * STEP_H, TOP_LABEL_Y),
+                      "box": (x - BOX_H, y, x, y + BOX_W), "anchor": (x - BOX_H / 2, y + BOX_W), "rotated": True}
+    for i, lab in enumerate(BOTTOM_LABELS):
+        x, y = BOTTOM_X0 + 25 + i * STEP_H, BOTTOM_INPUT_Y
+        slots[lab] = {"side": "bottom", "label_xy": (BOTTOM_X0 + i * STEP_H, BOTTOM_LABEL_Y),
+                      "box": (x - BOX_H, y, x, y + BOX_W), "anchor": (x - BOX_H / 2, y), "rotated": True}
+    return slots
+
+
+@functools.lru_cache(maxsize=1)
+def _slots_by_norm() -> Dict[str, str]:
+    out = {}
+    for lab in label_slots():
+        out[norm_label(lab)] = lab  # 同 inputsByLabelNorm：後面的覆蓋前面的
+    return out
+
+
+def slot_for_pin(pin_no: Any) -> Optional[str]:
+    """pin_no 對應的標籤（先完全相同，再比對正規化後的字串）；沒有對應回 None（前端會當無法連線）。"""
+    key = "" if pin_no is None else str(pin_no)
+    if key in label_slots():
+        return key
+    return _slots_by_norm().get(norm_label(key))
+
+
+def inner_frame() -> Tuple[float, float, float, float]:
+    """四側文字框內側圍出的矩形（measureInnerPinFrame）。"""
+    boxes = [(s["side"], s["box"]) for s in label_slots().values()]
+    return (max(b[2] for side, b in boxes if side == "left"),
+            max(b[3] for side, b in boxes if side == "top"),
+            min(b[0] for side, b in boxes if side == "right"),
+            min(b[1] for side, b in boxes if side == "bottom"))
+
+
+def image_rect(chip_w: float, chip_h: float, view: str) -> Tuple[float, float, float, float]:
+    """晶片圖在舞台上的位置（applyViewMode）：1to1 = chip size 換算像素、置中於內框；zoom = 放大到 EPAD 區 0.9 倍。"""
+    w, h = chip_w * PX_PER_UM_X, chip_h * PX_PER_UM_Y
+    if view == "zoom":
+        l, t, r, b = EPAD_RECT
+        s = BIG_VIEW_RATIO * min((r - l) / w, (b - t) / h)
+        w, h = w * s, h * s
+    else:
+        l, t, r, b = inner_frame()
+    left = l + (r - l - w) / 2
+    top = t + (b - t - h) / 2
+    return left, top, left + w, top + h
+
+
+def ring_mate(base_hex: str) -> str:
+    """內圈顏色（app.js ringMate）。"""
+    b = (base_hex or "").upper()
+    return {"#BEBEBE": "#00EC00", "#00EC00": "#00CACA", "#00CACA": "#BEBEBE"}.get(b, "#00EC00")
+
+
+def judge_wire_type(pad_window: str, cup: str) -> str:
+    """CUP 為空或 [no msg]、且 PadWindow >= 65x65 → 鋁線，其他金線（app.js judgeWireType）。"""
+    c = (cup or "").strip().lower()
+    nums = re.findall(r"\d+(?:\.\d+)?", pad_window or "")
+    w = float(nums[0]) if nums else 0.0
+    h = float(nums[1]) if len(nums) >= 2 else w
+    return "鋁線" if (not c or c == "[no msg]") and w >= 65 and h >= 65 else "金線"
+
+
+# === 字型 ===
+@functools.lru_cache(maxsize=32)
+def _font(px: int, bold: bool = False):
+    from PIL import ImageFont
+    paths = []
+    if bold and SNAPSHOT_FONT_BOLD:
+        paths.append(SNAPSHOT_FONT_BOLD)
+    if SNAPSHOT_FONT:
+        paths.append(SNAPSHOT_FONT)
+    paths.extend(_BOLD_CANDIDATES if bold else ())
+    paths.extend(_FONT_CANDIDATES)
+    for path in paths:
+        if os.path.exists(path):
+            try:
+                return ImageFont.truetype(path, px)
+            except OSError:
+                continue
+    return ImageFont.load_default(size=px)
+
+
+def _fit_text(text: str, font, max_w: float) -> str:
+    """超出寬度就截斷加「…」（text-overflow: ellipsis）。"""
+    if font.getlength(text) <= max_w:
+        return text
+    while text and font.getlength(text + "…") > max_w:
+        text = text[:-1]
+    return text + "…"
+
+
+def _rgba(hex_color: str, alpha: float = 1.0) -> Tuple[int, int, int, int]:
+    h = (hex_color or "#000000").lstrip("#")
+    if len(h) == 3:
+        h = "".join(ch * 2 for ch in h)
+    try:
+        r, g, b = int(h[0:2], 16), int(h[2:4], 16), int(h[4:6], 16)
+    except ValueError:
+        r = g = b = 0
+    return r, g, b, round(255 * alpha)
+
+
+# === 繪製 ===
+class _Canvas:
+    """以舞台座標下指令，內部乘上 scale。"""
+
+    def __init__(self, scale: float):
+        from PIL import Image, ImageDraw
+        self.s = scale
+        self.im = Image.new("RGBA", (round(STAGE_W * scale), round(STAGE_H * scale)), (255, 255, 255, 255))
+        self.draw = ImageDraw.Draw(self.im)
+
+    def box(self, l, t, r, b):
+        s = self.s
+        return [round(l * s), round(t * s), round(r * s) - 1, round(b * s) - 1]
+
+    def rounded(self, rect, radius, fill=None, outline=None, width=1):
+        self.draw.rounded_rectangle(self.box(*rect), radius=round(radius * self.s), fill=fill,
+                                    outline=outline, width=max(1, round(width * self.s)))
+
+    def text(self, xy, text, px, fill, bold=False, anchor="mm"):
+        self.draw.text((xy[0] * self.s, xy[1] * self.s), text, font=_font(round(px * self.s), bold),
+                       fill=fill, anchor=anchor)
+
+    def text_width(self, text, px, bold=False) -> float:
+        return _font(round(px * self.s), bold).getlength(text) / self.s
+
+
+def _draw_dashed_rounded(cv: _Canvas, rect, radius, color, width, dash=(6, 4)):
+    """虛線圓角框（border: dashed）：直邊畫虛線，四個圓角畫實線弧。"""
+    l, t, r, b = rect
+    w = width
+    for a, b_ in (((l + radius, t + w / 2), (r - radius, t + w / 2)),
+                  ((l + radius, b - w / 2), (r - radius, b - w / 2)),
+                  ((l + w / 2, t + radius), (l + w / 2, b - radius)),
+                  ((r - w / 2, t + radius), (r - w / 2, b - radius))):
+        length = math.dist(a, b_)
+        ux, uy = (b_[0] - a[0]) / length, (b_[1] - a[1]) / length
+        pos = 0.0
+        while pos < length:
+            end = min(length, pos + dash[0])
+            cv.draw.line([(a[0] + ux * pos) * cv.s, (a[1] + uy * pos) * cv.s,
+                          (a[0] + ux * end) * cv.s, (a[1] + uy * end) * cv.s],
+                         fill=color, width=max(1, round(w * cv.s)))
+            pos = end + dash[1]
+    d = 2 * radius
+    for box, start in (((l, t, l + d, t + d), 180), ((r - d, t, r, t + d), 270),
+                       ((r - d, b - d, r, b), 0), ((l, b - d, l + d, b), 90)):
+        cv.draw.arc(cv.box(*box), start, start + 90, fill=color, width=max(1, round(w * cv.s)))
+
+
+def _draw_box(cv: _Canvas, slot, text: str, color: Optional[str]):
+    """文字框（.pin-box）：上/下排先畫成橫的再轉 90 度貼上。"""
+    from PIL import Image, ImageDraw
+    s = cv.s
+    w, h = round(BOX_W * s), round(BOX_H * s)
+    tile = Image.new("RGBA", (w, h), (0, 0, 0, 0))
+    d = ImageDraw.Draw(tile)
+    alert = color == "red-alert"
+    fill = _rgba(CLASS_COLORS.get(color, "#ffffff"))
+    d.rounded_rectangle([0, 0, w - 1, h - 1], radius=round(4 * s), fill=fill,
+                        outline=_rgba("#cccccc"), width=max(1, round(s)))
+    font = _font(round(FONT_PX * s), bold=alert)
+    shown = _fit_text(text, font, w - 2 * round(s))
+    d.text((w / 2, h / 2), shown, font=font, fill=(255, 255, 255, 255) if alert else (0, 0, 0, 255), anchor="mm")
+    if slot["rotated"]:
+        tile = tile.transpose(Image.Transpose.ROTATE_270)  # 順時針 90 度
+    l, t, _, _ = slot["box"]
+    cv.im.alpha_composite(tile, (round(l * s), round(t * s)))
+
+
+def _draw_hud(cv: _Canvas, project_code: str, stamp_text: str, extras: Optional[Dict[str, Any]]):
+    """底部兩排 HUD 膠囊（.stage-hud）。"""
+    from PIL import Image, ImageDraw
+    bg, border, ink = _rgba("#ffffff", 0.92), _rgba("#dddddd"), _rgba("#333333")
+    overlay = Image.new("RGBA", cv.im.size, (0, 0, 0, 0))
+    hud = _Canvas(cv.s)
+    hud.im, hud.draw = overlay, ImageDraw.Draw(overlay)
+
+    def capsule(left, top, width, parts):
+        hud.rounded((left, top, left + width, top + HUD_H), HUD_H / 2, fill=bg, outline=border)
+        x = left + HUD_PAD
+        for text, bold, color in parts:
+            hud.text((x, top + HUD_H / 2), text, FONT_PX, color, bold=bold, anchor="lm")
+            x += hud.text_width(text, FONT_PX, bold)
+
+    # 下排：Project Code（撐滿）＋ 時間（靠右）
+    top = STAGE_H - 8 - HUD_H
+    time_w = hud.text_width(stamp_text, FONT_PX) + 2 * HUD_PAD
+    capsule(STAGE_W - 8 - time_w, top, time_w, [(stamp_text, False, _rgba("#777777"))])
+    capsule(8, top, STAGE_W - 16 - time_w - HUD_GAP,
+            [("Project Code：", False, _rgba("#333333", 0.7)), (project_code or "", True, ink)])
+
+    # 上排：PadWindow / CUP / Wire Type
+    if extras:
+        pw, cup = extras.get("PadWindow") or "", extras.get("CUP") or ""
+        values = [("PadWindow：", pw), ("CUP：", cup or "[no msg]"), ("Wire Type：", judge_wire_type(pw, cup))]
+    else:
+        values = [("PadWindow：", ""), ("CUP：", ""), ("Wire Type：", "")]
+    top = STAGE_H - 50 - HUD_H
+    x = 8
+    for name, val in values:
+        width = max(140, hud.text_width(name, FONT_PX) + hud.text_width(val, FONT_PX, True) + 2 * HUD_PAD)
+        capsule(x, top, width, [(name, False, ink), (val, True, ink)])
+        x += width + HUD_GAP
+    cv.im.alpha_composite(overlay)
+
+
+def render_snapshot(spec: Dict[str, Any], out_path: str) -> Tuple[int, int]:
+    """
+    依 spec 畫出舞台並存成 PNG，回傳 (寬, 高)。spec：
+      view：「1to1」（chip size 換算像素）或「zoom」（放大到 EPAD 區）
+      image_path：晶片圖（可為 None）；chip_w / chip_h：晶片尺寸（um）
+      pins：/parse_pins 的 valid_pins；rules：validation_rules.json 內容（None = 只用通用顏色）
+      project_code / extras（PadWindow、CUP）/ stamp_text：HUD 文字
+      pin_scale / pin_color / pin_color_inner / line_scope / offsets：同前端的 Pin 樣式與 MIN/MAX 內縮
+    """
+    from PIL import Image, ImageDraw
+    view = spec.get("view") or "1to1"
+    chip_w, chip_h = float(spec["chip_w"]), float(spec["chip_h"])
+    pin_scale = float(spec.get("pin_scale") or VIEW_PIN_SCALE.get(view, 1.5))
+    outer_color = spec.get("pin_color") or "#BEBEBE"
+    inner_color = spec.get("pin_color_inner") or ring_mate(outer_color)
+    off = {"left": 0.0, "right": 0.0, "top": 0.0, "bottom": 0.0, **(spec.get("offsets") or {})}
+    slots = label_slots()
+
+    # 1) pin → 文字框（沒有對應標籤的 pin 不畫，前端也會把它歸到「無法連線」）
+    texts = {lab: "" for lab in slots}
+    placed: List[Dict[str, Any]] = []
+    for p in spec.get("pins") or []:
+        lab = slot_for_pin(p.get("pin_no"))
+        if lab is None:
+            continue
+        texts[lab] = str(p.get("pin_name") or "").strip()
+        placed.append(p)
+
+    # 2) 文字框顏色（applyInputColors）
+    rules = CompiledRules(spec["rules"]) if spec.get("rules") is not None else None
+    colors = {lab: (rules.verdict(lab, text)["color"] if rules else classify_label(text)) for lab, text in texts.items()}
+
+    # 3) 晶片圖位置 → MIN（左下）/ MAX（右上）→ 分圈、連線、交叉
+    il, it, ir, ib = image_rect(chip_w, chip_h, view)
+    min_pt = {"x": il + off["left"], "y": ib - off["bottom"]}
+    max_pt = {"x": ir - off["right"], "y": it + off["top"]}
+    anchors = {str(p.get("pin_no")): dict(zip("xy", slots[slot_for_pin(p.get("pin_no"))]["anchor"])) for p in placed}
+    line_w = BASE_PIN_LINE_WIDTH * pin_scale
+    geo = geometry.analyze(placed, chip_w, chip_h, min_pt, max_pt, anchors, line_w, spec.get("line_scope") or "all")
+    upper = {str(p.get("pin_no")).strip().upper() for p in placed}
+    conflict = set(map(str, geo["conflict_pins"]))
+    for pair in CORNER_PAIRS:
+        if all(lbl in upper for lbl in pair):
+            conflict.update(pair)
+
+    cv = _Canvas(SNAPSHOT_SCALE)
+    # 側邊標籤（有連線的加粗）
+    connected = set()
+    for p, gp in zip(placed, geo["pins"]):
+        if geo["scope"] == "all" or gp["ring"] == geo["scope"]:
+            connected.add(str(p.get("pin_no")))
+    for lab, slot in slots.items():
+        x, y = slot["label_xy"]
+        hl = LABEL_HIGHLIGHT.get(lab)
+        if hl:
+            cv.rounded((x, y, x + LABEL_SIZE, y + LABEL_SIZE), 4, fill=_rgba(CLASS_COLORS[hl]))
+        cv.text((x + LABEL_SIZE / 2, y + LABEL_SIZE / 2), lab, FONT_PX, (0, 0, 0, 255), bold=lab in connected)
+
+    # EPAD 黃色區
+    cv.rounded(EPAD_RECT, 12, fill=_rgba("#ffffe0"))
+    _draw_dashed_rounded(cv, EPAD_RECT, 12, _rgba("#f0e68c"), 2)
+    cv.text(((EPAD_RECT[0] + EPAD_RECT[2]) / 2, (EPAD_RECT[1] + EPAD_RECT[3]) / 2), "EPAD", 80,
+            _rgba("#d3d3d3", 0.7), bold=True)
+
+    # 晶片圖
+    image_path = spec.get("image_path")
+    if image_path and os.path.exists(image_path):
+        box = cv.box(il, it, ir, ib)
+        size = (max(1, box[2] - box[0] + 1), max(1, box[3] - box[1] + 1))
+        with Image.open(image_path) as src:
+            src.draft("RGB", size)  # JPEG 可直接以較小的尺寸解碼
+            chip = src.convert("RGBA").resize(size, Image.LANCZOS)
+        cv.im.alpha_composite(chip, (box[0], box[1]))
+
+    # 文字框
+    for lab, slot in slots.items():
+        _draw_box(cv, slot, texts[lab], colors[lab])
+
+    # 點與線：畫在放大的透明圖層上再縮回來（抗鋸齒）
+    ss = SNAPSHOT_SCALE * OVERLAY_SUPERSAMPLE
+    layer = Image.new("RGBA", (round(STAGE_W * ss), round(STAGE_H * ss)), (0, 0, 0, 0))
+    d = ImageDraw.Draw(layer)
+
+    def dot(x, y, r, color):
+        d.ellipse([(x - r) * ss, (y - r) * ss, (x + r) * ss, (y + r) * ss], fill=color)
+
+    def line(x1, y1, x2, y2, color, width):
+        d.line([x1 * ss, y1 * ss, x2 * ss, y2 * ss], fill=color, width=max(1, round(width * ss)))
+
+    # 疊放順序同 SVG：MIN/MAX 在最下面，每個 pin 先點後線
+    radius = BASE_PIN_DOT_RADIUS * pin_scale
+    small = _font(round(8 * ss))
+    dot(min_pt["x"], min_pt["y"], radius, _rgba(MINMAX_COLOR))
+    d.text(((min_pt["x"] + 5) * ss, (min_pt["y"] - 5) * ss), "MIN", font=small, fill=_rgba(MINMAX_COLOR), anchor="ls")
+    dot(max_pt["x"], max_pt["y"], radius, _rgba(MINMAX_COLOR))
+    d.text(((max_pt["x"] - 20) * ss, (max_pt["y"] + 10) * ss), "MAX", font=small, fill=_rgba(MINMAX_COLOR), anchor="ls")
+    for p, gp in zip(placed, geo["pins"]):
+        color = _rgba(inner_color if gp["ring"] == "inner" else outer_color)
+        dot(gp["x"], gp["y"], radius, color)
+        pn = str(p.get("pin_no"))
+        if pn in connected:
+            ax, ay = slots[slot_for_pin(p.get("pin_no"))]["anchor"]
+            if pn in conflict:
+                line(gp["x"], gp["y"], ax, ay, _rgba(CONFLICT_COLOR), CONFLICT_WIDTH)
+            else:
+                line(gp["x"], gp["y"], ax, ay, color, line_w)
+    # 整數倍超取樣 → reduce()（box 平均）比 LANCZOS resize 快一個量級；尺寸對不上（小數倍率進位）才退回 resize
+    small_layer = layer.reduce(OVERLAY_SUPERSAMPLE)
+    if small_layer.size != cv.im.size:
+        small_layer = layer.resize(cv.im.size, Image.BOX)
+    cv.im.alpha_composite(small_layer)
+
+    stamp = spec.get("stamp_text") or datetime.now().strftime("%Y/%m/%d %H:%M")
+    _draw_hud(cv, spec.get("project_code") or "", stamp, spec.get("extras"))
+
+    out = cv.im.convert("RGB")
+    tmp_path = out_path + ".tmp"
+    out.save(tmp_path, "PNG", compress_level=1)   # 快取不存、即產即丟 → 壓縮等級取快
+    os.replace(tmp_path, out_path)
+    return out.size
+
+
+# === 前端上傳的快照圖 ===
+def flatten_png(src_path: str, out_png: str) -> Tuple[int, int]:
+    """讀圖（移除透明、用白底鋪，維持原解析度），存成暫存 PNG；回傳 (w, h)。在 cpu 池執行。"""
+    from PIL import Image
+    im = Image.open(src_path)
+    if im.mode in ("RGBA", "LA"):
+        bg = Image.new("RGB", im.size, (255, 255, 255))
+        bg.paste(im, mask=im.split()[-1])
+        im = bg
+    else:
+        im = im.convert("RGB")
+    im.save(out_png, "PNG")
+    return im.size
@@ -0,0 +1,117 @@
+"""
+啟動時間報告與暖機
+- main.py 最先 import 這個模組，之後用 mark(phase) 記下 import / 初始化各階段的耗時
+- 重量級套件（openpyxl、Pillow、NumPy）不在 import 時載入，第一次用到才載入
+- 暖機（WARMUP=1）：伺服器開始接受連線後，在背景依序預先 import、編譯驗證規則、讀 notices / 模板 / 字型，
+  並讓 cpu 池的子行程先起來；每一步各自計時，失敗只記錄不影響服務
+- report() 給 GET /startup；collect() 給 /metrics 的 padlist_startup_seconds{phase=...}
+"""
+import asyncio
+import importlib
+import os
+import sys
+import time
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Sequence, Tuple
+
+import metrics
+
+WARMUP_ENABLED = os.getenv("WARMUP", "1") == "1"
+WARMUP_DELAY = float(os.getenv("WARMUP_DELAY", "1.0"))   # 秒；startup 完成後等這麼久再暖機（讓 bind 與健康檢查先過）
+
+# 延遲載入的套件：報告裡列出目前是否已經載入
+LAZY_MODULES = ("openpyxl", "PIL.Image", "numpy")
+
+_T0 = time.perf_counter()
+_WALL0 = time.time()
+_phases: List[Tuple[str, float]] = []       # (階段, 結束時間 perf_counter)
+_warmup: Dict[str, Any] = {"enabled": WARMUP_ENABLED, "state": "pending" if WARMUP_ENABLED else "off", "steps": []}
+
+
+def _process_start() -> Optional[float]:
+    """行程啟動的 epoch 秒（Linux /proc，精度約 10 ms）；其他平台回 None，報告改從 import startup 起算。"""
+    try:
+        with open("/proc/self/stat") as f:
+            start_ticks = float(f.read().rsplit(")", 1)[1].split()[19])
+        with open("/proc/uptime") as f:
+            uptime = float(f.read().split()[0])
+        return _WALL0 - max(0.0, uptime - start_ticks / os.sysconf("SC_CLK_TCK"))
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+PROCESS_START = _process_start()
+
+
+def mark(phase: str):
+    """記下一個階段結束（耗時 = 與上一個 mark 的差）。"""
+    _phases.append((phase, time.perf_counter()))
+
+
+def _since_start(t: float) -> float:
+    """perf_counter 時間點 → 距行程啟動幾秒（拿不到行程啟動時間就從 import startup 起算）。"""
+    offset = (_WALL0 - PROCESS_START) if PROCESS_START else 0.0
+    return max(0.0, offset) + (t - _T0)
+
+
+def phases() -> List[Dict[str, Any]]:
+    out, prev = [], _T0
+    if PROCESS_START:
+        # 行程啟動 → import startup：直譯器、uvicorn、main.py 開頭的標準函式庫
+        boot = round(_since_start(_T0), 4)
+        out.append({"phase": "boot", "seconds": boot, "at": boot})
+    for name, t in _phases:
+        out.append({"phase": name, "seconds": round(t - prev, 4), "at": round(_since_start(t), 4)})
+        prev = t
+    return out
+
+
+def preload(modules: Sequence[str] = ("padlist_core",) + LAZY_MODULES) -> int:
+    """先把模組 import 好（暖機用；cpu 池子行程若是 spawn 起來的，不會繼承父行程已載入的模組）。"""
+    for name in modules:
+        importlib.import_module(name)
+    return os.getpid()
+
+
+async def warmup(steps: Sequence[Tuple[str, Callable[[], Awaitable[Any]]]], delay: float = WARMUP_DELAY):
+    """依序跑暖機步驟（每步是回傳 awaitable 的函式），逐步計時；整體只跑一次。"""
+    if not WARMUP_ENABLED or _warmup["state"] != "pending":
+        return
+    if delay > 0:
+        await asyncio.sleep(delay)
+    _warmup["state"] = "running"
+    t_all = time.perf_counter()
+    for name, fn in steps:
+        t = time.perf_counter()
+        entry: Dict[str, Any] = {"step": name}
+        try:
+            await fn()
+        except asyncio.CancelledError:
+            _warmup["state"] = "cancelled"
+            raise
+        except Exception as e:
+            entry["error"] = f"{type(e).__name__}: {e}"
+        entry["seconds"] = round(time.perf_counter() - t, 4)
+        _warmup["steps"].append(entry)
+    _warmup["seconds"] = round(time.perf_counter() - t_all, 4)
+    _warmup["done_at"] = round(_since_start(time.perf_counter()), 4)
+    _warmup["state"] = "done"
+
+
+def report() -> Dict[str, Any]:
+    ph = phases()
+    return {
+        "process_start": PROCESS_START,
+        "uptime_s": round(_since_start(time.perf_counter()), 3),
+        "phases": ph,
+        "ready_at": next((p["at"] for p in ph if p["phase"] == "ready"), None),
+        "warmup": _warmup,
+        "lazy_modules": {name: name in sys.modules for name in LAZY_MODULES},
+    }
+
+
+def collect() -> List[str]:
+    """/metrics collector：各啟動階段與暖機步驟耗時（gauge）。"""
+    samples = {f'phase="{p["phase"]}"': p["seconds"] for p in phases()}
+    samples.update({f'phase="warmup_{s["step"]}"': s["seconds"] for s in _warmup["steps"]})
+    return metrics.simple_lines("padlist_startup_seconds", "gauge",
+                                "Seconds spent in each startup phase / warm-up step", samples)
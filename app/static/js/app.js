@@ -155,7 +155,7 @@ const DEFAULT_NOTICES = {
 async function loadNotices() {
   let data = { ...DEFAULT_NOTICES };
   try {
-    const r = await fetch(`/notices`, { cache: "no-store" });
+    const r = await fetch(`/notices`, { cache: "no-cache" });  // 帶 If-None-Match，沒變就 304
     if (r.ok) data = await r.json();
   } catch (e) {
     console.warn("loadNotices failed:", e);
@@ -320,18 +320,69 @@ let MAX_POINT = null; // {x,y}
 let VALID_PINS = []; // {pin_no, pin_name, x, y}
 let INVALID_PINS = [];
 let CURRENT_SHEET_REQ = 0; // === Sheet 切換請求序號：只採用最後一次回應，避免瞬閃 ===
+const SESSION_EXPIRED_MSG = "工作階段已過期（伺服器已清除暫存），請重新選擇 Excel 檔案";
+
+// === 每張表已取得的資料：背景預解析（SSE 推過來）或 /sheet_load 的回應；切表/載入資料時直接用，不必再打 API ===
+let SHEET_DATA = new Map(); // sheet name -> { info, pins }（info 同 /sheet_info、pins 同 /parse_pins）
+let PREPARSE_SOURCE = null;
+
+function stopPreparseStream() {
+  if (PREPARSE_SOURCE) { PREPARSE_SOURCE.close(); PREPARSE_SOURCE = null; }
+  SHEET_DATA = new Map();
+}
+
+function startPreparseStream(sid) {
+  stopPreparseStream();
+  if (!window.EventSource) return;
+  const es = new EventSource(`/preparse/${encodeURIComponent(sid)}/events`);
+  PREPARSE_SOURCE = es;
+  es.addEventListener("sheet", (ev) => {
+    if (sid !== SESSION_ID) return;
+    try {
+      const d = JSON.parse(ev.data);
+      if (d.ok && d.info && d.pins) SHEET_DATA.set(d.sheet, d);
+    } catch (e) { /* 忽略壞掉的事件，改走一般 API */ }
+  });
+  const finish = () => { es.close(); if (PREPARSE_SOURCE === es) PREPARSE_SOURCE = null; };
+  es.addEventListener("done", finish);
+  es.onerror = finish; // 斷線就算了：沒拿到的表照舊打 /sheet_info、/parse_pins
+}
 
 // === Dynamic Validation Rules ===
 let VALIDATION_RULES = [];
 let FORBIDDEN_PINS = [];
+// 編譯後的索引：腳位 → { rule, tests }（pattern 只 new RegExp 一次），禁止腳位用 Set 查
+let RULE_INDEX = new Map();
+let FORBIDDEN_SET = new Set();
+
+function compileRules() {
+  RULE_INDEX = new Map();
+  FORBIDDEN_SET = new Set(FORBIDDEN_PINS.map(String));
+  for (const rule of VALIDATION_RULES) {
+    if (!rule || !Array.isArray(rule.pins)) continue;
+    const tests = (Array.isArray(rule.allowed_patterns) ? rule.allowed_patterns : []).map(pat => {
+      try {
+        const re = new RegExp(pat);
+        return U => re.test(U);
+      } catch (e) {
+        return U => pat === U; // Fallback to exact match
+      }
+    });
+    for (const pin of rule.pins) {
+      // 與原本 rule.pins.includes(字串) 相同：只有字串腳位會命中，同一腳位以第一條規則為準
+      if (typeof pin === "string" && !RULE_INDEX.has(pin)) RULE_INDEX.set(pin, { rule, tests });
+    }
+  }
+}
 
 async function loadRules() {
   try {
-    const r = await fetch("/api/rules", { cache: "no-store" });
+    const r = await fetch("/api/rules", { cache: "no-cache" });  // 帶 If-None-Match，沒變就 304
     if (r.ok) {
       const data = await r.json();
       VALIDATION_RULES = data.rules || [];
       FORBIDDEN_PINS = data.forbidden_pins || [];
+      compileRules();
       // console.log("Rules loaded:", VALIDATION_RULES.length, "Forbidden:", FORBIDDEN_PINS.length);
     }
   } catch (e) {
@@ -621,6 +672,7 @@ function buildSideUI() {
 // === 當 chip size 缺漏時，統一清乾淨畫面 ===
 function clearImageAndState() {
   // 清圖片
+  CHIP_IMAGE_LEVELS = null;
   chipImage.removeAttribute('src');
   chipImage.classList.remove('loaded');
   chipImage.style.width = "";
@@ -687,11 +739,43 @@ function centerChipImageInInnerFrame() {
 }
 
 
+// === 多解析度晶片圖：先顯示 preview，再依實際顯示像素換成夠用的那一層（/sheet_load 的 image_levels） ===
+let CHIP_IMAGE_LEVELS = null;   // [{name, url, width, height}]（由小到大），沒有金字塔時為 null
+
+function chipImageNeedPx() {
+  const w = parseFloat(chipImage.style.width) || chipImage.width || 0;
+  const h = parseFloat(chipImage.style.height) || chipImage.height || 0;
+  const zoom = (typeof CURRENT_ZOOM === "number" && CURRENT_ZOOM > 0) ? CURRENT_ZOOM : 1;
+  return Math.max(w, h) * zoom * (window.devicePixelRatio || 1);
+}
+
+function pickImageLevel(levels, needPx) {
+  return levels.find(lv => Math.max(lv.width, lv.height) >= needPx) || levels[levels.length - 1];
+}
+
+// 顯示尺寸變大（放大視圖 / Ctrl+滾輪）時換更大的一層；只升不降，先在背景載好再換，避免閃爍
+function upgradeChipImage() {
+  if (!CHIP_IMAGE_LEVELS || !chipImage.getAttribute('src')) return;
+  const req = chipImage.dataset.req;
+  const cur = CHIP_IMAGE_LEVELS.findIndex(lv => chipImage.src.endsWith(lv.url));
+  const target = pickImageLevel(CHIP_IMAGE_LEVELS, chipImageNeedPx());
+  if (CHIP_IMAGE_LEVELS.indexOf(target) <= cur) return;
+  const pre = new Image();
+  pre.onload = () => {
+    // 已換表 / 換檔就不換了
+    if (chipImage.dataset.req !== req || !CHIP_IMAGE_LEVELS) return;
+    const now = CHIP_IMAGE_LEVELS.findIndex(lv => chipImage.src.endsWith(lv.url));
+    if (CHIP_IMAGE_LEVELS.indexOf(target) > now) chipImage.src = target.url;
+  };
+  pre.src = target.url;
+}
+
 // 只有「當前工作表請求」的圖片載入成功，才開啟載入按鈕
 chipImage.addEventListener('load', () => {
   chipImage.classList.add('loaded');
   const req = Number(chipImage.dataset.req || "0");
   if (req === CURRENT_SHEET_REQ) {
+    upgradeChipImage();  // preview 先顯示 → 背景換成符合顯示尺寸的一層
     revealLoadBtn();
     // ✅ 只有當寬/高都有數值時，才清除紅框（避免清空時先閃紅）
     if (hasChipSizeValues()) markChipSizeInvalid(false);
@@ -1034,38 +1118,19 @@ function applyInputColors() {
 
     // 2. 禁止腳位檢查 (優先度最高) - 只有當「有輸入值」且在禁止清單中時才亮紅
     // 若該腳位為空，則不亮紅
-    if (FORBIDDEN_PINS.map(String).includes(kStr) && val) {
+    if (FORBIDDEN_SET.has(kStr) && val) {
       color = "red-alert";
       matchedRule = true;
     }
 
-    // 3. 自定義規則 (遍歷)
+    // 3. 自定義規則 (查編譯後的索引；伺服器端 rule_engine.py 用同一套判定)
     if (!matchedRule) {
-      for (const rule of VALIDATION_RULES) {
-        // rule.pins 包含此腳位嗎？
-        if (rule.pins && rule.pins.includes(kStr)) {
-          matchedRule = true;
-          // 檢查是否符合 allowed_patterns
-          // allowed_patterns 是一組 Regex 字串或純文字
-          let isMatch = false;
-          if (rule.allowed_patterns && rule.allowed_patterns.length > 0) {
-            isMatch = rule.allowed_patterns.some(pat => {
-              try {
-                return new RegExp(pat).test(U);
-              } catch (e) {
-                return pat === U; // Fallback to exact match
-              }
-            });
-          }
-
-          if (isMatch) {
-            color = rule.color; // Pass (Pink/Blue/Green)
-          } else {
-            color = "red-alert"; // Fail
-          }
-
-          break; // 找到第一個匹配的腳位規則就停 (通常一個腳位只屬一個群組)
-        }
+      const entry = RULE_INDEX.get(kStr);
+      if (entry) {
+        matchedRule = true;
+        // allowed_patterns 是一組 Regex 字串或純文字，任一符合即通過
+        const isMatch = entry.tests.some(t => t(U));
+        color = isMatch ? entry.rule.color : "red-alert"; // Pass (Pink/Blue/Green) / Fail
       }
     }
 
@@ -1213,6 +1278,196 @@ function segIntersect(A, B) {
   return false;
 }
 
+// === 線段交叉：候選對（與伺服器端 geometry.py 同一套做法，結果與兩兩比對相同） ===
+// 連線依錨點（x2,y2）所在的邊分組；組內找出所有線都完整跨過的帶狀區間 [a, b]，
+// 帶內兩條線交叉 ⇔ 在 a、b 兩端的上下順序顛倒（merge sort 列出逆序對）；
+// 組間用帶內的順序二分搜尋，帶外的短尾段與逆序的線才做外框篩選；候選對最後一律用 segIntersect 確認
+const FAN_MIN = 8;
+
+const boxOf = L => [Math.min(L.x1, L.x2), Math.max(L.x1, L.x2), Math.min(L.y1, L.y2), Math.max(L.y1, L.y2)];
+const endsOf = (L, axis) => axis === 0 ? [L.x1, L.y1, L.x2, L.y2] : [L.y1, L.x1, L.y2, L.x2];
+function valueAt(L, axis, t) {
+  const [u1, v1, u2, v2] = endsOf(L, axis);
+  return v1 + (v2 - v1) * (t - u1) / (u2 - u1);
+}
+// 第一個 key(arr[k]) >= v（strict=true 時 > v）的位置
+function lowerBound(arr, v, key, strict) {
+  let lo = 0, hi = arr.length;
+  while (lo < hi) {
+    const mid = (lo + hi) >> 1;
+    const k = key(arr[mid]);
+    if (k < v || (strict && k === v)) lo = mid + 1; else hi = mid;
+  }
+  return lo;
+}
+
+// items：[{ i, box: [x0, x1, y0, y1] }]；沿 axis 排序後掃描，外框（含 margin）重疊的對
+function boxPairs(items, margin, axis, out) {
+  const [lo, hi, olo, ohi] = axis === 0 ? [0, 1, 2, 3] : [2, 3, 0, 1];
+  const arr = items.slice().sort((p, q) => p.box[lo] - q.box[lo]);
+  for (let p = 0; p < arr.length; p++) {
+    const b = arr[p].box;
+    for (let q = p + 1; q < arr.length && arr[q].box[lo] <= b[hi] + margin; q++) {
+      const c = arr[q].box;
+      if (c[olo] <= b[ohi] + margin && c[ohi] >= b[olo] - margin) out.push([arr[p].i, arr[q].i]);
+    }
+  }
+}
+// boxPairs 的雙邊版：只列 A × B
+function boxPairsBetween(A, B, margin, axis, out) {
+  const [lo, hi, olo, ohi] = axis === 0 ? [0, 1, 2, 3] : [2, 3, 0, 1];
+  [[A, B, false], [B, A, true]].forEach(([X, Y, strict]) => {
+    const Ys = Y.slice().sort((p, q) => p.box[lo] - q.box[lo]);
+    X.forEach(({ i, box: b }) => {
+      // 起點相同的對只在第一輪列出
+      for (let q = lowerBound(Ys, b[lo], t => t.box[lo], strict); q < Ys.length && Ys[q].box[lo] <= b[hi] + margin; q++) {
+        const c = Ys[q].box;
+        if (c[olo] <= b[ohi] + margin && c[ohi] >= b[olo] - margin) out.push([i, Ys[q].i]);
+      }
+    });
+  });
+}
+function splitAxis(A, B) {
+  const overlap = k => {
+    const a0 = Math.min(...A.map(t => t.box[k])), a1 = Math.max(...A.map(t => t.box[k + 1]));
+    const b0 = Math.min(...B.map(t => t.box[k])), b1 = Math.max(...B.map(t => t.box[k + 1]));
+    return Math.max(0, Math.min(a1, b1) - Math.max(a0, b0)) / Math.max(a1 - a0, b1 - b0, EPS);
+  };
+  return overlap(0) <= overlap(2) ? 0 : 1;
+}
+
+// merge sort（依 key 排序 order），逆序對 [先, 後] 加進 out
+function inversionPairs(order, key, out) {
+  if (order.length <= 1) return order;
+  const mid = order.length >> 1;
+  const L = inversionPairs(order.slice(0, mid), key, out);
+  const R = inversionPairs(order.slice(mid), key, out);
+  const merged = [];
+  let i = 0, j = 0;
+  while (i < L.length && j < R.length) {
+    if (key[R[j]] < key[L[i]]) {
+      for (let t = i; t < L.length; t++) out.push([L[t], R[j]]);
+      merged.push(R[j++]);
+    } else {
+      merged.push(L[i++]);
+    }
+  }
+  return merged.concat(L.slice(i), R.slice(j));
+}
+// key 值相差不超過 tol 的對
+function nearPairs(ids, key, tol, out) {
+  const srt = ids.slice().sort((p, q) => key[p] - key[q]);
+  for (let p = 0; p < srt.length; p++) {
+    for (let q = p + 1; q < srt.length && key[srt[q]] - key[srt[p]] <= tol; q++) out.push([srt[p], srt[q]]);
+  }
+}
+
+function buildFan(lines, ids, out) {
+  const fan = { ids, boxes: ids.map(i => ({ i, box: boxOf(lines[i]) })), axis: null };
+  let best = null;
+  if (ids.length >= FAN_MIN) {
+    [0, 1].forEach(axis => {
+      let a = -Infinity, b = Infinity, umin = Infinity, umax = -Infinity;
+      ids.forEach(i => {
+        const [u1, , u2] = endsOf(lines[i], axis);
+        a = Math.max(a, Math.min(u1, u2)); b = Math.min(b, Math.max(u1, u2));
+        umin = Math.min(umin, u1, u2); umax = Math.max(umax, u1, u2);
+      });
+      if (b - a > 4 * EPS && (!best || (b - a) / (umax - umin) > best.ratio)) best = { axis, a, b, ratio: (b - a) / (umax - umin) };
+    });
+  }
+  if (!best) {
+    boxPairs(fan.boxes, 2 * EPS, 0, out);
+    return fan;
+  }
+  const { axis, a, b, ratio } = best;
+  const w = b - a;
+  // 容差：EPS 的面積容差換成距離最多是 EPS / w；再加上浮點誤差
+  const tol = 4 * EPS * (1 + 1 / w) + 1e-9 * (Math.abs(a) + Math.abs(b) + w / ratio);
+  const va = {}, vb = {};
+  ids.forEach(i => { va[i] = valueAt(lines[i], axis, a); vb[i] = valueAt(lines[i], axis, b); });
+  const order = ids.slice().sort((p, q) => va[p] - va[q] || vb[p] - vb[q]);
+  const inv = [];
+  inversionPairs(order, vb, inv);
+  inv.forEach(p => out.push(p));
+  nearPairs(ids, va, tol, out);
+  nearPairs(ids, vb, tol, out);
+
+  // 帶外的尾段：[該線起點, a + tol] 與 [b - tol, 該線終點]
+  const edge = [];
+  [[null, a + tol], [b - tol, null]].forEach(([loT, hiT]) => {
+    const part = ids.map(i => {
+      const [u1, , u2] = endsOf(lines[i], axis);
+      const t0 = loT === null ? Math.min(u1, u2) : Math.max(Math.min(u1, u2), loT);
+      const t1 = hiT === null ? Math.max(u1, u2) : Math.min(Math.max(u1, u2), hiT);
+      const v0 = valueAt(lines[i], axis, t0), v1 = valueAt(lines[i], axis, t1);
+      const box = [t0, t1, Math.min(v0, v1), Math.max(v0, v1)];
+      return { i, box: axis === 0 ? box : [box[2], box[3], box[0], box[1]] };
+    });
+    boxPairs(part, tol, axis, out);
+    part.forEach(t => edge.push(t));
+  });
+  const irregular = new Set();
+  inv.forEach(([p, q]) => { irregular.add(p); irregular.add(q); });
+  irregular.forEach(i => edge.push({ i, box: boxOf(lines[i]) }));
+  return Object.assign(fan, { axis, a, b, tol, ratio, edge, clean: order.filter(i => !irregular.has(i)) });
+}
+
+// A、B 兩組之間的候選對（A 要有帶狀區間）：B 的線截到 A 的帶內，在兩端各二分搜尋一次
+function crossFanPairs(lines, A, B, out) {
+  const { axis, a, b, tol, clean } = A;
+  const rank = (x, v, strict) => lowerBound(clean, v, i => valueAt(lines[i], axis, x), strict);
+  B.ids.forEach(j => {
+    let [u1, v1, u2, v2] = endsOf(lines[j], axis);
+    if (u1 > u2) [u1, v1, u2, v2] = [u2, v2, u1, v1];
+    const x0 = Math.max(u1, a), x1 = Math.min(u2, b);
+    if (x0 > x1) return;
+    let lo, hi;
+    if (u1 === u2) {
+      lo = rank(x0, Math.min(v1, v2) - tol, false);
+      hi = rank(x0, Math.max(v1, v2) + tol, true);
+    } else {
+      const w0 = x0 === u1 ? v1 : valueAt(lines[j], axis, x0);
+      const w1 = x1 === u2 ? v2 : valueAt(lines[j], axis, x1);
+      lo = Math.min(rank(x0, w0 - tol, false), rank(x1, w1 - tol, false));
+      hi = Math.max(rank(x0, w0 + tol, true), rank(x1, w1 + tol, true));
+    }
+    for (let k = lo; k < hi; k++) out.push([clean[k], j]);
+  });
+  if (A.edge.length) boxPairsBetween(A.edge, B.boxes, tol, splitAxis(A.edge, B.boxes), out);
+}
+
+// 回傳交叉的線段索引對 [i, j]（i < j）
+function crossingPairs(lines) {
+  if (lines.length < 2) return [];
+  const anchors = lines.map(L => ({ x: L.x2, y: L.y2 }));
+  const bounds = computeGlobalBounds(anchors);
+  const groups = new Map();
+  anchors.forEach((pt, i) => {
+    const side = getGeometricSide(pt, bounds);
+    if (!groups.has(side)) groups.set(side, []);
+    groups.get(side).push(i);
+  });
+  const cands = [];
+  const fans = Array.from(groups.values()).map(ids => buildFan(lines, ids, cands));
+  for (let g = 0; g < fans.length; g++) {
+    for (let h = g + 1; h < fans.length; h++) {
+      let A = fans[g], B = fans[h];
+      if (B.axis !== null && (A.axis === null || B.ratio > A.ratio)) [A, B] = [B, A];
+      if (A.axis !== null) crossFanPairs(lines, A, B, cands);
+      else boxPairsBetween(A.boxes, B.boxes, 2 * EPS, splitAxis(A.boxes, B.boxes), cands);
+    }
+  }
+  const seen = new Set(), out = [];
+  cands.forEach(([p, q]) => {
+    const i = Math.min(p, q), j = Math.max(p, q), k = i * lines.length + j;
+    if (seen.has(k)) return;
+    seen.add(k);
+    if (segIntersect(lines[i], lines[j])) out.push([i, j]);
+  });
+  return out.sort((p, q) => p[0] - q[0] || p[1] - q[1]);
+}
+
 // === 線段交叉檢測（有交叉就套用同樣的 .conflict 高亮） ===
 function checkLineIntersections() {
   const lines = getOverlayLines(); // {x1,y1,x2,y2, el, tag}
@@ -1224,19 +1479,15 @@ function checkLineIntersections() {
     (groups[ring] || groups.unknown).push(L);
   });
 
-  // 小工具：兩兩檢查是否相交
+  // 同一組內有交叉的線都標 .conflict
   const scan = (arr) => {
-    for (let i = 0; i < arr.length; i++) {
-      for (let j = i + 1; j < arr.length; j++) {
-        if (segIntersect(arr[i], arr[j])) {
-          arr[i].el.classList.add('conflict');
-          arr[j].el.classList.add('conflict');
-        }
-      }
-    }
+    crossingPairs(arr).forEach(([i, j]) => {
+      arr[i].el.classList.add('conflict');
+      arr[j].el.classList.add('conflict');
+    });
   };
 
-  // 若畫面上「沒有任何 inner/outer」→ 代表單圈（或未能分圈）
+// 若畫面上「沒有任何 inner/outer」→ 代表單圈（或未能分圈）
   // 單圈時就把全部線一起掃（含 unknown）
   const hasKnownRings = (groups.inner.length + groups.outer.length) > 0;
   if (hasKnownRings) {
@@ -1316,6 +1567,7 @@ function applyViewMode() {
       centerImageToRect(w, h, rect); // 置中到黃色區
     }
   }
+  upgradeChipImage();  // 放大視圖可能需要更高解析度的一層
   // 依圖片邊界重設 MIN/MAX → 重畫（避免比例改變造成定位不符）
   if (typeof setMinMaxToImage === 'function') setMinMaxToImage();
   if (typeof drawPinsAndLines === 'function') drawPinsAndLines();
@@ -1435,51 +1687,67 @@ function updatePinScopeLock(twoRings) {
 }
 
 
-// === 用 html2canvas 把 #stage 直接截圖（所見即所得） ===
-// 為了避免 <input> 的 baseline 偏移，截圖時用 clone，把 .pin-input 改成 .pin-box
-async function renderStageCanvas() {
-  // 新增：截圖前刷新時間顯示
+// === 截圖改由後端 Pillow 繪製（/snapshot.png）：前端只送「畫面狀態」，不再 html2canvas 截 DOM ===
+// 回傳目前樣式（顏色、連線範圍、晶片尺寸、MIN/MAX 偏移、時間戳）的 FormData
+function snapshotFormData() {
+  const fd = new FormData();
+  fd.append("session_id", SESSION_ID);
+  fd.append("sheet_name", (typeof sheetSelector !== "undefined" && sheetSelector?.value) ? sheetSelector.value : "");
+  fd.append("pin_color", ringColor(PIN_STYLE_COLOR, 'outer'));
+  fd.append("pin_color_inner", ringColor(PIN_STYLE_COLOR, 'inner'));
+  fd.append("line_scope", PIN_LINE_SCOPE);
+  fd.append("chip_w", chipWidthEl?.value || "");
+  fd.append("chip_h", chipHeightEl?.value || "");
+  ["left", "right", "top", "bottom"].forEach(k => fd.append(`offset_${k}`, MINMAX_OFFSET[k] || 0));
+
+  // 截圖前刷新時間顯示，圖上的時間與畫面一致
+  const stamp = nowTime();
   const nt = document.getElementById("nowtime");
-  if (nt) nt.textContent = nowTime();
-
-  const stage = document.getElementById("stage");
-  const canvas = await html2canvas(stage, {
-    backgroundColor: "#fff",
-    scale: 2,
-    useCORS: true,
-    logging: false
-  });
-  return canvas;
+  if (nt) nt.textContent = stamp;
+  fd.append("stamp_text", stamp);
+  return fd;
+}
+
+async function postForBlob(url, fd) {
+  const resp = await fetch(url, { method: "POST", body: fd });
+  if (!resp.ok) {
+    const t = await resp.text();
+    throw new Error("伺服器錯誤：" + t);
+  }
+  return await resp.blob();
+}
+
+// 以目前視圖（1:1 / 放大）與點線倍率向後端要一張 PNG
+async function renderStageBlob() {
+  if (!SESSION_ID) throw new Error("尚未上傳 Excel / 尚未建立 session");
+  const fd = snapshotFormData();
+  fd.append("view", BIG_VIEW_MODE ? "zoom" : "1to1");
+  fd.append("pin_scale", PIN_STYLE_SCALE);
+  return await postForBlob("/snapshot.png", fd);
 }
 
 
 
 async function downloadPNG() {
   try {
-    const canvas = await renderStageCanvas();
+    const blob = await renderStageBlob();
     const a = document.createElement("a");
-    a.href = canvas.toDataURL("image/png");
+    a.href = URL.createObjectURL(blob);
     a.download = "padlist_snapshot.png";
     a.click();
+    URL.revokeObjectURL(a.href);
   } catch (err) {
     console.error("下載截圖失敗：", err);
-    setError("下載截圖失敗，請查看 console 訊息。");
+    setError(err.message || "下載截圖失敗，請查看 console 訊息。");
   }
 }
 
 async function copyStageToClipboard() {
   try {
-    const canvas = await renderStageCanvas();
-    await new Promise((resolve, reject) => {
-      canvas.toBlob(async (blob) => {
-        try {
-          await navigator.clipboard.write([
-            new ClipboardItem({ "image/png": blob })
-          ]);
-          resolve();
-        } catch (e) { reject(e); }
-      }, "image/png");
-    });
+    // Safari 要求 clipboard.write 在使用者手勢內同步呼叫 → 傳 Promise 給 ClipboardItem
+    await navigator.clipboard.write([
+      new ClipboardItem({ "image/png": renderStageBlob() })
+    ]);
     setStatus("已複製截圖到剪貼簿！");
   } catch (err) {
     console.error("複製到剪貼簿失敗：", err);
@@ -1487,80 +1755,15 @@ async function copyStageToClipboard() {
   }
 }
 
-// 將 canvas 轉 blob（PNG）
-async function canvasToBlob(canvas) {
-  return await new Promise(res => canvas.toBlob(b => res(b), "image/png"));
-}
-
-// 以「目前視圖」把舞台區截成 canvas（沿用你現有的 html2canvas/渲染流程）
-async function captureStageBlobAtCurrentView() {
-  const canvas = await renderStageCanvas();   // 你專案既有的截圖函式
-  return await canvasToBlob(canvas);
-}
-
-// ★ 只在截圖期間臨時調整點線倍率，截完立即還原
-async function withTempPinScale(scale, task) {
-  const prevScale = PIN_STYLE_SCALE;
-  PIN_STYLE_SCALE = scale;
-  if (typeof drawPinsAndLines === 'function') drawPinsAndLines(); // 依新倍率重繪
-  await new Promise(r => requestAnimationFrame(() => r()));       // 等一個 frame
-
-  try {
-    return await task();  // 交給呼叫端執行（通常是 captureStageBlobAtCurrentView）
-  } finally {
-    // 還原
-    PIN_STYLE_SCALE = prevScale;
-    if (typeof drawPinsAndLines === 'function') drawPinsAndLines();
-    await new Promise(r => requestAnimationFrame(() => r()));
-  }
-}
-
 
-// 主要流程：兩次截圖（1:1 與 放大），POST 到 API，拿回 Excel 檔案
+// 主要流程：後端一次畫好兩張圖（1:1 點線 1.5 倍、放大 4 倍）並貼進 Excel，拿回檔案
 async function downloadExcelViaAPI() {
   try {
     if (!SESSION_ID) {
       setError("尚未上傳 Excel / 尚未建立 session"); // 你專案的錯誤顯示函式
       return;
     }
-    const sheet = (typeof sheetSelector !== "undefined" && sheetSelector?.value) ? sheetSelector.value : "";
-
-    // 記住原本視圖狀態
-    const prev = BIG_VIEW_MODE;
-
-    // 左圖：1:1 視圖
-    BIG_VIEW_MODE = false;
-    applyViewMode();                          // 你專案用來套用 BIG_VIEW_MODE 的函式
-    await new Promise(r => requestAnimationFrame(() => r())); // 等畫面更新
-    const leftBlob = await withTempPinScale(1.5, async () => {
-      return await captureStageBlobAtCurrentView();
-    });
-
-    // 右圖：放大視圖（黃色區 0.9 倍）
-    BIG_VIEW_MODE = true;
-    applyViewMode();
-    await new Promise(r => requestAnimationFrame(() => r()));
-    const rightBlob = await withTempPinScale(4, async () => {
-      return await captureStageBlobAtCurrentView();
-    });
-
-    // 回復原視圖（避免影響使用者）
-    BIG_VIEW_MODE = prev;
-    applyViewMode();
-
-    // 組 FormData 打 API
-    const fd = new FormData();
-    fd.append("session_id", SESSION_ID);
-    fd.append("sheet_name", sheet);               // 後端用來取名新分頁
-    fd.append("img_left", leftBlob, "view_1to1.png");
-    fd.append("img_right", rightBlob, "view_zoom.png");
-
-    const resp = await fetch("/excel/paste_snapshot", { method: "POST", body: fd });
-    if (!resp.ok) {
-      const t = await resp.text();
-      throw new Error("伺服器錯誤：" + t);
-    }
-    const blob = await resp.blob();
+    const blob = await postForBlob("/excel/paste_snapshot", snapshotFormData());
     const a = document.createElement("a");
     a.href = URL.createObjectURL(blob);
     const code = (projectCodeEl?.textContent || "padlist").trim() || "padlist";
@@ -1590,10 +1793,26 @@ function hasGeneratedTabsFrom(data) {
 }
 
 
+// 重新上傳時的變動摘要（/upload 回傳的 incremental）
+function describeIncremental(inc) {
+  if (!inc || inc.error) return "";
+  const changed = [...(inc.changed_sheets || []), ...(inc.added_sheets || [])];
+  if (!changed.length && !(inc.removed_sheets || []).length) return "（與上次相同，沿用上次結果）";
+  const parts = changed.map(name => {
+    const d = (inc.diffs || {})[name];
+    if (!d) return `${name}（新增）`;
+    return `${name}（+${d.added.length} / -${d.removed.length} / 移動 ${d.moved.length} / 改名 ${d.renamed.length}）`;
+  });
+  (inc.removed_sheets || []).forEach(name => parts.push(`${name}（已移除）`));
+  return "；變動的工作表：" + parts.join("、");
+}
+
 // ====== Event wiring ======
 document.getElementById("excelFile").addEventListener("change", async (e) => {
   const f = e.target.files[0];
   if (!f) { return; }
+  // 同一個檔名再上傳（改過後重傳）→ 帶上一個 session，伺服器只重新解析有變動的工作表
+  const prevSessionId = (SESSION_ID && CURRENT_FILE_NAME === f.name) ? SESSION_ID : null;
   CURRENT_FILE_NAME = f.name; // ★ 新增
   resetErrorUIForNewLoad();  // ★ 換檔 → 先清上一輪錯誤/膠囊/GIF
   setError("");
@@ -1606,11 +1825,13 @@ document.getElementById("excelFile").addEventListener("change", async (e) => {
   hideDataControls();
   const fd = new FormData();
   fd.append("file", f);
+  if (prevSessionId) fd.append("prev_session_id", prevSessionId);
   const res = await fetch("/upload", { method: "POST", body: fd });
   if (!res.ok) { setError("上傳失敗"); console.error("Upload failed", res.status, await res.text()); return; }
   const data = await res.json();
   if (data.error) { setError(data.error); console.error("Server error:", data.error); return; }
   SESSION_ID = data.session_id;
+  if (data.preparse) startPreparseStream(SESSION_ID); else stopPreparseStream();
   // ★ 插入：偵測 1to1 / 1to9
   if (hasGeneratedTabsFrom(data)) {
     setError("偵測到1to1、1to9，請刪除後，再試一次");
@@ -1620,7 +1841,7 @@ document.getElementById("excelFile").addEventListener("change", async (e) => {
     return;
   }
 
-  setStatus("已選擇檔案: " + f.name);
+  setStatus("已選擇檔案: " + f.name + describeIncremental(data.incremental));
 
 
   // 只填入「有圖的工作表」
@@ -1660,11 +1881,25 @@ async function querySheetInfo() {
   // ★ 這次查詢的序號（只用最後一次的結果）
   const token = ++CURRENT_SHEET_REQ;
 
-  const fd = new FormData();
-  fd.append("session_id", SESSION_ID);
-  fd.append("sheet_name", sheetSelector.value);
-  const res = await fetch("/sheet_info", { method: "POST", body: fd });
-  const data = await res.json();
+  let data;
+  const sheet = sheetSelector.value;
+  const sid = SESSION_ID;
+  const pre = SHEET_DATA.get(sheet);
+  if (pre) {
+    data = pre.info; // 背景預解析已完成 → 不必等 API
+  } else {
+    // 一個來回拿齊 info + pins；pins 先留著，按「載入資料」時直接用
+    const fd = new FormData();
+    fd.append("session_id", sid);
+    fd.append("sheet_name", sheet);
+    const res = await fetch("/sheet_load", { method: "POST", body: fd });
+    if (res.status === 410 && token === CURRENT_SHEET_REQ) { setError(SESSION_EXPIRED_MSG); return; }
+    data = await res.json();
+    if (!data.error && sid === SESSION_ID) {
+      const { valid_pins, invalid_pins, ...info } = data;
+      SHEET_DATA.set(sheet, { sheet, info, pins: { valid_pins: valid_pins || [], invalid_pins: invalid_pins || [] } });
+    }
+  }
 
   // 若這不是最後一次請求的回應 → 丟棄，避免舊回應覆蓋新狀態
   if (token !== CURRENT_SHEET_REQ) return;
@@ -1695,7 +1930,15 @@ async function querySheetInfo() {
       chipImage.classList.remove('loaded');  // 成功後由 load 事件顯示 & 開啟按鈕
       chipImage.removeAttribute('src');      // 先取消舊請求，降低競態
       chipImage.dataset.req = String(token); // 標記此圖對應的請求序號
-      chipImage.src = data.image_url + `?v=${Date.now()}`; // 加上時間戳避免快取
+      const levels = data.image_levels && data.image_levels.levels;
+      if (levels && levels.length) {
+        // 多解析度：先載最小的一層（首次繪製只跟 preview 大小有關），load 後再升級
+        CHIP_IMAGE_LEVELS = levels;
+        chipImage.src = levels[0].url;
+      } else {
+        CHIP_IMAGE_LEVELS = null;
+        chipImage.src = data.image_url; // 圖片網址內容不會變（伺服器標 immutable），直接走瀏覽器快取
+      }
     } else {
       // 找不到圖 → 視為載入錯誤，才加紅框
       clearImageAndState();
@@ -1757,11 +2000,22 @@ document.getElementById("loadDataBtn").addEventListener("click", async () => {
 
   resetErrorUIForNewLoad();  // ★ 新一輪載入 → 先清上一輪
   setError("");
-  const fd = new FormData();
-  fd.append("session_id", SESSION_ID);
-  fd.append("sheet_name", sheetSelector.value);
-  const res = await fetch("/parse_pins", { method: "POST", body: fd });
-  const data = await res.json();
+  let data;
+  const pre = SHEET_DATA.get(sheetSelector.value);
+  if (pre) {
+    // 複製一份：後續流程會 push 到 INVALID_PINS，不能改到快取本身
+    data = {
+      valid_pins: pre.pins.valid_pins.map(p => ({ ...p })),
+      invalid_pins: [...pre.pins.invalid_pins],
+    };
+  } else {
+    const fd = new FormData();
+    fd.append("session_id", SESSION_ID);
+    fd.append("sheet_name", sheetSelector.value);
+    const res = await fetch("/parse_pins", { method: "POST", body: fd });
+    if (res.status === 410) { setError(SESSION_EXPIRED_MSG); return; }
+    data = await res.json();
+  }
   if (data.error) { setError(data.error); return; }
   VALID_PINS = data.valid_pins || [];
   INVALID_PINS = data.invalid_pins || [];
@@ -1788,6 +2042,7 @@ function applyZoom(z) {
   stage.style.transform = `scale(${CURRENT_ZOOM})`; // 只縮放，不平移
   DISPLAY_SCALE = CURRENT_ZOOM;
   if (zoomVal) zoomVal.textContent = Math.round(CURRENT_ZOOM * 100) + "%";
+  upgradeChipImage();
 }
 
 // Ctrl + 滾輪
@@ -2368,6 +2623,7 @@ function setupRuleEditor() {
         alert("規則除存成功！");
         VALIDATION_RULES = newRules;
         FORBIDDEN_PINS = fb;
+        compileRules();
         close();
         // 若已有載入資料，重新套用顏色
         applyInputColors();
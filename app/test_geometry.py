@@ -0,0 +1,106 @@
+"""
+geometry 交叉偵測 vs 兩兩暴力比對
+- 隨機線段、整數格點的退化情況（共線、共端點、零長度）、標籤扇形連線（含同座標錨點）
+- NumPy 與純 Python 兩條路徑都要與 crossing_pairs_bruteforce 完全相同
+- 800 條不交叉的扇形連線：候選對數量必須接近線性（外框篩選時約 14 萬對）
+"""
+import random
+
+import pytest
+
+import geometry
+
+
+def _random_segments(rng, n, grid=None, size=1000.0):
+    segs = []
+    for _ in range(n):
+        if grid:
+            segs.append(tuple(float(rng.randint(0, grid)) for _ in range(4)))
+        else:
+            x, y = rng.uniform(0, size), rng.uniform(0, size)
+            L = rng.uniform(0, size / 5)
+            segs.append((x, y, x + rng.uniform(-L, L), y + rng.uniform(-L, L)))
+    return segs
+
+
+def _fan_segments(rng, per_side, chip=(300.0, 700.0), frame=(0.0, 1000.0), shuffle=0.0, dup=0.0):
+    """chip 四邊的 pin 連到外框四邊的標籤錨點；shuffle 比例的錨點被打亂（會交叉），dup 比例的錨點重複。"""
+    c0, c1 = chip
+    f0, f1 = frame
+    segs = []
+    for side in ("left", "right", "top", "bottom"):
+        pins = sorted(rng.uniform(c0, c1) for _ in range(per_side))
+        slots = [f0 + (f1 - f0) * (k + 1) / (per_side + 1) for k in range(per_side)]
+        for k in range(per_side):
+            if rng.random() < shuffle:
+                j = rng.randrange(per_side)
+                slots[k], slots[j] = slots[j], slots[k]
+            if k and rng.random() < dup:
+                slots[k] = slots[k - 1]
+        for p, a in zip(pins, slots):
+            if side == "left":
+                segs.append((c0, p, f0 + 1e-9 * rng.random(), a))
+            elif side == "right":
+                segs.append((c1, p, f1, a))
+            elif side == "top":
+                segs.append((p, c0, a, f0))
+            else:
+                segs.append((p, c1, a, f1))
+    rng.shuffle(segs)
+    return segs
+
+
+def _both(segs):
+    expected = geometry.crossing_pairs_bruteforce(segs)
+    assert geometry.crossing_pairs(segs, use_numpy=False) == expected
+    if geometry._numpy() is not None:
+        assert geometry.crossing_pairs(segs, use_numpy=True) == expected
+    return expected
+
+
+@pytest.mark.parametrize("seed", range(20))
+def test_random_segments(seed):
+    rng = random.Random(seed)
+    _both(_random_segments(rng, rng.randint(2, 200)))
+
+
+@pytest.mark.parametrize("seed", range(40))
+def test_integer_grid_degenerate(seed):
+    rng = random.Random(1000 + seed)
+    _both(_random_segments(rng, rng.randint(2, 80), grid=rng.choice((3, 6, 12))))
+
+
+@pytest.mark.parametrize("seed", range(20))
+def test_fan_segments(seed):
+    rng = random.Random(2000 + seed)
+    segs = _fan_segments(rng, rng.randint(1, 60), shuffle=rng.choice((0.0, 0.05, 0.5)), dup=rng.choice((0.0, 0.2)))
+    _both(segs)
+
+
+@pytest.mark.parametrize("seed", range(10))
+def test_fan_segments_integer_grid(seed):
+    rng = random.Random(3000 + seed)
+    segs = [tuple(float(round(v)) for v in s)
+            for s in _fan_segments(rng, rng.randint(8, 40), chip=(8.0, 16.0), frame=(0.0, 24.0), shuffle=0.3, dup=0.3)]
+    _both(segs)
+
+
+def test_explicit_fans_do_not_change_result():
+    rng = random.Random(7)
+    segs = _fan_segments(rng, 30, shuffle=0.2)
+    expected = geometry.crossing_pairs_bruteforce(segs)
+    assert geometry.crossing_pairs(segs, fans=[None] * len(segs)) == expected
+    assert geometry.crossing_pairs(segs, fans=[rng.randrange(3) for _ in segs]) == expected
+
+
+def test_fan_out_without_crossings_is_near_linear():
+    rng = random.Random(11)
+    segs = _fan_segments(rng, 200)
+    assert geometry.crossing_pairs(segs) == []
+    assert len(geometry._crossing_candidates(segs)) < 10 * len(segs)
+
+
+def test_small_inputs():
+    assert geometry.crossing_pairs([]) == []
+    assert geometry.crossing_pairs([(0, 0, 1, 1)]) == []
+    assert geometry.crossing_pairs([(0, 0, 2, 2), (0, 2, 2, 0)]) == [(0, 1)]
@@ -0,0 +1,117 @@
+"""
+Workbook 快取（行程內）
+- 以 session id 為鍵，並記錄檔案 mtime/size；檔案一變動就自動重新載入
+- LRU 淘汰：以「估計記憶體用量」為上限（openpyxl 展開後大約是 xlsx 檔案大小的數十倍）
+- 每張工作表另有一個 dict（CachedWorkbook.sheets[sheet_name]），
+  讓呼叫端把同一張表的衍生結果（索引、偵測結果…）掛在同一個快取項目上，一起淘汰
+"""
+import os
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Dict
+
+
+# === 參數（可用環境變數覆寫） ===
+WB_CACHE_MAX_MB = float(os.getenv("WB_CACHE_MAX_MB", "512"))
+# openpyxl 展開後的記憶體 ≈ xlsx 檔案大小 × 這個倍數（粗估即可）
+WB_CACHE_MEM_FACTOR = float(os.getenv("WB_CACHE_MEM_FACTOR", "20"))
+
+
+class CachedWorkbook:
+    """快取項目：workbook 本體 + 每張工作表的附掛資料。"""
+
+    def __init__(self, key: str, path: str, stamp, wb, est_bytes: int):
+        self.key = key
+        self.path = path
+        self.stamp = stamp          # (mtime_ns, size)：用來判斷檔案是否換過
+        self.wb = wb
+        self.est_bytes = est_bytes
+        self.sheets: Dict[str, Dict[str, Any]] = {}
+        self._lock = threading.Lock()
+
+    def sheet_state(self, sheet_name: str) -> Dict[str, Any]:
+        """取得某張工作表的附掛 dict（沒有就建一個）。"""
+        with self._lock:
+            st = self.sheets.get(sheet_name)
+            if st is None:
+                st = self.sheets[sheet_name] = {}
+            return st
+
+
+class WorkbookCache:
+    def __init__(self, loader: Callable[[str], Any], max_bytes: int, mem_factor: float):
+        self._loader = loader
+        self.max_bytes = max_bytes
+        self.mem_factor = mem_factor
+        self._items: "OrderedDict[str, CachedWorkbook]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._key_locks: Dict[str, threading.Lock] = {}
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def _stamp(path: str):
+        st = os.stat(path)
+        return (st.st_mtime_ns, st.st_size)
+
+    def _total_bytes(self) -> int:
+        return sum(it.est_bytes for it in self._items.values())
+
+    def _evict(self):
+        # 超過預算就從最久沒用的開始丟（至少保留剛放進來的那一個）
+        while len(self._items) > 1 and self._total_bytes() > self.max_bytes:
+            self._items.popitem(last=False)
+
+    def get(self, key: str, path: str) -> CachedWorkbook:
+        """取 workbook；不存在或檔案已變動就重新載入。"""
+        stamp = self._stamp(path)
+        with self._lock:
+            it = self._items.get(key)
+            if it is not None and it.path == path and it.stamp == stamp:
+                self._items.move_to_end(key)
+                self.hits += 1
+                return it
+            key_lock = self._key_locks.setdefault(key, threading.Lock())
+
+        # 同一個 key 同時只載入一次（其他人等它載完直接拿快取）
+        with key_lock:
+            with self._lock:
+                it = self._items.get(key)
+                if it is not None and it.path == path and it.stamp == stamp:
+                    self._items.move_to_end(key)
+                    self.hits += 1
+                    return it
+                self.misses += 1
+
+            wb = self._loader(path)
+            it = CachedWorkbook(key, path, stamp, wb, int(stamp[1] * self.mem_factor))
+            with self._lock:
+                self._items[key] = it
+                self._items.move_to_end(key)
+                self._evict()
+            return it
+
+    def invalidate(self, key: str):
+        """明確作廢某個 session 的快取（例如寫出新檔之後）。"""
+        with self._lock:
+            self._items.pop(key, None)
+            self._key_locks.pop(key, None)
+
+    def prune_missing(self) -> int:
+        """丟掉檔案已不存在的項目（例如別的 worker 清掉了 store 內容）；回傳丟掉幾個。"""
+        with self._lock:
+            gone = [k for k, it in self._items.items() if not os.path.exists(it.path)]
+            for k in gone:
+                self._items.pop(k, None)
+                self._key_locks.pop(k, None)
+            return len(gone)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "entries": len(self._items),
+                "est_bytes": self._total_bytes(),
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+            }
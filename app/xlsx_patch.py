@@ -0,0 +1,277 @@
+"""
+直接修補 OOXML zip，把「快照圖」分頁加進既有的 xlsx
+- 原本的 zip 項目原封不動複製（壓縮資料直接搬，不解壓、不經過 openpyxl）
+- 只新增 worksheet / drawing / rels / media，並小幅修改
+  [Content_Types].xml、xl/workbook.xml、xl/_rels/workbook.xml.rels、xl/styles.xml
+- 匯出時間只跟快照圖大小有關，跟原 workbook 大小無關；也不會遺失 openpyxl 不支援的功能
+遇到看不懂的結構（例如帶 prefix 的 XML）就丟 PatchUnsupported，由呼叫端退回 openpyxl 流程。
+"""
+import copy
+import posixpath as pp
+import re
+import struct
+import zipfile
+from typing import List, Sequence, Tuple
+from xml.sax.saxutils import escape, unescape
+
+
+class PatchUnsupported(Exception):
+    """此 workbook 結構不適合直接修補。"""
+
+
+NS_MAIN = "http://schemas.openxmlformats.org/spreadsheetml/2006/main"
+NS_REL = "http://schemas.openxmlformats.org/officeDocument/2006/relationships"
+NS_XDR = "http://schemas.openxmlformats.org/drawingml/2006/spreadsheetDrawing"
+NS_A = "http://schemas.openxmlformats.org/drawingml/2006/main"
+NS_PKG_REL = "http://schemas.openxmlformats.org/package/2006/relationships"
+
+CT_WORKSHEET = "application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"
+CT_DRAWING = "application/vnd.openxmlformats-officedocument.drawing+xml"
+REL_WORKSHEET = NS_REL + "/worksheet"
+REL_DRAWING = NS_REL + "/drawing"
+REL_IMAGE = NS_REL + "/image"
+
+EMU_PER_PX = 9525  # 96 dpi
+
+# 新分頁的樣式：A1 60pt 粗體、第 1 列高 85pt、視圖縮放 30%（與 openpyxl 流程一致）
+TITLE_FONT_SIZE = 60
+TITLE_ROW_HEIGHT = 85
+ZOOM_SCALE = 30
+
+
+def _attr(v) -> str:
+    return escape(str(v), {'"': "&quot;"})
+
+
+# === 原始壓縮資料直接搬移 ===
+def _copy_entry_raw(src_fp, info: zipfile.ZipInfo, zout: zipfile.ZipFile):
+    """
+    把 info 對應的壓縮資料原樣寫進 zout（不解壓再壓縮）。
+    zipfile 沒有公開這個功能，只好用到 ZipFile 的內部欄位；任何意外都丟例外讓呼叫端改走一般複製。
+    """
+    if info.file_size > 0x7FFFFFFF or info.compress_size > 0x7FFFFFFF:
+        raise PatchUnsupported("zip64 entry")
+    src_fp.seek(info.header_offset)
+    fh = src_fp.read(30)
+    if len(fh) != 30 or fh[:4] != b"PK\x03\x04":
+        raise PatchUnsupported("bad local header")
+    name_len, extra_len = struct.unpack("<HH", fh[26:30])
+    src_fp.seek(info.header_offset + 30 + name_len + extra_len)
+
+    zi = copy.copy(info)
+    zi.flag_bits &= ~0x08       # 不寫 data descriptor：大小/CRC 直接寫在 local header
+    zi.extra = b""
+    zi.header_offset = zout.fp.tell()
+    zout.fp.write(zi.FileHeader(False))
+    remaining = info.compress_size
+    while remaining > 0:
+        chunk = src_fp.read(min(remaining, 1024 * 1024))
+        if not chunk:
+            raise PatchUnsupported("truncated entry")
+        zout.fp.write(chunk)
+        remaining -= len(chunk)
+    zout.filelist.append(zi)
+    zout.NameToInfo[zi.filename] = zi
+    zout.start_dir = zout.fp.tell()
+    zout._didModify = True
+
+
+# === XML 小工具（字串插入，不重新序列化，避免 namespace prefix 被改掉） ===
+def _insert_before(xml: str, close_tag: str, fragment: str) -> str:
+    i = xml.rfind(close_tag)
+    if i < 0:
+        raise PatchUnsupported(f"missing {close_tag}")
+    return xml[:i] + fragment + xml[i:]
+
+
+def _append_child_with_count(xml: str, parent: str, child: str, fragment: str) -> Tuple[str, int]:
+    """在 <parent> 內最後面加一個 child，更新 count 屬性；回傳 (新 xml, 新 child 的索引)。"""
+    m = re.search(r"<%s\b[^>]*>" % parent, xml)
+    if not m or m.group(0).endswith("/>"):
+        raise PatchUnsupported(f"missing <{parent}>")
+    block_start = m.end()
+    block_end = xml.find(f"</{parent}>", block_start)
+    if block_end < 0:
+        raise PatchUnsupported(f"missing </{parent}>")
+    n = len(re.findall(r"<%s[\s>/]" % child, xml[block_start:block_end]))
+    open_tag = m.group(0)
+    if re.search(r'\bcount="\d+"', open_tag):
+        new_open = re.sub(r'\bcount="\d+"', f'count="{n + 1}"', open_tag)
+    else:
+        new_open = open_tag[:-1] + f' count="{n + 1}">'
+    xml = xml[:m.start()] + new_open + xml[m.end():block_end] + fragment + xml[block_end:]
+    return xml, n
+
+
+def _rel_prefix(workbook_xml: str) -> str:
+    m = re.search(r'xmlns:(\w+)="%s"' % re.escape(NS_REL), workbook_xml)
+    if not m:
+        raise PatchUnsupported("relationships namespace not declared")
+    return m.group(1)
+
+
+def _check_default_ns(xml: str, root: str, ns: str):
+    if not re.search(r'<%s\b[^>]*\bxmlns="%s"' % (root, re.escape(ns)), xml):
+        raise PatchUnsupported(f"<{root}> does not use the default namespace")
+
+
+def _next_free(names, fmt: str, start: int = 1) -> int:
+    i = start
+    while fmt.format(i) in names:
+        i += 1
+    return i
+
+
+# === 新零件的 XML ===
+def _worksheet_xml(style_id: int, title_text: str) -> str:
+    return (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+        f'<worksheet xmlns="{NS_MAIN}" xmlns:r="{NS_REL}">'
+        f'<sheetViews><sheetView zoomScale="{ZOOM_SCALE}" zoomScaleNormal="{ZOOM_SCALE}" workbookViewId="0"/></sheetViews>'
+        '<sheetFormatPr defaultRowHeight="15"/>'
+        f'<sheetData><row r="1" ht="{TITLE_ROW_HEIGHT}" customHeight="1">'
+        f'<c r="A1" s="{style_id}" t="inlineStr"><is><t>{escape(title_text)}</t></is></c>'
+        '</row></sheetData>'
+        '<pageMargins left="0.75" right="0.75" top="1" bottom="1" header="0.5" footer="0.5"/>'
+        '<drawing r:id="rId1"/>'
+        '</worksheet>'
+    )
+
+
+def _drawing_xml(width_px: int, height_px: int) -> str:
+    # 放在 A2（col 0 / row 1），保持原始像素大小
+    cx, cy = int(width_px) * EMU_PER_PX, int(height_px) * EMU_PER_PX
+    return (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+        f'<xdr:wsDr xmlns:xdr="{NS_XDR}" xmlns:a="{NS_A}" xmlns:r="{NS_REL}">'
+        '<xdr:oneCellAnchor>'
+        '<xdr:from><xdr:col>0</xdr:col><xdr:colOff>0</xdr:colOff><xdr:row>1</xdr:row><xdr:rowOff>0</xdr:rowOff></xdr:from>'
+        f'<xdr:ext cx="{cx}" cy="{cy}"/>'
+        '<xdr:pic>'
+        '<xdr:nvPicPr><xdr:cNvPr id="1" name="Image 1"/><xdr:cNvPicPr><a:picLocks noChangeAspect="1"/></xdr:cNvPicPr></xdr:nvPicPr>'
+        '<xdr:blipFill><a:blip r:embed="rId1"/><a:stretch><a:fillRect/></a:stretch></xdr:blipFill>'
+        f'<xdr:spPr><a:xfrm><a:off x="0" y="0"/><a:ext cx="{cx}" cy="{cy}"/></a:xfrm><a:prstGeom prst="rect"><a:avLst/></a:prstGeom></xdr:spPr>'
+        '</xdr:pic>'
+        '<xdr:clientData/>'
+        '</xdr:oneCellAnchor>'
+        '</xdr:wsDr>'
+    )
+
+
+def _rels_xml(rel_type: str, target: str) -> str:
+    return (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+        f'<Relationships xmlns="{NS_PKG_REL}">'
+        f'<Relationship Id="rId1" Type="{rel_type}" Target="{_attr(target)}"/>'
+        '</Relationships>'
+    )
+
+
+def append_image_sheets(src_xlsx: str, out_xlsx: str, prefix: str,
+                        items: Sequence[Tuple[str, str, str, Tuple[int, int]]]) -> List[str]:
+    """
+    items：[(png_path, title_text, sheet_suffix, (w, h)), ...]
+    每個 item 新增一個分頁「{prefix}{sheet_suffix}」（重名就加 " 2"、" 3"…），
+    A1 放 title_text（60pt 粗體）、A2 貼圖（原尺寸）、視圖縮放 30%。回傳新分頁名稱。
+    """
+    with zipfile.ZipFile(src_xlsx, "r") as zin:
+        names = set(zin.namelist())
+        try:
+            ct_xml = zin.read("[Content_Types].xml").decode("utf-8")
+            wb_xml = zin.read("xl/workbook.xml").decode("utf-8")
+            wb_rels = zin.read("xl/_rels/workbook.xml.rels").decode("utf-8")
+            styles_xml = zin.read("xl/styles.xml").decode("utf-8")
+        except KeyError as e:
+            raise PatchUnsupported(f"missing part: {e}")
+
+        _check_default_ns(wb_xml, "workbook", NS_MAIN)
+        _check_default_ns(styles_xml, "styleSheet", NS_MAIN)
+        _check_default_ns(wb_rels, "Relationships", NS_PKG_REL)
+        r_prefix = _rel_prefix(wb_xml)
+
+        # --- 樣式：加一個 60pt 粗體字型 + 對應的 cellXfs ---
+        styles_xml, font_id = _append_child_with_count(
+            styles_xml, "fonts", "font", f'<font><b val="1"/><sz val="{TITLE_FONT_SIZE}"/></font>')
+        styles_xml, style_id = _append_child_with_count(
+            styles_xml, "cellXfs", "xf",
+            f'<xf numFmtId="0" fontId="{font_id}" fillId="0" borderId="0" applyFont="1"/>')
+
+        existing_titles = [unescape(t, {"&quot;": '"', "&apos;": "'"})
+                           for t in re.findall(r'<sheet\b[^>]*\bname="([^"]*)"', wb_xml)]
+        taken = {t.lower() for t in existing_titles}
+        sheet_ids = [int(x) for x in re.findall(r'<sheet\b[^>]*\bsheetId="(\d+)"', wb_xml)]
+        next_sheet_id = max(sheet_ids or [0]) + 1
+        rel_ids = set(re.findall(r'\bId="([^"]+)"', wb_rels))
+
+        new_parts = {}
+        created = []
+        for png_path, title_text, sheet_suffix, (w, h) in items:
+            base = f"{prefix}{sheet_suffix}"
+            title = base
+            i = 1
+            while title.lower() in taken:
+                i += 1
+                title = f"{base} {i}"
+            taken.add(title.lower())
+
+            sheet_n = _next_free(names, "xl/worksheets/sheet{}.xml")
+            drawing_n = _next_free(names, "xl/drawings/drawing{}.xml")
+            image_n = _next_free(names, "xl/media/image{}.png")
+            rid_n = _next_free(rel_ids, "rId{}")
+            sheet_part = f"xl/worksheets/sheet{sheet_n}.xml"
+            drawing_part = f"xl/drawings/drawing{drawing_n}.xml"
+            media_part = f"xl/media/image{image_n}.png"
+            rid = f"rId{rid_n}"
+            names.update({sheet_part, drawing_part, media_part})
+            rel_ids.add(rid)
+
+            new_parts[sheet_part] = _worksheet_xml(style_id, title_text).encode("utf-8")
+            new_parts[f"xl/worksheets/_rels/sheet{sheet_n}.xml.rels"] = _rels_xml(
+                REL_DRAWING, pp.relpath(drawing_part, "xl/worksheets")).encode("utf-8")
+            new_parts[drawing_part] = _drawing_xml(w, h).encode("utf-8")
+            new_parts[f"xl/drawings/_rels/drawing{drawing_n}.xml.rels"] = _rels_xml(
+                REL_IMAGE, pp.relpath(media_part, "xl/drawings")).encode("utf-8")
+            new_parts[media_part] = png_path  # 圖檔直接從磁碟寫入
+
+            wb_xml = _insert_before(
+                wb_xml, "</sheets>",
+                f'<sheet name="{_attr(title)}" sheetId="{next_sheet_id}" {r_prefix}:id="{rid}"/>')
+            next_sheet_id += 1
+            wb_rels = _insert_before(
+                wb_rels, "</Relationships>",
+                f'<Relationship Id="{rid}" Type="{REL_WORKSHEET}" Target="worksheets/sheet{sheet_n}.xml"/>')
+            ct_xml = _insert_before(
+                ct_xml, "</Types>",
+                f'<Override PartName="/{sheet_part}" ContentType="{CT_WORKSHEET}"/>'
+                f'<Override PartName="/{drawing_part}" ContentType="{CT_DRAWING}"/>')
+            created.append(title)
+
+        if not re.search(r'<Default\b[^>]*\bExtension="png"', ct_xml, re.IGNORECASE):
+            ct_xml = _insert_before(ct_xml, "</Types>", '<Default Extension="png" ContentType="image/png"/>')
+
+        patched = {
+            "[Content_Types].xml": ct_xml.encode("utf-8"),
+            "xl/workbook.xml": wb_xml.encode("utf-8"),
+            "xl/_rels/workbook.xml.rels": wb_rels.encode("utf-8"),
+            "xl/styles.xml": styles_xml.encode("utf-8"),
+        }
+
+        with open(src_xlsx, "rb") as src_fp, \
+                zipfile.ZipFile(out_xlsx, "w", zipfile.ZIP_DEFLATED) as zout:
+            for info in zin.infolist():
+                if info.filename in patched:
+                    zi = zipfile.ZipInfo(info.filename, date_time=info.date_time)
+                    zi.compress_type = zipfile.ZIP_DEFLATED
+                    zout.writestr(zi, patched[info.filename])
+                    continue
+                try:
+                    _copy_entry_raw(src_fp, info, zout)
+                except PatchUnsupported:
+                    zout.writestr(info, zin.read(info.filename))
+            for part, data in new_parts.items():
+                if isinstance(data, str):
+                    # 圖已經是 PNG（壓縮過），不再 deflate
+                    zout.write(data, part, compress_type=zipfile.ZIP_STORED)
+                else:
+                    zout.writestr(part, data)
+    return created